@@ -0,0 +1,165 @@
+'''
+Benchmarks of the environment for a matrix of scenarios and problem sizes, results are written as JSON
+for regression tracking (progress is printed to stderr). All scenarios use dummy actions, so the simulation
+with the automatic agent is measured, and entity observations (run from the repository root):
+
+    python benchmarks/env_benchmarks.py --output results.json
+    python benchmarks/env_benchmarks.py --scenarios tsp truck_drone --sizes 10 100
+'''
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import contextlib
+import subprocess
+import tracemalloc
+import numpy as np
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main.build_env import BuildEnvironment
+
+
+# Scenarios:
+# ----------------------------------------------------------------------------------------------------------------
+
+def tsp(env):
+    env.trucks(1)
+
+def vrp(env):
+    env.trucks(3, max_cargo=10)
+
+def truck_drone(env):
+    env.trucks(1)
+    env.drones(1, max_cargo=2)
+
+def truck_robots(env):
+    env.trucks(1)
+    env.robots(2)
+
+SCENARIOS = {
+    'tsp': tsp,
+    'vrp': vrp,
+    'truck_drone': truck_drone,
+    # Drones with range_type='battery' are left out, the simulator doesn't finish their episodes yet.
+    'truck_robots': truck_robots,
+}
+
+SIZES = [10, 100, 1000, 5000]
+
+
+def build_scenario(scenario, num_customers, max_steps_per_episode):
+    # Grid grows with the number of customers, so the density stays comparable:
+    side = max(10, int(np.ceil(np.sqrt(num_customers))))
+
+    env = BuildEnvironment(scenario, grid=[side, side], max_steps_per_episode=max_steps_per_episode)
+    SCENARIOS[scenario](env)
+    env.depots(1)
+    env.customers(num_customers)
+    env.observations(image_input=None, entity_inputs=True)
+    env.dummy_actions()
+    env.rewards()
+    env.visuals(headless=True)
+    env.compile()
+    return env, env.build()
+
+
+# Measurements:
+# ----------------------------------------------------------------------------------------------------------------
+
+def timed_loop(function, max_calls, max_seconds):
+    '''
+    Calls ``function`` until ``max_calls`` or ``max_seconds`` is reached, returns the calls per second.
+    '''
+    num_calls = 0
+    start = time.perf_counter()
+    while num_calls < max_calls and time.perf_counter() - start < max_seconds:
+        function()
+        num_calls += 1
+    return num_calls / (time.perf_counter() - start)
+
+
+def run_scenario(scenario, num_customers, args):
+    result = {'scenario': scenario, 'num_customers': num_customers}
+
+    # Memory of one env (build and first reset):
+    tracemalloc.start()
+    start = time.perf_counter()
+    env_builder, env = build_scenario(scenario, num_customers, args.max_steps)
+    result['build_seconds'] = time.perf_counter() - start
+    result['memory_mb'] = tracemalloc.get_traced_memory()[0] / 2**20
+    result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    result['resets_per_second'] = timed_loop(env.reset, args.resets, args.max_seconds)
+
+    env.reset()
+    steps = {'done': False}
+    def step():
+        if steps['done']:
+            env.reset()
+        _, _, steps['done'], _ = env.step([])
+    result['steps_per_second'] = timed_loop(step, args.steps, args.max_seconds)
+
+    # Full encoding (all rows changed) and the encoding of an unchanged state:
+    def encode_all():
+        [elem.fill(True) for elem in env.simulation.temp_db.dirty.values()]
+        env.obs_encoder.observe_state()
+    result['obs_encoding_ms'] = 1e3 / timed_loop(encode_all, args.steps, args.max_seconds)
+    result['obs_unchanged_ms'] = 1e3 / timed_loop(env.obs_encoder.observe_state, args.steps, args.max_seconds)
+
+    return result
+
+
+def environment_info():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        commit = None
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the environment for a matrix of scenarios.')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS.keys()), choices=list(SCENARIOS.keys()))
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='Numbers of customers')
+    parser.add_argument('--resets', type=int, default=50, help='Maximum number of measured resets')
+    parser.add_argument('--steps', type=int, default=1000, help='Maximum number of measured steps')
+    parser.add_argument('--max-seconds', type=float, default=10, help='Time limit per measurement')
+    parser.add_argument('--max-steps', type=int, default=1000, help='Maximum steps per episode')
+    parser.add_argument('--output', default=None, help='JSON file for the results (printed if not set)')
+    args = parser.parse_args()
+
+    results = []
+    for scenario in args.scenarios:
+        for num_customers in args.sizes:
+            try:
+                # Messages of the env go to stderr, so a printed report stays valid JSON:
+                with contextlib.redirect_stdout(sys.stderr):
+                    result = run_scenario(scenario, num_customers, args)
+            except Exception as error:
+                # Scenarios that fail are reported instead of stopping the whole matrix:
+                result = {'scenario': scenario, 'num_customers': num_customers, 'error': repr(error)}
+            results.append(result)
+            print(json.dumps(result), file=sys.stderr)
+
+    report = json.dumps({'environment': environment_info(), 'results': results}, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(report)
+
+
+if __name__ == '__main__':
+    main()
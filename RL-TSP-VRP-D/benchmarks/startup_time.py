@@ -0,0 +1,99 @@
+'''
+Measures the time of ``from main.build_env import BuildEnvironment`` (and of building a small env) in fresh
+interpreters. Heavy modules, that should only be imported when needed (pygame, tensorflow), are reported if they
+were loaded. The import time is compared to a baseline measured on the same machine (a result file of this script)
+or to an absolute budget, exits with 1 if it's exceeded (run from the repository root):
+
+    python benchmarks/startup_time.py --output baseline.json
+    python benchmarks/startup_time.py --baseline baseline.json --tolerance 1.2
+'''
+import os
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['pygame', 'tensorflow', 'pyarrow']
+
+CHILD_CODE = '''
+import sys, json, time
+start = time.perf_counter()
+from main.build_env import BuildEnvironment
+import_seconds = time.perf_counter() - start
+
+start = time.perf_counter()
+env = BuildEnvironment('startup')
+env.trucks(1)
+env.drones(1, max_cargo=2)
+env.depots(1)
+env.customers(10)
+env.dummy_observations()
+env.dummy_actions()
+env.compile()
+env.build()
+build_seconds = time.perf_counter() - start
+
+print(json.dumps({
+    'import_seconds': import_seconds,
+    'build_seconds': build_seconds,
+    'heavy_modules': [name for name in %r if name in sys.modules],
+}))
+''' % HEAVY_MODULES
+
+
+def measure_once():
+    output = subprocess.check_output([sys.executable, '-c', CHILD_CODE], cwd=REPO_DIR, stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the startup time of the environment against a budget.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of fresh interpreters')
+    parser.add_argument('--baseline', default=None, help='Result file of an earlier run on the same machine')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='Allowed factor of the baseline median import time')
+    parser.add_argument('--budget-ms', type=float, default=None, help='Absolute budget for the median import time (off by default)')
+    parser.add_argument('--output', default=None, help='JSON file for the results (printed if not set)')
+    args = parser.parse_args()
+
+    runs = [measure_once() for i in range(args.runs)]
+
+    import_ms = 1e3 * np.array([run['import_seconds'] for run in runs])
+    build_ms = 1e3 * np.array([run['build_seconds'] for run in runs])
+    heavy_modules = sorted(set(name for run in runs for name in run['heavy_modules']))
+
+    # Budget of the median import time, the smaller one if both are given (None checks only the heavy modules):
+    budgets = []
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            budgets.append(json.load(f)['import_ms_median'] * args.tolerance)
+    if args.budget_ms is not None:
+        budgets.append(args.budget_ms)
+    budget_ms = min(budgets) if len(budgets) > 0 else None
+
+    result = {
+        'runs': args.runs,
+        'budget_ms': budget_ms,
+        'import_ms_median': float(np.median(import_ms)),
+        'import_ms_min': float(np.min(import_ms)),
+        'build_ms_median': float(np.median(build_ms)),
+        'heavy_modules': heavy_modules,
+        'within_budget': bool((budget_ms is None or np.median(import_ms) <= budget_ms) and len(heavy_modules) == 0),
+    }
+
+    report = json.dumps(result, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(report)
+
+    if not result['within_budget']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
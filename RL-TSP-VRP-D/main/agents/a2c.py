@@ -6,6 +6,8 @@ from keras.layers import Input, Dense, Flatten, Concatenate
 
 from collections import deque
 
+from main.agents.returns import discounted_returns
+
 
 def a2c_parameter(
         max_steps_episode = 1000,
@@ -71,14 +73,10 @@ class MultiA2C:
         # - At each timestep what was the total reward received after that timestep
         # - Rewards in the past are discounted by multiplying them with gamma
         # - These are the labels for our critic
-        returns = []
-        discounted_sum = 0
-        for r in rewards_hist[::-1]:
-            discounted_sum = r + gamma * discounted_sum
-            returns.insert(0, discounted_sum)
+        # Computed backwards over all steps at once instead of inserting at the front of a list:
+        returns = discounted_returns(rewards_hist, gamma=self.gamma)
 
         # Normalize
-        returns = np.array(returns)
         returns = (returns - np.mean(returns)) / (np.std(returns) + self.smallest_val)
         return returns.tolist()
 
@@ -225,14 +223,10 @@ class BaseA2C:
         # - At each timestep what was the total reward received after that timestep
         # - Rewards in the past are discounted by multiplying them with gamma
         # - These are the labels for our critic
-        returns = []
-        discounted_sum = 0
-        for r in rewards_hist[::-1]:
-            discounted_sum = r + gamma * discounted_sum
-            returns.insert(0, discounted_sum)
+        # Computed backwards over all steps at once instead of inserting at the front of a list:
+        returns = discounted_returns(rewards_hist, gamma=self.gamma)
 
         # Normalize
-        returns = np.array(returns)
         returns = (returns - np.mean(returns)) / (np.std(returns) + self.smallest_val)
         return returns.tolist()
 
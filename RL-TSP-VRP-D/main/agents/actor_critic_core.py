@@ -1,12 +1,18 @@
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras import layers
 
+from typing import List, Tuple
+
+from main.agents.returns import discounted_returns, gae, standardize
+
+
 class ActorCritic(tf.keras.Model):
     """Combined actor-critic network."""
 
     def __init__(
-            self, 
-            num_actions: int, 
+            self,
+            num_actions: int,
             num_hidden_units: int):
         """Initialize."""
         super().__init__()
@@ -19,152 +25,203 @@ class ActorCritic(tf.keras.Model):
         x = self.common(inputs)
         return self.actor(x), self.critic(x)
 
-num_actions = env.action_space.n  # 2
-num_hidden_units = 128
 
-model = ActorCritic(num_actions, num_hidden_units)
+def flatten_observation(observation) -> np.ndarray:
+    """Flattens the (possibly listed) observation of ``BaseObsEncoder`` to one float32 vector."""
+    if isinstance(observation, (list, tuple)):
+        return np.concatenate([np.ravel(elem) for elem in observation]).astype(np.float32)
+    return np.ravel(observation).astype(np.float32)
 
-# Wrap OpenAI Gym's `env.step` call as an operation in a TensorFlow function.
-# This would allow it to be included in a callable TensorFlow graph.
 
-def env_step(action: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-    """Returns state, reward and done flag given an action."""
+huber_loss = tf.keras.losses.Huber(reduction=tf.keras.losses.Reduction.SUM)
 
-    state, reward, done, _ = env.step(action)
-    return (state.astype(np.float32), 
-          np.array(reward, np.int32), 
-          np.array(done, np.int32))
 
+def compute_loss(
+        action_log_probs: tf.Tensor,
+        values: tf.Tensor,
+        returns: tf.Tensor,
+        entropy: tf.Tensor,
+        value_coef: float = 0.5,
+        entropy_coef: float = 0.01) -> tf.Tensor:
+    """Computes the combined actor-critic loss."""
 
-def tf_env_step(action: tf.Tensor) -> List[tf.Tensor]:
-    return tf.numpy_function(env_step, [action], 
-                           [tf.float32, tf.int32, tf.int32])
+    advantage = tf.stop_gradient(returns - values)
 
-def run_episode(
-        initial_state: tf.Tensor,  
-        model: tf.keras.Model, 
-        max_steps: int) -> Tuple[tf.Tensor, tf.Tensor, tf.Tensor]:
-    """Runs a single episode to collect training data."""
+    actor_loss = -tf.math.reduce_sum(action_log_probs * advantage)
 
-    action_probs = tf.TensorArray(dtype=tf.float32, size=0, dynamic_size=True)
-    values = tf.TensorArray(dtype=tf.float32, size=0, dynamic_size=True)
-    rewards = tf.TensorArray(dtype=tf.int32, size=0, dynamic_size=True)
+    critic_loss = huber_loss(values, returns)
 
-    initial_state_shape = initial_state.shape
-    state = initial_state
+    return actor_loss + value_coef * critic_loss - entropy_coef * tf.math.reduce_sum(entropy)
 
-    for t in tf.range(max_steps):
-        # Convert state into a batched tensor (batch size = 1)
-        state = tf.expand_dims(state, 0)
 
-        # Run the model and to get action probabilities and critic value
-        action_logits_t, value = model(state)
+class A2CTrainer:
+    """
+    Synchronous advantage actor-critic over a list of ``CustomEnv`` (vectorized envs).
 
-        # Sample next action from the action probability distribution
-        action = tf.random.categorical(action_logits_t, 1)[0, 0]
-        action_probs_t = tf.nn.softmax(action_logits_t)
+    The python work per step is reduced to stepping the envs: the actions of all envs are sampled
+    with one batched forward pass, the returns are computed vectorized over the whole ``[T, N_envs]`` rollout
+    (see ``main.agents.returns``) and the loss/gradient step is compiled with ``tf.function``
+    and run once per rollout of ``n_steps`` steps for all envs together.
 
-        # Store critic values
-        values = values.write(t, tf.squeeze(value))
+    Args:
+        envs (list): Environments built by ``BuildEnvironment``, all with the same observation shape
+        model (tf.keras.Model): Returns action logits and state values, for example ``ActorCritic``
+        optimizer (tf.keras.optimizers.Optimizer): Uses Adam with ``lr`` when None
+        gamma (float): Discount factor
+        gae_lambda (float): Uses generalized advantage estimation for the value targets, when not None
+        n_steps (int): Steps per env in each rollout
+        value_coef (float): Weight of the critic loss
+        entropy_coef (float): Weight of the entropy bonus
+        standardize_returns (bool): Standardizes the returns of each rollout
+        action_fn (callable): Maps a sampled action index to the action passed to ``env.step``
+        lr (float): Learning rate, when no optimizer is passed
+    """
 
-        # Store log probability of the action chosen
-        action_probs = action_probs.write(t, action_probs_t[0, action])
+    def __init__(
+            self,
+            envs,
+            model: tf.keras.Model,
+            optimizer: tf.keras.optimizers.Optimizer = None,
+            gamma: float = 0.99,
+            gae_lambda: float = None,
+            n_steps: int = 32,
+            value_coef: float = 0.5,
+            entropy_coef: float = 0.01,
+            standardize_returns: bool = True,
+            action_fn=None,
+            lr: float = 0.01,
+            ):
+
+        self.envs = envs
+        self.num_envs = len(envs)
+        self.model = model
+
+        if optimizer is None:
+            optimizer = tf.keras.optimizers.Adam(learning_rate=lr)
+        self.optimizer = optimizer
+
+        self.gamma = gamma
+        self.gae_lambda = gae_lambda
+        self.n_steps = n_steps
+        self.value_coef = value_coef
+        self.entropy_coef = entropy_coef
+        self.standardize_returns = standardize_returns
 
-        # Apply action to the environment to get next state and reward
-        state, reward, done = tf_env_step(action)
-        state.set_shape(initial_state_shape)
+        if action_fn is None:
+            action_fn = lambda action: action
+        self.action_fn = action_fn
 
-        # Store reward
-        rewards = rewards.write(t, reward)
+        self.states = np.stack([flatten_observation(env.reset()) for env in self.envs])
 
-        if tf.cast(done, tf.bool):
-            break
+        # Preallocated rollout arrays, [T, N_envs, ...]:
+        self.rollout_states  = np.zeros((self.n_steps,) + self.states.shape, dtype=np.float32)
+        self.rollout_actions = np.zeros((self.n_steps, self.num_envs), dtype=np.int64)
+        self.rollout_rewards = np.zeros((self.n_steps, self.num_envs), dtype=np.float32)
+        self.rollout_dones   = np.zeros((self.n_steps, self.num_envs), dtype=np.float32)
+        self.rollout_values  = np.zeros((self.n_steps, self.num_envs), dtype=np.float32)
 
-    action_probs = action_probs.stack()
-    values = values.stack()
-    rewards = rewards.stack()
+        self.episode_rewards = np.zeros((self.num_envs), dtype=np.float32)
+        self.finished_episode_rewards = []
 
-    return action_probs, values, rewards
+    @tf.function
+    def sample_actions(self, states: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+        """Samples one action per env with a single batched forward pass, also returns the state values."""
+        action_logits, values = self.model(states)
+        return tf.random.categorical(action_logits, 1)[:, 0], values[:, 0]
 
-def get_expected_return(
-        rewards: tf.Tensor, 
-        gamma: float, 
-        standardize: bool = True) -> tf.Tensor:
-    """Compute expected returns per timestep."""
+    @tf.function
+    def state_values(self, states: tf.Tensor) -> tf.Tensor:
+        _, values = self.model(states)
+        return values[:, 0]
 
-    n = tf.shape(rewards)[0]
-    returns = tf.TensorArray(dtype=tf.float32, size=n)
+    def collect_rollout(self):
+        """Steps all envs ``n_steps`` times, resets finished envs automatically."""
 
-    # Start from the end of `rewards` and accumulate reward sums
-    # into the `returns` array
-    rewards = tf.cast(rewards[::-1], dtype=tf.float32)
-    discounted_sum = tf.constant(0.0)
-    discounted_sum_shape = discounted_sum.shape
-    for i in tf.range(n):
-    reward = rewards[i]
-    discounted_sum = reward + gamma * discounted_sum
-    discounted_sum.set_shape(discounted_sum_shape)
-    returns = returns.write(i, discounted_sum)
-    returns = returns.stack()[::-1]
+        for t in range(self.n_steps):
 
-    if standardize:
-    returns = ((returns - tf.math.reduce_mean(returns)) / 
-               (tf.math.reduce_std(returns) + eps))
+            actions, values = self.sample_actions(self.states)
+            actions = actions.numpy()
 
-    return returns
+            self.rollout_states[t] = self.states
+            self.rollout_actions[t] = actions
+            self.rollout_values[t] = values.numpy()
 
+            for i, env in enumerate(self.envs):
+                state, reward, done, _ = env.step(self.action_fn(actions[i]))
 
+                self.episode_rewards[i] += reward
+                if done:
+                    self.finished_episode_rewards.append(self.episode_rewards[i])
+                    self.episode_rewards[i] = 0
+                    state = env.reset()
 
-huber_loss = tf.keras.losses.Huber(reduction=tf.keras.losses.Reduction.SUM)
+                self.states[i] = flatten_observation(state)
+                self.rollout_rewards[t, i] = reward
+                self.rollout_dones[t, i] = done
 
-def compute_loss(
-        action_probs: tf.Tensor,  
-        values: tf.Tensor,  
-        returns: tf.Tensor) -> tf.Tensor:
-    """Computes the combined actor-critic loss."""
+        return self.rollout_states, self.rollout_actions, self.rollout_rewards, self.rollout_dones
 
-    advantage = returns - values
+    def calc_returns(self, rewards, dones) -> np.ndarray:
+        """Value targets for the collected rollout, bootstrapped with the value of the current states."""
 
-    action_log_probs = tf.math.log(action_probs)
-    actor_loss = -tf.math.reduce_sum(action_log_probs * advantage)
+        bootstrap_value = self.state_values(self.states).numpy()
 
-    critic_loss = huber_loss(values, returns)
+        if self.gae_lambda is not None:
+            _, returns = gae(rewards, self.rollout_values, dones, self.gamma, self.gae_lambda, bootstrap_value)
+        else:
+            returns = discounted_returns(rewards, dones, self.gamma, bootstrap_value)
+
+        if self.standardize_returns:
+            returns = standardize(returns)
+
+        return returns.astype(np.float32)
+
+    @tf.function
+    def train_step(
+            self,
+            states: tf.Tensor,
+            actions: tf.Tensor,
+            returns: tf.Tensor) -> tf.Tensor:
+        """Applies one gradient step for a whole rollout."""
+
+        returns = tf.reshape(returns, [-1])
+
+        # Merge time and env dimension, so the model is called once for the whole rollout:
+        flat_states = tf.reshape(states, tf.concat([[-1], tf.shape(states)[2:]], axis=0))
+        flat_actions = tf.reshape(actions, [-1])
 
-    return actor_loss + critic_loss
+        with tf.GradientTape() as tape:
 
+            action_logits, values = self.model(flat_states)
+            values = values[:, 0]
 
-optimizer = tf.keras.optimizers.Adam(learning_rate=0.01)
+            log_probs = tf.nn.log_softmax(action_logits)
+            action_log_probs = tf.gather(log_probs, flat_actions, axis=1, batch_dims=1)
+            entropy = -tf.math.reduce_sum(tf.exp(log_probs) * log_probs, axis=1)
 
-@tf.function
-def train_step(
-        initial_state: tf.Tensor, 
-        model: tf.keras.Model, 
-        optimizer: tf.keras.optimizers.Optimizer, 
-        gamma: float, 
-        max_steps_per_episode: int) -> tf.Tensor:
-    
-    """Runs a model training step."""
+            loss = compute_loss(action_log_probs, values, returns, entropy, self.value_coef, self.entropy_coef)
 
-    with tf.GradientTape() as tape:
+        grads = tape.gradient(loss, self.model.trainable_variables)
+        self.optimizer.apply_gradients(zip(grads, self.model.trainable_variables))
 
-        # Run the model for one episode to collect training data
-        action_probs, values, rewards = run_episode(initial_state, model, max_steps_per_episode) 
+        return loss
 
-        # Calculate expected returns
-        returns = get_expected_return(rewards, gamma)
+    def train(self, num_updates: int, log_every: int = 10) -> List[float]:
+        """Runs ``num_updates`` rollouts and gradient steps, returns the rewards of all finished episodes."""
 
-        # Convert training data to appropriate TF tensor shapes
-        action_probs, values, returns = [tf.expand_dims(x, 1) for x in [action_probs, values, returns]] 
+        running_reward = 0
 
-        # Calculating loss values to update our network
-        loss = compute_loss(action_probs, values, returns)
+        for update in range(num_updates):
 
-    # Compute the gradients from the loss
-    grads = tape.gradient(loss, model.trainable_variables)
+            states, actions, rewards, dones = self.collect_rollout()
+            returns = self.calc_returns(rewards, dones)
+            loss = self.train_step(states, actions, returns)
 
-    # Apply the gradients to the model's parameters
-    optimizer.apply_gradients(zip(grads, model.trainable_variables))
+            if len(self.finished_episode_rewards) > 0:
+                running_reward = 0.05 * self.finished_episode_rewards[-1] + 0.95 * running_reward
 
-    episode_reward = tf.math.reduce_sum(rewards)
+            if log_every and update % log_every == 0:
+                template = "loss: {:.3f}, running reward: {:.2f} at update {}"
+                print(template.format(float(loss), running_reward, update))
 
-    return episode_reward
+        return self.finished_episode_rewards
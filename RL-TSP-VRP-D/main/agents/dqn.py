@@ -12,13 +12,27 @@ from collections import deque
 
 
 from env import CustomEnv
+from main.agents.replay_buffer import BaseReplayBuffer, PrioritizedReplayBuffer, MemmapReplayStorage
 
 
 
 class DQN:
-    def __init__(self, env=CustomEnv()):
+    def __init__(self, env=CustomEnv(), prioritized=False, memory_len=2000, alpha=0.6, beta=0.4, beta_increment=0.001,
+                 memmap_dir=None):
         self.env     = env
-        self.memory  = deque(maxlen=2000)
+
+        # Very large buffers can be kept on disk (images are stored as uint8):
+        if memmap_dir is not None:
+            storage = MemmapReplayStorage(memory_len, memmap_dir)
+        else:
+            storage = None
+
+        # Prioritized replay samples informative transitions more often (rare rewards in VRP-D episodes),
+        # uniform sampling is used by default:
+        if prioritized:
+            self.memory = PrioritizedReplayBuffer(memory_len, alpha, beta, beta_increment, storage=storage)
+        else:
+            self.memory = BaseReplayBuffer(memory_len, storage=storage)
         
         self.gamma = 0.85
         self.epsilon = 1.0
@@ -49,24 +63,35 @@ class DQN:
         return np.argmax(self.model.predict(state)[0])
 
     def remember(self, state, action, reward, new_state, done):
-        self.memory.append([state, action, reward, new_state, done])
+        self.memory.add([state, action, reward, new_state, done])
 
     def replay(self):
         batch_size = 32
         if len(self.memory) < batch_size: 
             return
 
-        samples = random.sample(self.memory, batch_size)
-        for sample in samples:
-            state, action, reward, new_state, done = sample
-            target = self.model.predict(state)
-            if done:
-                target[0][action] = reward
-            else:
-                Q_future = max(self.target_model.predict(new_state)[0])
-                # sum(actor.action_prob*self.target_model.predict(new_state)[0])
-                target[0][action] = reward + Q_future * self.gamma # + GLOBAL REWARD falls für diese stelle relevant
-            self.model.fit(state, target, epochs=1, verbose=0)
+        samples, indices, weights = self.memory.sample(batch_size)
+        states, actions, rewards, new_states, dones = zip(*samples)
+
+        states     = np.vstack(states)
+        new_states = np.vstack(new_states)
+        actions    = np.array(actions, dtype=int)
+        rewards    = np.array(rewards, dtype=float)
+        dones      = np.array(dones, dtype=bool)
+
+        # One batched prediction per network instead of two predictions per sample:
+        targets  = self.model.predict(states)
+        Q_future = np.max(self.target_model.predict(new_states), axis=1)
+        # sum(actor.action_prob*self.target_model.predict(new_state)[0])
+        Q_target = np.where(dones, rewards, rewards + Q_future * self.gamma) # + GLOBAL REWARD falls für diese stelle relevant
+
+        batch_range = np.arange(batch_size)
+        td_errors = Q_target - targets[batch_range, actions]
+        targets[batch_range, actions] = Q_target
+
+        # Importance-sampling weights correct the bias of prioritized sampling:
+        self.model.fit(states, targets, sample_weight=weights, batch_size=batch_size, epochs=1, verbose=0)
+        self.memory.update_priorities(indices, td_errors)
 
     def target_train(self):
         weights = self.model.get_weights()
@@ -0,0 +1,188 @@
+'''
+Batches the policy calls of many rollout workers into single forward passes.
+'''
+import time
+import queue
+import threading
+import traceback
+import numpy as np
+
+
+def stack_observations(observations):
+    '''
+    Stacks observations of the workers to a batch.
+    Listed observations (multiple inputs) are stacked per input, so the result fits a multi-input keras model.
+    '''
+    if isinstance(observations[0], (list, tuple)):
+        return [np.stack(elems) for elems in zip(*observations)]
+    return np.stack(observations)
+
+
+def to_numpy(outputs):
+    if isinstance(outputs, (list, tuple)):
+        return [to_numpy(elem) for elem in outputs]
+    if hasattr(outputs, 'numpy'):
+        return outputs.numpy()
+    return np.asarray(outputs)
+
+
+def select_row(outputs, i):
+    if isinstance(outputs, list):
+        return [elem[i] for elem in outputs]
+    return outputs[i]
+
+
+class InferenceClient:
+    '''
+    Handle of one rollout worker. Can be passed to a worker process, if the server uses multiprocessing queues.
+
+    Args:
+        worker_id (int): Index of the worker at the server
+        request_queue (queue): Shared queue for observation requests of all workers
+        response_queue (queue): Queue of this worker for the model outputs
+        timeout (float): Maximum time in seconds to wait for the outputs, waits forever if None
+    '''
+    def __init__(self, worker_id, request_queue, response_queue, timeout=60.0):
+        self.worker_id = worker_id
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.timeout = timeout
+
+        # Id of the last request, responses of older (timed out) requests are skipped:
+        self.request_id = 0
+
+    def predict(self, observation):
+        '''
+        Sends one (unbatched) observation and blocks until the outputs of the model for it are returned.
+        Raises an Exception, if the forward pass failed at the server or no outputs arrived within the timeout.
+        '''
+        self.request_id += 1
+        self.request_queue.put((self.worker_id, self.request_id, observation))
+
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.perf_counter(), 0)
+            try:
+                request_id, error, outputs = self.response_queue.get(timeout=remaining)
+            except queue.Empty:
+                raise Exception('No outputs of the inference server within {} seconds.'.format(self.timeout))
+
+            if request_id != self.request_id:
+                continue
+            if error is not None:
+                raise Exception('The forward pass of the inference server failed:\n{}'.format(error))
+            return outputs
+
+
+class BatchedInferenceServer:
+    '''
+    Collects observation requests of rollout workers, runs one batched forward pass and returns the output rows
+    to the requesting workers. A batch is run when ``max_batch_size`` requests are collected or ``max_latency``
+    seconds passed since the first request of the batch.
+
+    Works with threads (default ``queue.Queue``) and with worker processes, when a ``multiprocessing`` queue is
+    passed as ``request_queue`` and to each ``register_worker()``.
+
+    Args:
+        model (callable): Keras model (or any callable) built for example by ``BaseAgentBuilder.build``
+            or ``DiamondNetwork.create_model``, takes a batch and returns an array or a list of arrays
+        max_batch_size (int): Maximum number of requests per forward pass
+        max_latency (float): Maximum time in seconds a request waits for the batch to fill
+        request_queue (queue): Queue for the requests, creates a ``queue.Queue`` when None
+    '''
+    def __init__(self, model, max_batch_size=64, max_latency=0.002, request_queue=None):
+
+        self.model = model
+        # Keras models are called in inference mode:
+        self.call_kwargs = {'training': False} if hasattr(model, 'layers') else {}
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+
+        if request_queue is None:
+            request_queue = queue.Queue()
+        self.request_queue = request_queue
+        self.response_queues = []
+
+        self.thread = None
+        self.running = False
+
+        # Statistics:
+        self.num_batches = 0
+        self.num_requests = 0
+        self.num_errors = 0
+
+    def register_worker(self, response_queue=None, timeout=60.0):
+        '''
+        Creates a client for a new worker (see ``InferenceClient`` for the timeout).
+        Register all workers before calling ``start()``.
+        '''
+        if response_queue is None:
+            response_queue = queue.Queue()
+        self.response_queues.append(response_queue)
+        return InferenceClient(len(self.response_queues) - 1, self.request_queue, response_queue, timeout)
+
+    def call_model(self, batch):
+        return to_numpy(self.model(batch, **self.call_kwargs))
+
+    def collect_batch(self):
+        '''
+        Waits for the first request and collects more until the batch is full or the deadline passed.
+        '''
+        try:
+            requests = [self.request_queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.perf_counter() + self.max_latency
+        while len(requests) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                requests.append(self.request_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return requests
+
+    def process_batch(self, requests):
+        worker_ids, request_ids, observations = zip(*requests)
+
+        # A failed forward pass is passed to the waiting workers (as traceback string, which can be pickled),
+        # so they raise it instead of blocking and the server keeps running:
+        try:
+            outputs = self.call_model(stack_observations(observations))
+        except Exception:
+            error = traceback.format_exc()
+            for worker_id, request_id in zip(worker_ids, request_ids):
+                self.response_queues[worker_id].put((request_id, error, None))
+            self.num_errors += 1
+            return
+
+        for i, (worker_id, request_id) in enumerate(zip(worker_ids, request_ids)):
+            self.response_queues[worker_id].put((request_id, None, select_row(outputs, i)))
+
+        self.num_batches += 1
+        self.num_requests += len(requests)
+
+    def serve(self):
+        while self.running:
+            requests = self.collect_batch()
+            if len(requests) > 0:
+                self.process_batch(requests)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def mean_batch_size(self):
+        if self.num_batches == 0:
+            return 0
+        return self.num_requests / self.num_batches
@@ -0,0 +1,319 @@
+'''
+Replay buffers of the DQN agent (uniform and sum-tree prioritized), stored in memory or memory-mapped on disk.
+'''
+import os
+import numpy as np
+
+
+# Sum Tree:
+# ----------------------------------------------------------------------------------------------------------------
+
+class SumTree:
+    '''
+    Binary sum tree stored in a flat array. The leaves hold the priorities of the stored transitions,
+    every inner node holds the sum of its two children, so the root is the total priority.
+    Updating a priority and sampling a leaf by a cumulative value are both O(log n).
+
+    Args:
+        capacity (int): Maximum number of leaves (transitions)
+    '''
+    def __init__(self, capacity):
+
+        self.capacity = int(capacity)
+
+        # Round up to a power of two, so the tree is complete and the leaf offset is fixed:
+        self.tree_capacity = 1
+        while self.tree_capacity < self.capacity:
+            self.tree_capacity *= 2
+
+        self.tree = np.zeros((2 * self.tree_capacity), dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def max_leaf(self):
+        return np.max(self.tree[self.tree_capacity:self.tree_capacity + self.capacity])
+
+    def update(self, indices, priorities):
+        '''
+        Sets the priorities of the given leaf indices and propagates the change to the root.
+        Accepts single values or arrays, the propagation is done for all indices at once per tree level.
+        '''
+        nodes = np.atleast_1d(np.asarray(indices, dtype=np.int64)) + self.tree_capacity
+        self.tree[nodes] = np.atleast_1d(priorities)
+
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        '''
+        Returns the leaf indices, where the cumulative priority reaches the given values.
+        All values are pushed down the tree at once, so one call costs O(batch * log n).
+        '''
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(values.shape, dtype=np.int64)
+
+        while nodes[0] < self.tree_capacity:
+            left = 2 * nodes
+            go_right = values > self.tree[left]
+            values = np.where(go_right, values - self.tree[left], values)
+            nodes = np.where(go_right, left + 1, left)
+
+        return np.minimum(nodes - self.tree_capacity, self.capacity - 1)
+
+
+# Replay Storages:
+# ----------------------------------------------------------------------------------------------------------------
+
+class ListStorage:
+    '''
+    Keeps the transitions as python objects in RAM.
+    '''
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.data = [None for i in range(self.capacity)]
+
+    def add(self, index, transition):
+        self.data[index] = transition
+
+    def get(self, indices):
+        return [self.data[i] for i in indices]
+
+    def flush(self):
+        pass
+
+
+def to_array_list(state):
+    if isinstance(state, (list, tuple)):
+        return [np.asarray(elem) for elem in state]
+    return [np.asarray(state)]
+
+
+class MemmapReplayStorage:
+    '''
+    Stores transitions in ``np.memmap`` files, so the replay buffer can be much larger than the RAM.
+    Every input of a state (and new state) gets its own file with a fixed row size, the files are created when the first
+    transition is added. Image inputs (arrays with three or more dimensions, values between 0 and 1 like the grid
+    images of ``BaseObsEncoder``) are stored as uint8. New transitions are collected in a chunk in RAM and written
+    sequentially to the files, when the chunk is full.
+
+    Args:
+        capacity (int): Maximum number of stored transitions
+        directory (string): Directory for the memmap files, should be on a local SSD
+        chunk_size (int): Number of transitions written to the files at once
+        image_min_dims (int): Inputs with at least this number of dimensions are compressed to uint8
+    '''
+    def __init__(self, capacity, directory, chunk_size=4096, image_min_dims=3):
+
+        self.capacity = int(capacity)
+        self.directory = directory
+        self.chunk_size = min(int(chunk_size), self.capacity)
+        self.image_min_dims = image_min_dims
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.fields = None
+        self.chunk_start = 0
+        self.chunk_count = 0
+
+    def init_fields(self, transition):
+
+        state, action, reward, new_state, done = transition
+        self.state_is_list = isinstance(state, (list, tuple))
+        self.num_inputs = len(to_array_list(state))
+
+        self.fields = []
+        shapes_and_types = (
+            [(elem.shape, self.input_dtype(elem)) for elem in to_array_list(state)] * 2
+            + [(np.shape(action), np.asarray(action).dtype), ((), np.float32), ((), np.bool_)]
+        )
+
+        for i, (shape, dtype) in enumerate(shapes_and_types):
+            self.fields.append({
+                'shape': shape,
+                'dtype': dtype,
+                'memmap': np.memmap(
+                    os.path.join(self.directory, 'field_{}.dat'.format(i)),
+                    dtype=dtype, mode='w+', shape=(self.capacity,) + shape),
+                'chunk': np.zeros((self.chunk_size,) + shape, dtype=dtype),
+            })
+
+    def input_dtype(self, array):
+        if array.ndim >= self.image_min_dims:
+            return np.uint8
+        return np.float32
+
+    def encode(self, value, field):
+        if field['dtype'] == np.uint8:
+            return np.round(np.asarray(value) * 255)
+        return value
+
+    def decode(self, values, field):
+        if field['dtype'] == np.uint8:
+            return values.astype(np.float32) / 255
+        return values
+
+    def add(self, index, transition):
+
+        if self.fields is None:
+            self.init_fields(transition)
+
+        # Transitions are added in ring order, start a new chunk if the index doesn't continue the current one:
+        if self.chunk_count > 0 and index != (self.chunk_start + self.chunk_count) % self.capacity:
+            self.flush()
+
+        if self.chunk_count == 0:
+            self.chunk_start = index
+
+        state, action, reward, new_state, done = transition
+        values = to_array_list(state) + to_array_list(new_state) + [action, reward, done]
+
+        for field, value in zip(self.fields, values):
+            field['chunk'][self.chunk_count] = self.encode(value, field)
+
+        self.chunk_count += 1
+        if self.chunk_count == self.chunk_size or self.chunk_start + self.chunk_count == self.capacity:
+            self.flush()
+
+    def flush(self):
+        if self.chunk_count == 0:
+            return
+
+        # One sequential write per file:
+        stop = self.chunk_start + self.chunk_count
+        for field in self.fields:
+            field['memmap'][self.chunk_start:stop] = field['chunk'][:self.chunk_count]
+
+        self.chunk_count = 0
+
+    def get(self, indices):
+
+        indices = np.asarray(indices)
+
+        # Indices of the chunk, that is not written yet, are read from RAM:
+        in_chunk = (indices - self.chunk_start) % self.capacity < self.chunk_count
+        chunk_indices = (indices - self.chunk_start) % self.capacity
+
+        columns = []
+        for field in self.fields:
+            values = field['memmap'][indices]
+            if np.any(in_chunk):
+                values[in_chunk] = field['chunk'][chunk_indices[in_chunk]]
+            columns.append(self.decode(values, field))
+
+        states     = columns[:self.num_inputs]
+        new_states = columns[self.num_inputs:2 * self.num_inputs]
+        actions, rewards, dones = columns[2 * self.num_inputs:]
+
+        transitions = []
+        for j in range(len(indices)):
+            state     = [elem[j] for elem in states]
+            new_state = [elem[j] for elem in new_states]
+            if not self.state_is_list:
+                state, new_state = state[0], new_state[0]
+            transitions.append([state, actions[j], rewards[j], new_state, bool(dones[j])])
+
+        return transitions
+
+
+# Replay Buffers:
+# ----------------------------------------------------------------------------------------------------------------
+
+class BaseReplayBuffer:
+    '''
+    Ring buffer for transitions ``[state, action, reward, new_state, done]`` with uniform sampling.
+
+    Args:
+        capacity (int): Maximum number of stored transitions
+        storage (object): Where the transitions are kept, for example a ``MemmapReplayStorage``.
+            Uses a ``ListStorage`` in RAM when None.
+    '''
+    def __init__(self, capacity, storage=None):
+
+        self.capacity = int(capacity)
+
+        if storage is None:
+            storage = ListStorage(self.capacity)
+        self.storage = storage
+
+        self.next_index = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, transition):
+        index = self.next_index
+        self.storage.add(index, transition)
+
+        self.next_index = (self.next_index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return index
+
+    def get(self, indices):
+        return self.storage.get(indices)
+
+    def sample(self, batch_size):
+        indices = np.random.randint(0, self.size, size=batch_size)
+        return self.get(indices), indices, np.ones((batch_size))
+
+    def update_priorities(self, indices, td_errors):
+        pass
+
+
+class PrioritizedReplayBuffer(BaseReplayBuffer):
+    '''
+    Proportional prioritized experience replay. Transitions are sampled with probability ``p_i^alpha / sum_k p_k^alpha``,
+    the bias of the non-uniform sampling is corrected by importance-sampling weights ``(N * P(i))^-beta``,
+    normalized by their maximum. New transitions get the current maximum priority, so they are replayed at least once.
+
+    Args:
+        capacity (int): Maximum number of stored transitions
+        alpha (float): How much prioritization is used, 0 means uniform sampling
+        beta (float): Initial strength of the importance-sampling correction
+        beta_increment (float): Added to ``beta`` after each sampled batch, until ``beta`` reaches 1
+        epsilon (float): Small constant added to absolute TD-errors, so no transition gets zero probability
+        storage (object): Where the transitions are kept, see ``BaseReplayBuffer``
+    '''
+    def __init__(self, capacity, alpha=0.6, beta=0.4, beta_increment=0.001, epsilon=1e-6, storage=None):
+
+        super().__init__(capacity, storage)
+
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+
+        self.sum_tree = SumTree(self.capacity)
+        self.max_priority = 1.0
+
+    def add(self, transition):
+        index = super().add(transition)
+        self.sum_tree.update(index, self.max_priority ** self.alpha)
+        return index
+
+    def sample(self, batch_size):
+
+        # Stratified sampling: one value from each of batch_size equal segments of the total priority
+        total = self.sum_tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+        indices = self.sum_tree.find(values)
+
+        # Importance-sampling weights:
+        probs = self.sum_tree.tree[indices + self.sum_tree.tree_capacity] / total
+        weights = (self.size * probs) ** (-self.beta)
+        weights = weights / np.max(weights)
+
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        return self.get(indices), indices, weights
+
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, np.max(priorities))
+        self.sum_tree.update(indices, priorities ** self.alpha)
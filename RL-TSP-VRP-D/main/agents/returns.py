@@ -0,0 +1,135 @@
+'''
+Return and advantage calculations shared by the agents.
+All functions take arrays of shape [T] or [T, N_envs] (time first) and respect ``done`` masks,
+where ``dones[t] = 1`` means the episode ended after step ``t`` (nothing is bootstrapped from ``t+1``).
+'''
+import numpy as np
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
+
+def discount_cumsum(x, gamma):
+    '''
+    Discounted cumulative sum along the time axis: ``y[t] = x[t] + gamma * y[t+1]``.
+    Uses ``scipy.signal.lfilter`` on the reversed array if scipy is installed.
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    if lfilter is not None:
+        return lfilter([1], [1, -gamma], x[::-1], axis=0)[::-1]
+
+    y = np.zeros_like(x)
+    discounted_sum = np.zeros_like(x[0])
+    for t in range(len(x) - 1, -1, -1):
+        discounted_sum = x[t] + gamma * discounted_sum
+        y[t] = discounted_sum
+    return y
+
+
+def discounted_returns(rewards, dones=None, gamma=0.99, bootstrap_value=None):
+    '''
+    Discounted returns ``G[t] = r[t] + gamma * G[t+1] * (1 - done[t])``, with ``G[T] = bootstrap_value``.
+
+    Args:
+        rewards (np.ndarray): Rewards of shape [T] or [T, N_envs]
+        dones (np.ndarray): Done flags with the same shape as ``rewards``, None if no episode ended
+        gamma (float): Discount factor
+        bootstrap_value (float, np.ndarray): Value estimate of the state after the last step (per env)
+    '''
+    rewards = np.asarray(rewards, dtype=np.float64)
+
+    if bootstrap_value is not None:
+        rewards = np.copy(rewards)
+        if dones is None:
+            rewards[-1] = rewards[-1] + gamma * np.asarray(bootstrap_value)
+        else:
+            rewards[-1] = rewards[-1] + gamma * np.asarray(bootstrap_value) * (1 - np.asarray(dones[-1]))
+
+    # Without episode ends the whole array is filtered at once:
+    if dones is None or not np.any(dones):
+        return discount_cumsum(rewards, gamma)
+
+    # Otherwise the reset makes the recursion time-variant, the loop runs over time only (vectorized over envs):
+    not_dones = 1 - np.asarray(dones, dtype=np.float64)
+    returns = np.zeros_like(rewards)
+    discounted_sum = np.zeros_like(rewards[0])
+    for t in range(len(rewards) - 1, -1, -1):
+        discounted_sum = rewards[t] + gamma * discounted_sum * not_dones[t]
+        returns[t] = discounted_sum
+    return returns
+
+
+def n_step_targets(rewards, values, dones=None, gamma=0.99, n=5, bootstrap_value=None):
+    '''
+    n-step targets ``r[t] + ... + gamma^(n-1) * r[t+n-1] + gamma^n * V[t+n]``, truncated at episode ends.
+    Computed from the full discounted returns: ``G[t] - gamma^n * G[t+n] + gamma^n * V[t+n]``, where the
+    last two terms are only used, if no episode ended between ``t`` and ``t+n``.
+
+    Args:
+        rewards (np.ndarray): Rewards of shape [T] or [T, N_envs]
+        values (np.ndarray): Critic values of the visited states with the same shape
+        dones (np.ndarray): Done flags with the same shape, None if no episode ended
+        gamma (float): Discount factor
+        n (int): Number of steps before bootstrapping
+        bootstrap_value (float, np.ndarray): Value of the state after the last step, 0 if None
+    '''
+    rewards = np.asarray(rewards, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    T = len(rewards)
+
+    if bootstrap_value is None:
+        bootstrap_value = np.zeros_like(rewards[0])
+    bootstrap_value = np.broadcast_to(bootstrap_value, np.shape(rewards[0]))
+    if dones is None:
+        dones = np.zeros_like(rewards)
+    dones = np.asarray(dones, dtype=np.float64)
+
+    returns = discounted_returns(rewards, dones, gamma, bootstrap_value)
+
+    # Returns and values extended by the bootstrap value at T, so t+n can be looked up for all t:
+    ext_returns = np.concatenate([returns, bootstrap_value[None]], axis=0)
+    ext_values  = np.concatenate([values, bootstrap_value[None]], axis=0)
+    ahead = np.minimum(np.arange(T) + n, T)
+    steps = (ahead - np.arange(T)).reshape((T,) + (1,) * (rewards.ndim - 1))
+
+    # Count episode ends in [t, t+n), targets are only bootstrapped when there was none:
+    cum_dones = np.concatenate([np.zeros_like(dones[:1]), np.cumsum(dones, axis=0)], axis=0)
+    alive = (cum_dones[ahead] - cum_dones[:T]) == 0
+
+    discount = gamma ** steps
+    return returns + alive * discount * (ext_values[ahead] - ext_returns[ahead])
+
+
+def gae(rewards, values, dones=None, gamma=0.99, lam=0.95, bootstrap_value=None):
+    '''
+    Generalized advantage estimation. Returns the advantages and the value targets (advantages + values).
+
+    Args:
+        rewards (np.ndarray): Rewards of shape [T] or [T, N_envs]
+        values (np.ndarray): Critic values of the visited states with the same shape
+        dones (np.ndarray): Done flags with the same shape, None if no episode ended
+        gamma (float): Discount factor
+        lam (float): GAE lambda, 0 gives one-step TD-errors and 1 the Monte Carlo advantages
+        bootstrap_value (float, np.ndarray): Value of the state after the last step, 0 if None
+    '''
+    rewards = np.asarray(rewards, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+
+    if bootstrap_value is None:
+        bootstrap_value = np.zeros_like(rewards[0])
+    bootstrap_value = np.broadcast_to(bootstrap_value, np.shape(rewards[0]))
+    if dones is None:
+        dones = np.zeros_like(rewards)
+    not_dones = 1 - np.asarray(dones, dtype=np.float64)
+
+    next_values = np.concatenate([values[1:], bootstrap_value[None]], axis=0)
+    deltas = rewards + gamma * next_values * not_dones - values
+
+    advantages = discounted_returns(deltas, dones, gamma * lam)
+    return advantages, advantages + values
+
+
+def standardize(values):
+    return (values - np.mean(values)) / (np.std(values) + np.finfo(np.float32).eps.item())
@@ -1,3 +1,4 @@
+import json
 import numpy as np
 import gym
 
@@ -6,13 +7,64 @@ from main.simulation.vehicles import BaseVehicleCreator
 from main.simulation.nodes import BaseNodeCreator
 from main.simulation.auto_agent import BaseAutoAgent
 from main.simulation.simulation import BaseSimulator
+from main.simulation.instances import InstanceDataset
+from main.simulation.tsplib import import_tsplib
+from main.simulation.trajectory import BaseTrajectoryRecorder
 
-from main.visualizer import BaseVisualizer
 from main.simulation.state_interpreter import BaseObsEncoder
 from main.simulation.action_interpreter import BaseActDecoder
 from main.reward_calculator import BaseRewardCalculator
 
 from main.environment import CustomEnv
+from main.profiler import BaseStepProfiler
+
+
+# Version of the env spec format, increase when the parameter of BuildEnvironment change:
+SPEC_VERSION = 4
+
+
+def to_serializable(value):
+    if isinstance(value, dict):
+        return {k: to_serializable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_serializable(elem) for elem in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def seed_to_spec(seed):
+    '''
+    Serializes the seed of BuildEnvironment. Generators can't be stored as seed, use an int or np.random.SeedSequence.
+    '''
+    if seed is None or isinstance(seed, (int, np.integer)):
+        return to_serializable(seed)
+    if isinstance(seed, np.random.SeedSequence):
+        entropy = seed.entropy
+        return {
+            # Entropy of SeedSequence() has 128 bits, so ints are stored as string:
+            'entropy': str(entropy) if isinstance(entropy, (int, np.integer)) else to_serializable(entropy),
+            'spawn_key': to_serializable(seed.spawn_key),
+            'pool_size': int(seed.pool_size),
+        }
+    if isinstance(seed, (list, tuple, np.ndarray)):
+        return to_serializable(seed)
+    raise Exception('seed was {}, but only an int, a sequence of ints, np.random.SeedSequence or None can be stored in a spec.'.format(type(seed)))
+
+
+def seed_from_spec(value):
+    if isinstance(value, dict):
+        entropy = int(value['entropy']) if isinstance(value['entropy'], str) else value['entropy']
+        return np.random.SeedSequence(entropy, spawn_key=tuple(value['spawn_key']), pool_size=value['pool_size'])
+    return value
+
+
+def output_shapes(outputs):
+    if isinstance(outputs, dict):
+        return {key: list(np.shape(elem)) for key, elem in outputs.items()}
+    if isinstance(outputs, (list, tuple)):
+        return [list(np.shape(elem)) for elem in outputs]
+    return list(np.shape(outputs))
 
 
 class BuildEnvironment:
@@ -24,6 +76,8 @@ class BuildEnvironment:
             reward_signals: (list, tuple, np.ndarray) = [1,1,-1],
             max_steps_per_episode: int = 1000,
             debug_mode: bool = False,
+            # Seed of the random generator (int, np.random.SeedSequence or None):
+            seed = None,
         ):
 
         self.name = name
@@ -31,6 +85,7 @@ class BuildEnvironment:
         self.reward_signals = reward_signals
         self.max_steps_per_episode = max_steps_per_episode
         self.debug_mode = debug_mode
+        self.seed = seed
 
         self.vehicle_params = []
         self.node_params = []
@@ -39,6 +94,13 @@ class BuildEnvironment:
         self.obs_params = None
         self.act_params = None
         self.reward_params = None
+        self.trajectory_params = None
+        self.profiler_params = None
+        self.dataset_params = None
+
+        self.checked_params = False
+        # Spec of from_spec(), its derived action layout is reused by compile():
+        self.spec = None
 
     def vehicles(
             self,
@@ -201,6 +263,7 @@ class BuildEnvironment:
             item_rate: (None, int, list, tuple, np.ndarray) = None,
             item_recharge: (None, int, list, tuple, np.ndarray) = 0,
             init_items_at_step: (None, int, list, tuple, np.ndarray) = 0,
+            item_arrival_rate: (None, int, float, list, tuple, np.ndarray) = 0,
             # visualization:
             symbol: (str, None) = 'rectangle', # 'triangle-up', 'triangle-down', 'rectangle'
             color: (str, None, list, tuple, np.ndarray) = 'orange',
@@ -214,6 +277,7 @@ class BuildEnvironment:
             'item_rate': item_rate,
             'item_recharge': item_recharge,
             'init_items_at_step': init_items_at_step,
+            'item_arrival_rate': item_arrival_rate,
             'symbol': symbol, 
             'color': color,
             }
@@ -229,12 +293,13 @@ class BuildEnvironment:
             item_rate: (None, int, list, tuple, np.ndarray) = None,
             item_recharge: (None, int, list, tuple, np.ndarray) = 0,
             init_items_at_step: (None, int, list, tuple, np.ndarray) = 0,
+            item_arrival_rate: (None, int, float, list, tuple, np.ndarray) = 0,
             # visualization:
             symbol: (str, None) = 'rectangle', # 'triangle-up', 'triangle-down', 'rectangle'
             color: (str, None, list, tuple, np.ndarray) = 'orange',
         ):
 
-        self.nodes(num,'depot',max_items,init_items,item_rate,item_recharge,init_items_at_step,symbol,color)
+        self.nodes(num,'depot',max_items,init_items,item_rate,item_recharge,init_items_at_step,item_arrival_rate,symbol,color)
 
     def customers(
             self,
@@ -246,19 +311,23 @@ class BuildEnvironment:
             item_rate: (None, int, list, tuple, np.ndarray) = None,
             item_recharge: (None, int, list, tuple, np.ndarray) = 0,
             init_items_at_step: (None, int, list, tuple, np.ndarray) = 0,
+            item_arrival_rate: (None, int, float, list, tuple, np.ndarray) = 0,
             # visualization:
             symbol: (str, None) = 'rectangle', # 'triangle-up', 'triangle-down', 'rectangle'
             color: (str, None, list, tuple, np.ndarray) = 'light-grey',
         ):
 
-        self.nodes(num,'customer',max_items,init_items,item_rate,item_recharge,init_items_at_step,symbol,color)
+        self.nodes(num,'customer',max_items,init_items,item_rate,item_recharge,init_items_at_step,item_arrival_rate,symbol,color)
 
     def visuals(
             self,
             grid_surface_dim: (list, tuple, np.ndarray) = [600, 600],
             grid_padding: int = 20,
             info_surface_height: int = 240,
-            marker_size: int = 20
+            marker_size: int = 20,
+            # Renders to off-screen surfaces without opening a window (for example on servers without display),
+            # frames can be returned by env.render(mode='rgb_array'):
+            headless: bool = False,
         ):
 
         self.visual_params = {
@@ -266,6 +335,67 @@ class BuildEnvironment:
             'grid_padding': grid_padding,
             'info_surface_height': info_surface_height,
             'marker_size': marker_size,
+            'headless': headless,
+        }
+
+    def trajectories(
+            self,
+            log_dir: str = 'trajectories',
+            # Only every n-th episode is recorded:
+            save_every: int = 1,
+        ):
+
+        self.trajectory_params = {
+            'log_dir': log_dir,
+            'save_every': save_every,
+        }
+
+    def dataset(
+            self,
+            path: str,
+            # 'sequential' cycles through the instances (fixed validation sets), 'random' draws them:
+            order: str = 'sequential',
+            mmap: bool = True,
+        ):
+
+        self.dataset_params = {
+            'path': path,
+            'order': order,
+            'mmap': mmap,
+        }
+
+    def tsplib(
+            self,
+            path: str,
+            # Directory of the binary cache of parsed files, next to the file if None:
+            cache_dir: (str, None) = None,
+            max_vehicles: int = 64,
+            # Larger instances are scaled down to this grid size, None keeps the original coordinates (rounded):
+            max_grid: (int, None) = None,
+        ):
+        '''
+        Uses a TSPLIB/CVRPLIB instance (converted to a cached dataset, see dataset()).
+        The grid is set to the bounding box of the instance.
+        '''
+        dataset_path = import_tsplib(path, cache_dir, max_vehicles, max_grid)
+
+        with open(dataset_path + '/meta.json', 'r') as f:
+            self.grid = [int(np.ceil(elem)) for elem in json.load(f)['grid']]
+
+        self.dataset(dataset_path)
+
+    def profiling(
+            self,
+            # Log-spaced histogram bins of the stage times in seconds:
+            min_time: float = 1e-6,
+            max_time: float = 1.0,
+            num_bins: int = 60,
+        ):
+
+        self.profiler_params = {
+            'min_time': min_time,
+            'max_time': max_time,
+            'num_bins': num_bins,
         }
 
     def observations(
@@ -279,7 +409,9 @@ class BuildEnvironment:
             # Flattens per combined (and all inputs not in a combined list),
             # if no combination are used everything will be flattened,
             flatten: bool = True,
-            flatten_images: bool = False
+            flatten_images: bool = False,
+            # Returns fixed shape float32 arrays per vehicle, customer and depot with masks (for attention based policies):
+            entity_inputs: bool = False,
         ):
         
         self.obs_params = {
@@ -291,6 +423,7 @@ class BuildEnvironment:
             'combine_per_type': combine_per_type,
             'flatten': flatten,
             'flatten_images': flatten_images,
+            'entity_inputs': entity_inputs,
         }
 
     def dummy_observations(
@@ -304,11 +437,12 @@ class BuildEnvironment:
             # Flattens per combined (and all inputs not in a combined list),
             # if no combination are used everything will be flattened,
             flatten: bool = False,
-            flatten_images: bool = False
+            flatten_images: bool = False,
+            entity_inputs: bool = False,
         ):
 
         self.observations(image_input,contin_inputs,discrete_inputs,discrete_bins,combine_per_index,
-            combine_per_type,flatten,flatten_images)
+            combine_per_type,flatten,flatten_images,entity_inputs)
 
     def actions(
             self,
@@ -320,6 +454,7 @@ class BuildEnvironment:
             binary_contin: (None, list, tuple, np.ndarray) = [],
             discrete_bins: int = 20,
             combine: (str, None, list, tuple, np.ndarray) = 'contin', # 'discrete', 'by_categ', 'all', list of lists of output names
+            action_mask: bool = False, # returns masks of the feasible choices as info['action_mask']
         ):
 
         self.act_params = {
@@ -331,6 +466,7 @@ class BuildEnvironment:
             'binary_contin': binary_contin,
             'discrete_bins': discrete_bins,
             'combine': combine,
+            'action_mask': action_mask,
         }
 
     def dummy_actions(
@@ -343,10 +479,11 @@ class BuildEnvironment:
             binary_contin: (None, list, tuple, np.ndarray) = [],
             discrete_bins: int = 20,
             combine: (str, None, list, tuple, np.ndarray) = None, # 'discrete', 'by_categ', 'all', list of lists of output names
+            action_mask: bool = False,
         ):
 
         self.actions(mode,flattened,contin_outputs,discrete_outputs,
-            binary_discrete,binary_contin,discrete_bins,combine)
+            binary_discrete,binary_contin,discrete_bins,combine,action_mask)
 
     def rewards(
             self,
@@ -363,24 +500,23 @@ class BuildEnvironment:
             'action_rewards': action_rewards,
         }
 
-    def compile(
-            self,
-            TempDatabase: BaseTempDatabase = BaseTempDatabase,
-            VehicleCreator: BaseVehicleCreator = BaseVehicleCreator,
-            NodeCreator: BaseNodeCreator = BaseNodeCreator,
-            AutoAgent: BaseAutoAgent = BaseAutoAgent,
-            Simulator: BaseSimulator = BaseSimulator,
-            Visualizer: BaseVisualizer = BaseVisualizer,
-            ObsEncoder: BaseObsEncoder = BaseObsEncoder,
-            ActDecoder: BaseActDecoder = BaseActDecoder,
-            RewardCalculator: BaseRewardCalculator = BaseRewardCalculator,
-        ):
-
+    def check_params(self):
+        '''
+        Replaces missing parameter with the standard parameter.
+        '''
         # Check vehicle parameter:
         if len(self.vehicle_params) == 0:
             self.vehicles()
             print('Using standard vehicle parameter')
 
+        # Nodes of a dataset:
+        if self.dataset_params is not None and len(self.node_params) == 0:
+            with open(self.dataset_params['path'] + '/meta.json', 'r') as f:
+                meta = json.load(f)
+            self.depots(meta['num_depots'])
+            self.customers(meta['num_customers'], max_items=max(1, int(np.ceil(meta['max_demand']))))
+            print('Using depot and customer parameter of the dataset')
+
         # Check node parameter:
         if len(self.node_params) == 0:
             self.depots()
@@ -418,30 +554,201 @@ class BuildEnvironment:
             self.rewards()
             print('Using standard rewards parameter')
 
+        self.checked_params = True
+
+    def compile(
+            self,
+            TempDatabase: BaseTempDatabase = BaseTempDatabase,
+            VehicleCreator: BaseVehicleCreator = BaseVehicleCreator,
+            NodeCreator: BaseNodeCreator = BaseNodeCreator,
+            AutoAgent: BaseAutoAgent = BaseAutoAgent,
+            Simulator: BaseSimulator = BaseSimulator,
+            TrajectoryRecorder: BaseTrajectoryRecorder = BaseTrajectoryRecorder,
+            StepProfiler: BaseStepProfiler = BaseStepProfiler,
+            # BaseVisualizer if None, which imports pygame only when a visualizer is created:
+            Visualizer = None,
+            ObsEncoder: BaseObsEncoder = BaseObsEncoder,
+            ActDecoder: BaseActDecoder = BaseActDecoder,
+            RewardCalculator: BaseRewardCalculator = BaseRewardCalculator,
+        ):
+
+        # Check parameter (already done for envs rebuilt from a spec):
+        if not self.checked_params:
+            self.check_params()
+
+        # Copy of the parameter for to_spec (some parts modify their parameter lists):
+        self.compiled_params = to_serializable({
+            'vehicle_params': self.vehicle_params,
+            'node_params': self.node_params,
+            'visual_params': self.visual_params,
+            'obs_params': self.obs_params,
+            'act_params': self.act_params,
+            'reward_params': self.reward_params,
+            'trajectory_params': self.trajectory_params,
+            'profiler_params': self.profiler_params,
+            'dataset_params': self.dataset_params,
+        })
+
         # Init temporary database:
-        self.temp_db = TempDatabase(self.name, self.grid, self.reward_signals, self.debug_mode)
+        self.temp_db = TempDatabase(self.name, self.grid, self.reward_signals, self.debug_mode, self.seed)
+
+        # Init dataset (optional):
+        if self.dataset_params is not None:
+            self.instance_dataset = InstanceDataset(**self.dataset_params)
+        else:
+            self.instance_dataset = None
 
         # Init vehicle and node creators:
-        self.node_creator = NodeCreator(self.node_params, self.temp_db)
-        self.vehicle_creator = VehicleCreator(self.vehicle_params, self.temp_db)
+        self.node_creator = NodeCreator(self.node_params, self.temp_db, dataset=self.instance_dataset)
+        self.vehicle_creator = VehicleCreator(self.vehicle_params, self.temp_db, dataset=self.instance_dataset)
+
+        if self.instance_dataset is not None:
+            sizes = [self.temp_db.num_depots, self.temp_db.num_customers]
+            dataset_sizes = [self.instance_dataset.num_depots, self.instance_dataset.num_customers]
+            if sizes != dataset_sizes:
+                raise Exception('Numbers of depots and customers were {}, but the dataset has {}'.format(sizes, dataset_sizes))
+            if self.temp_db.num_vehicles > self.instance_dataset.num_vehicles:
+                raise Exception('Number of vehicles was {}, but the dataset has only {}'.format(
+                    self.temp_db.num_vehicles, self.instance_dataset.num_vehicles))
+        if self.spec is not None:
+            sizes = [self.temp_db.num_vehicles, self.temp_db.num_nodes, self.temp_db.num_depots, self.temp_db.num_customers]
+            derived = self.spec['derived']
+            spec_sizes = [derived['num_vehicles'], derived['num_nodes'], derived['num_depots'], derived['num_customers']]
+            if sizes != spec_sizes:
+                raise Exception('Numbers of vehicles, nodes, depots and customers were {}, but the spec has {}'.format(sizes, spec_sizes))
+
         self.auto_agent = AutoAgent(self.temp_db)
 
+        # Init trajectory recording (optional):
+        if self.trajectory_params is not None:
+            self.trajectory_recorder = TrajectoryRecorder(self.temp_db, **self.trajectory_params)
+        else:
+            self.trajectory_recorder = None
+
+        # Init step profiling (optional):
+        if self.profiler_params is not None:
+            self.profiler = StepProfiler(**self.profiler_params)
+        else:
+            self.profiler = None
+
         # Init simulation:
-        self.simulation = Simulator(self.temp_db, self.vehicle_creator, self.node_creator, self.auto_agent)
+        self.simulation = Simulator(
+            self.temp_db, self.vehicle_creator, self.node_creator, self.auto_agent, self.trajectory_recorder, self.profiler
+        )
         
-        # Init visualization:
-        self.visualizor = Visualizer(self.name, self.visual_params, self.temp_db)
+        # Init visualization (only needed for image inputs, otherwise created by the env on the first render):
+        self.Visualizer = Visualizer
+        if len(self.obs_params['image_input'] or []) > 0:
+            self.visualizor = self.create_visualizor()
+        else:
+            self.visualizor = None
 
         # Init observation and actions encoding/decoding:
         self.obs_encoder = ObsEncoder(self.obs_params, self.temp_db, self.visualizor)
-        self.act_decoder = ActDecoder(self.act_params, self.temp_db, self.simulation)
+        if self.spec is not None and self.spec['derived'].get('action_layout') is not None:
+            self.act_decoder = ActDecoder(self.act_params, self.temp_db, self.simulation, layout=self.spec['derived']['action_layout'])
+        else:
+            self.act_decoder = ActDecoder(self.act_params, self.temp_db, self.simulation)
 
         # Init reward calculations:
         self.reward_calc = RewardCalculator(self.reward_params, self.temp_db)
 
+    def create_visualizor(self):
+
+        if self.Visualizer is None:
+            from main.visualizer import BaseVisualizer
+            self.Visualizer = BaseVisualizer
+
+        return self.Visualizer(self.name, self.visual_params, self.temp_db)
+
+    def to_spec(self, path=None):
+        '''
+        Returns the checked parameter and the derived sizes and action layout as versioned, json serializable dict.
+        Compiles the env first, if not done yet, but never resets it. The numbers of nodes and vehicles are the maximum
+        (they can be random, if given as range). The observation shapes are only known after the first reset of the env
+        (None before).
+
+        Args:
+            path (string): Writes the spec to a '.json' or '.msgpack' (needs ``msgpack``) file, if not None
+        '''
+        if not hasattr(self, 'temp_db'):
+            self.compile()
+
+        observation_shapes = None
+        if hasattr(self.temp_db, 'status_dict'):
+            observation_shapes = output_shapes(self.obs_encoder.observe_state())
+
+        spec = to_serializable({
+            'spec_version': SPEC_VERSION,
+            'name': self.name,
+            'grid': self.grid,
+            'reward_signals': self.reward_signals,
+            'max_steps_per_episode': self.max_steps_per_episode,
+            'debug_mode': self.debug_mode,
+            'seed': seed_to_spec(self.seed),
+            'params': self.compiled_params,
+            'derived': {
+                'num_vehicles': self.temp_db.num_vehicles,
+                'num_nodes': self.temp_db.num_nodes,
+                'num_depots': self.temp_db.num_depots,
+                'num_customers': self.temp_db.num_customers,
+                'observation_shapes': observation_shapes,
+                'discrete_bins': self.act_decoder.discrete_bins,
+                'discrete_max_val': self.act_decoder.discrete_max_val,
+                'contin_max_val': self.act_decoder.contin_max_val,
+                'action_index_dict': self.act_decoder.index_dict,
+                'action_layout': self.act_decoder.layout(),
+            },
+        })
+
+        if path is not None:
+            if path.endswith('.msgpack'):
+                try:
+                    import msgpack
+                except ImportError:
+                    raise Exception("Writing '{}' needs 'msgpack', install it or use a '.json' file.".format(path))
+                with open(path, 'wb') as f:
+                    f.write(msgpack.packb(spec))
+            else:
+                with open(path, 'w') as f:
+                    json.dump(spec, f, indent=2)
+
+        return spec
+
+    @classmethod
+    def from_spec(cls, spec):
+        '''
+        Creates a BuildEnvironment with the parameter of a spec (dict or path to a '.json'/'.msgpack' file).
+        The parameter were already checked, so ``compile()`` skips the checks and rebuilds the action decoder
+        from the derived action layout. Compiling raises an Exception, if the derived sizes don't match.
+        '''
+        if isinstance(spec, str):
+            if spec.endswith('.msgpack'):
+                try:
+                    import msgpack
+                except ImportError:
+                    raise Exception("Reading '{}' needs 'msgpack', install it or use a '.json' file.".format(spec))
+                with open(spec, 'rb') as f:
+                    spec = msgpack.unpackb(f.read())
+            else:
+                with open(spec, 'r') as f:
+                    spec = json.load(f)
+
+        if spec.get('spec_version') != SPEC_VERSION:
+            raise Exception('spec_version was {}, but this version of BuildEnvironment reads version {}.'.format(
+                spec.get('spec_version'), SPEC_VERSION))
+
+        builder = cls(spec['name'], spec['grid'], spec['reward_signals'], spec['max_steps_per_episode'], spec['debug_mode'], seed_from_spec(spec.get('seed')))
+        [setattr(builder, k, v) for k, v in spec['params'].items()]
+        builder.checked_params = True
+        builder.spec = spec
+
+        return builder
+
     def build(self) -> gym.Env:
 
         return CustomEnv(
             self.name, self.max_steps_per_episode,
-            self.simulation, self.visualizor, self.obs_encoder, self.act_decoder, self.reward_calc
+            self.simulation, self.visualizor, self.obs_encoder, self.act_decoder, self.reward_calc, self.profiler,
+            self.create_visualizor,
         )
@@ -1,4 +1,8 @@
 import gym
+from contextlib import nullcontext
+
+# Reusable context of the stages, when the env isn't profiled:
+NO_PROFILING = nullcontext()
 
 
 
@@ -10,7 +14,7 @@ import gym
 class CustomEnv(gym.Env):
     """Custom Environment that follows gym interface"""
     metadata = {
-    'render.modes': ['human'],
+    'render.modes': ['human', 'rgb_array'],
     }
 
     def __init__(self, 
@@ -21,6 +25,8 @@ class CustomEnv(gym.Env):
             obs_encoder,
             act_decoder,
             reward_calc,
+            profiler=None,
+            create_visualizor=None,
             ):
 
         super(CustomEnv, self).__init__()
@@ -31,8 +37,9 @@ class CustomEnv(gym.Env):
         # Init simulator
         self.simulation = simulation
 
-        # Init visulizor:
+        # Init visulizor (created on the first render, if None):
         self.visualizor = visualizor
+        self.create_visualizor = create_visualizor
         
         # Init state and action interpreter
         self.act_decoder = act_decoder
@@ -41,12 +48,19 @@ class CustomEnv(gym.Env):
         # Init reward calculator
         self.reward_calc = reward_calc
 
+        # Init step profiler (optional):
+        self.profiler = profiler
+
         # Init Logger (move to train process)
         #self.logger        = TrainingLogger()
         #self.test_logger   = TestingLogger()
 
         # Init gym spaces:
         self.reset()
+        # The first user reset starts with the first dataset instance:
+        dataset = getattr(self.simulation.node_creator, 'dataset', None)
+        if dataset is not None:
+            dataset.rewind()
         #self.action_space      = self.act_decoder.action_space()
         #self.observation_space = self.obs_encoder.obs_space()
 
@@ -55,19 +69,27 @@ class CustomEnv(gym.Env):
         self.count_total_steps = 0
 
     def step(self, actions):
-        
-        # take action:
-        self.simulation.temp_db.init_step()
-        self.act_decoder.decode_actions(actions)
-        done = self.simulation.finish_step()
-        self.simulation.temp_db.finish_step()
 
-        # new state:
-        observation = self.obs_encoder.observe_state()
+        with self.stage('step'):
+
+            # take action:
+            with self.stage('init_step'):
+                self.simulation.temp_db.init_step()
+            with self.stage('decode_actions'):
+                self.act_decoder.decode_actions(actions)
+            with self.stage('finish_step'):
+                done = self.simulation.finish_step()
+            with self.stage('db_finish_step'):
+                self.simulation.temp_db.finish_step()
 
-        # reward:
-        #reward = self.reward_calc.reward_function()
-        reward = 0
+            # new state:
+            with self.stage('observe_state'):
+                observation = self.obs_encoder.observe_state()
+
+            # reward:
+            with self.stage('reward'):
+                #reward = self.reward_calc.reward_function()
+                reward = 0
 
         self.count_steps_of_episode += 1
         self.count_total_steps      += 1
@@ -77,15 +99,46 @@ class CustomEnv(gym.Env):
         if done:
             self.count_episodes     += 1
 
-        return observation, reward, done, {}
-
-
-    def reset(self):
+        return observation, reward, done, self.step_info()
+
+    def stage(self, name):
+        '''
+        Times a stage of the step with the profiler (does nothing, if the env isn't profiled).
+        '''
+        if self.profiler is None:
+            return NO_PROFILING
+        return self.profiler.stage(name)
+
+
+    def step_info(self):
+        info = {}
+        if self.act_decoder.action_mask:
+            info['action_mask'] = self.act_decoder.action_masks()
+        return info
+
+    def seed(self, seed=None):
+        '''
+        Seeds the random generator of the env, seed can be an int, a np.random.SeedSequence or None.
+        Use main.simulation.common_sim_func.spawn_seeds to create independent seeds for parallel envs.
+        '''
+        self.simulation.temp_db.seed(seed)
+        return [seed]
+
+    def reset(self, seed=None, options=None):
+        '''
+        Resets the env, options={'instance': k} uses instance k of the dataset (e.g. for deterministic validation).
+        '''
+        if seed is not None:
+            self.seed(seed)
 
         # reset counter:
         self.count_steps_of_episode = 0
 
-        self.simulation.reset_simulation()
+        self.simulation.reset_simulation(instance=(options or {}).get('instance'))
+        self.act_decoder.reset()
+        self.obs_encoder.reset()
+        if self.visualizor is not None:
+            self.visualizor.reset_static_surfaces()
 
         # Init first state:
         observation = self.obs_encoder.observe_state()
@@ -93,10 +146,18 @@ class CustomEnv(gym.Env):
         return observation
         
     def render(self, mode='human', close=False):
-        if mode == 'human':
-            self.visualizor.visualize_step(self.count_episodes, self.count_steps_of_episode)
+        frame = None
+        if self.visualizor is None:
+            if self.create_visualizor is None:
+                raise Exception('Rendering needs a visualizor, build the env with BuildEnvironment.')
+            self.visualizor = self.create_visualizor()
+
+        if mode in ['human', 'rgb_array']:
+            frame = self.visualizor.visualize_step(self.count_episodes, self.count_steps_of_episode, mode)
 
         if close == True:
             self.visualizor.close()
 
+        return frame
+
 
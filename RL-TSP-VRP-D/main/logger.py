@@ -1,21 +1,180 @@
-import tensorflow as tf
+import os
+import csv
+import threading
+import numpy as np
+
+
+class TensorBoardSink:
+
+    """
+    Writes the buffered values of a logger as tensorboard summaries.
+    TensorFlow is only imported when this sink is created.
+
+    Args:
+        path (string): Directory of the summary file.
+    """
+
+    def __init__(self, path):
+
+        import tensorflow as tf
+        self.tf = tf
+
+        #logdir = "logs/scalars/" + datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.file_writer = tf.summary.create_file_writer(path)
+        self.file_writer.set_as_default()
+
+    def write(self, scalars, histograms):
+        with self.file_writer.as_default():
+            for tag, value, step in scalars:
+                self.tf.summary.scalar(tag, value, step=step)
+            for tag, values, step in histograms:
+                self.tf.summary.histogram(tag, values, step=step)
+        self.file_writer.flush()
+
+    def close(self):
+        self.file_writer.close()
+
+
+class CSVSink:
+
+    """
+    Appends the buffered values of a logger as rows to ``scalars.csv`` (step, tag, value) and
+    ``histograms.csv`` (step, tag, space separated values). Needs no additional packages.
+
+    Args:
+        path (string): Directory of the csv files.
+    """
+
+    def __init__(self, path):
+
+        os.makedirs(path, exist_ok=True)
+        self.scalar_file = open(os.path.join(path, 'scalars.csv'), 'a', newline='')
+        self.histogram_file = open(os.path.join(path, 'histograms.csv'), 'a', newline='')
+        self.scalar_writer = csv.writer(self.scalar_file)
+        self.histogram_writer = csv.writer(self.histogram_file)
+
+        if self.scalar_file.tell() == 0:
+            self.scalar_writer.writerow(['step', 'tag', 'value'])
+        if self.histogram_file.tell() == 0:
+            self.histogram_writer.writerow(['step', 'tag', 'values'])
+
+    def write(self, scalars, histograms):
+        self.scalar_writer.writerows([(step, tag, value) for tag, value, step in scalars])
+        self.histogram_writer.writerows(
+            [(step, tag, ' '.join(map(str, values.tolist()))) for tag, values, step in histograms]
+        )
+        self.scalar_file.flush()
+        self.histogram_file.flush()
+
+    def close(self):
+        self.scalar_file.close()
+        self.histogram_file.close()
+
+
+class ArrowSink:
+
+    """
+    Writes each flush of a logger as one record batch to the Arrow IPC stream files ``scalars.arrow``
+    (step, tag, value) and ``histograms.arrow`` (step, tag, values). Needs ``pyarrow``.
+
+    Args:
+        path (string): Directory of the arrow files.
+    """
+
+    def __init__(self, path):
+
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise Exception("The 'arrow' logger backend needs 'pyarrow', install it or use the 'csv' backend.")
+        self.pa = pa
+
+        os.makedirs(path, exist_ok=True)
+        self.scalar_schema = pa.schema([('step', pa.int64()), ('tag', pa.string()), ('value', pa.float64())])
+        self.histogram_schema = pa.schema([('step', pa.int64()), ('tag', pa.string()), ('values', pa.list_(pa.float32()))])
+        self.scalar_writer = pa.ipc.new_stream(os.path.join(path, 'scalars.arrow'), self.scalar_schema)
+        self.histogram_writer = pa.ipc.new_stream(os.path.join(path, 'histograms.arrow'), self.histogram_schema)
+
+    def write(self, scalars, histograms):
+        if len(scalars) > 0:
+            tags, values, steps = zip(*scalars)
+            self.scalar_writer.write_batch(self.pa.record_batch(
+                [self.pa.array(steps, self.pa.int64()), self.pa.array(tags, self.pa.string()), self.pa.array(values, self.pa.float64())],
+                schema=self.scalar_schema,
+            ))
+        if len(histograms) > 0:
+            tags, values, steps = zip(*histograms)
+            self.histogram_writer.write_batch(self.pa.record_batch(
+                [self.pa.array(steps, self.pa.int64()), self.pa.array(tags, self.pa.string()),
+                 self.pa.array([elem.tolist() for elem in values], self.pa.list_(self.pa.float32()))],
+                schema=self.histogram_schema,
+            ))
+
+    def close(self):
+        self.scalar_writer.close()
+        self.histogram_writer.close()
+
+
+LOGGER_BACKENDS = {
+    'tensorboard': TensorBoardSink,
+    'csv': CSVSink,
+    'arrow': ArrowSink,
+}
+
 
 class BaseLogger:
 
     """
-    Creates a summary writer for tensorboard logging.
+    Creates a logger, that writes to tensorboard (default) or to columnar files without TensorFlow.
+
+    Logged values are buffered in memory and written by a background thread, either every ``flush_secs``
+    seconds or as soon as ``max_buffer`` values are waiting, so logging doesn't block the training loop
+    with a disk write per call. Call ``close()`` (or ``flush()``) at the end, to write the remaining values.
 
     Args:
         name (string): Name of the model.
         log_dir (string): Path that indicates which dataset is used.
+        backend (string): 'tensorboard', 'csv' or 'arrow', only 'tensorboard' imports TensorFlow.
+        flush_secs (float): Maximum time in seconds between two writes.
+        max_buffer (int): Number of buffered values that triggers a write.
     """
 
-    def __init__(self, name, log_dir):
+    def __init__(self, name, log_dir, backend='tensorboard', flush_secs=10, max_buffer=1000):
 
-        #logdir = "logs/scalars/" + datetime.now().strftime("%Y%m%d-%H%M%S")
-        self.file_writer = tf.summary.create_file_writer(log_dir+"/"+name)
-        self.file_writer.set_as_default()
+        if backend not in LOGGER_BACKENDS:
+            raise Exception("backend was set to '{}', but has to be one of: {}".format(backend, list(LOGGER_BACKENDS.keys())))
+        self.sink = LOGGER_BACKENDS[backend](log_dir+"/"+name)
+
+        self.flush_secs = flush_secs
+        self.max_buffer = max_buffer
+
+        # Buffers of (tag, value, step):
+        self.scalars = []
+        self.histograms = []
+        self.lock = threading.Lock()
+        # Writes of the background thread and of flush()/close() don't interleave and keep the order of the buffers:
+        self.write_lock = threading.Lock()
+
+        # Error of the sink in the background thread, raised by the next call of the logger:
+        self.error = None
+        self.closed = False
+
+        self.flush_event = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self.flush_loop, daemon=True)
+        self.thread.start()
 
+    def num_buffered(self):
+        return len(self.scalars) + len(self.histograms)
+
+    def check_error(self):
+        if self.error is not None:
+            raise Exception('Writing the logged values failed in the background thread: {!r}'.format(self.error)) from self.error
+
+    def check_open(self):
+        if self.closed:
+            raise Exception('The logger was closed, values logged after close() would never be written.')
+        self.check_error()
 
     def log_scalar(self, tag, value, step):
         """Log a scalar variable.
@@ -25,8 +184,87 @@ class BaseLogger:
             value (float): Value of the scalar
             step (int): Training iteration
         """
-        tf.summary.scalar(tag, value, step=step)
-        self.file_writer.flush()
+        with self.lock:
+            self.check_open()
+            self.scalars.append((tag, float(value), int(step)))
+            if self.num_buffered() >= self.max_buffer:
+                self.flush_event.set()
+
+    def log_histogram(self, tag, values, step):
+        """Log the distribution of values.
+
+        Args:
+            tag (string): Name of the histogram
+            values (np.ndarray): Values of the distribution
+            step (int): Training iteration
+        """
+        with self.lock:
+            self.check_open()
+            self.histograms.append((tag, np.array(values, dtype=np.float32), int(step)))
+            if self.num_buffered() >= self.max_buffer:
+                self.flush_event.set()
+
+    def log_vector(self, tag, values, step, names=None, histogram=False):
+        """Log one scalar per element of a vector, for example one value per vehicle.
+
+        Args:
+            tag (string): Name of the vector, the scalars are named 'tag/name'
+            values (np.ndarray): Values of the vector
+            step (int): Training iteration
+            names (list): Names of the elements, uses the indices when None
+            histogram (bool): Also logs the vector as histogram under 'tag'
+        """
+        values = np.ravel(values)
+        if names is None:
+            names = [str(i) for i in range(len(values))]
+
+        with self.lock:
+            self.check_open()
+            for name, value in zip(names, values):
+                self.scalars.append((tag+"/"+name, float(value), int(step)))
+            if histogram:
+                self.histograms.append((tag, values.astype(np.float32), int(step)))
+            if self.num_buffered() >= self.max_buffer:
+                self.flush_event.set()
+
+    def flush(self):
+        """Writes all buffered values to the summary file."""
+        self.check_error()
+        self.write_buffers()
+
+    def write_buffers(self):
+        with self.write_lock:
+            with self.lock:
+                scalars, self.scalars = self.scalars, []
+                histograms, self.histograms = self.histograms, []
+
+            if len(scalars) + len(histograms) == 0:
+                return
+
+            self.sink.write(scalars, histograms)
+
+    def flush_loop(self):
+        while self.running:
+            self.flush_event.wait(timeout=self.flush_secs)
+            self.flush_event.clear()
+            try:
+                self.write_buffers()
+            except Exception as error:
+                # The thread stops, so the buffers don't grow, the error is raised by the next call of the logger:
+                self.error = error
+                self.running = False
+
+    def close(self):
+        """Stops the background thread and writes the remaining values."""
+        with self.lock:
+            self.closed = True
+        self.running = False
+        self.flush_event.set()
+        self.thread.join()
+        try:
+            self.flush()
+        finally:
+            self.sink.close()
 
 
 class TrainingLogger(BaseLogger):
@@ -37,4 +275,3 @@ class TrainingLogger(BaseLogger):
 class TestingLogger(BaseLogger):
     def __init__(self):
         super().__init__()
-
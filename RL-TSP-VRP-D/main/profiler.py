@@ -0,0 +1,146 @@
+'''
+Timing of the stages of ``CustomEnv.step`` and of the vehicle actions, enabled by ``BuildEnvironment.profiling()``.
+'''
+import bisect
+import numpy as np
+from time import perf_counter
+from contextlib import contextmanager
+
+
+class StageTimes:
+    '''
+    Aggregated durations of one stage: count, total, min, max and a histogram with log-spaced bins.
+    Nothing is stored per call, so the memory doesn't grow with the number of steps.
+    '''
+    def __init__(self, bin_edges):
+
+        self.bin_edges = bin_edges
+        self.counts = [0] * (len(bin_edges) + 1)
+
+        self.num_calls = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = 0.0
+
+    def add(self, duration):
+        self.counts[bisect.bisect(self.bin_edges, duration)] += 1
+        self.num_calls += 1
+        self.total += duration
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+
+    def mean(self):
+        if self.num_calls == 0:
+            return 0.0
+        return self.total / self.num_calls
+
+    def percentile(self, q):
+        '''
+        Approximated percentile (upper edge of the histogram bin that contains it), ``q`` in [0, 100].
+        '''
+        if self.num_calls == 0:
+            return 0.0
+        cum_counts = np.cumsum(self.counts)
+        i = int(np.searchsorted(cum_counts, q / 100 * self.num_calls))
+        if i >= len(self.bin_edges):
+            return self.max
+        return min(self.bin_edges[i], self.max)
+
+
+class BaseStepProfiler:
+    '''
+    Collects the time spent in each stage of the env step with ``time.perf_counter``.
+    The stages of ``CustomEnv.step`` are named 'init_step', 'decode_actions', 'finish_step' (the simulation),
+    'db_finish_step', 'observe_state', 'reward' and 'step' (all together). The vehicle actions during a time frame
+    are timed per action as 'action/move', 'action/load_v', ..., 'action/idle' (included in 'finish_step').
+
+    Args:
+        min_time (float): Lower edge of the histogram bins in seconds
+        max_time (float): Upper edge of the histogram bins in seconds
+        num_bins (int): Number of log-spaced histogram bins
+    '''
+    def __init__(self, min_time=1e-6, max_time=1.0, num_bins=60):
+
+        self.bin_edges = np.geomspace(min_time, max_time, num_bins + 1).tolist()
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        # Durations of the nested actions of each running action (see time_action):
+        self.nested_time = []
+
+    def add(self, stage, duration):
+        if stage not in self.stages:
+            self.stages[stage] = StageTimes(self.bin_edges)
+        self.stages[stage].add(duration)
+
+    @contextmanager
+    def stage(self, stage):
+        '''
+        Context manager, that adds the duration of its block to stage.
+        '''
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, perf_counter() - start)
+
+    def time_action(self, stage, function, *args, **kwargs):
+        '''
+        Runs function and adds its duration to stage. Actions can start the next action of the vehicle,
+        so the time of nested actions is only added to their own stage.
+        '''
+        self.nested_time.append(0.0)
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = perf_counter() - start
+            self.add(stage, duration - self.nested_time.pop())
+            if len(self.nested_time) > 0:
+                self.nested_time[-1] += duration
+
+    def summary(self):
+        '''
+        Returns a dict with the statistics of each stage, durations in milliseconds.
+        '''
+        step_total = self.stages['step'].total if 'step' in self.stages else 0.0
+
+        summary = {}
+        for stage, times in self.stages.items():
+            summary[stage] = {
+                'calls': times.num_calls,
+                'total_ms': times.total * 1e3,
+                'mean_ms': times.mean() * 1e3,
+                'min_ms': times.min * 1e3,
+                'p50_ms': times.percentile(50) * 1e3,
+                'p95_ms': times.percentile(95) * 1e3,
+                'max_ms': times.max * 1e3,
+                'share': times.total / step_total if step_total > 0 else 0.0,
+            }
+        return summary
+
+    def report(self):
+        '''
+        Returns the statistics of all stages as printable table.
+        '''
+        columns = ['calls', 'total_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms', 'share']
+        lines = ['{:<22}'.format('stage') + ''.join('{:>12}'.format(column) for column in columns)]
+
+        for stage, values in sorted(self.summary().items(), key=lambda item: -item[1]['total_ms']):
+            line = '{:<22}{:>12d}'.format(stage, values['calls'])
+            line += ''.join('{:>12.4f}'.format(values[column]) for column in columns[1:-1])
+            line += '{:>11.1f}%'.format(values['share'] * 100)
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+    def log(self, logger, step):
+        '''
+        Writes mean, p95 and share of each stage with ``logger.log_scalar`` (for example a ``BaseLogger``).
+        '''
+        for stage, values in self.summary().items():
+            for key in ['mean_ms', 'p95_ms', 'share']:
+                logger.log_scalar('profiler/' + stage + '/' + key, values[key], step)
@@ -0,0 +1,119 @@
+'''
+FrameRecorder writes rendered rgb_array frames of an env to disk in a background thread.
+'''
+import queue
+import zipfile
+import threading
+import numpy as np
+
+
+class FrameRecorder:
+
+    '''
+    Writes rendered frames in a background thread, so recording doesn't slow down the training loop.
+    The format depends on the file extension of ``path``:
+
+    - ``.npz``: compressed NumPy archive, written in chunks of ``chunk_size`` frames by the background thread
+      (keys ``frames_00000``, ``frames_00001``, ..., each of shape (num_frames, height, width, 3)), so only one chunk
+      is kept in memory. ``load_frames`` returns all frames as one array.
+    - ``.gif``, ``.mp4`` or any other format supported by ``imageio`` (needs to be installed)
+
+    Example::
+
+        recorder = FrameRecorder('episode_0.gif', fps=10)
+        state = env.reset()
+        while not done:
+            recorder.add_frame(env.render(mode='rgb_array'))
+            state, reward, done, _ = env.step(agent.act(state))
+        recorder.close()
+
+    Args:
+        path (string): File to write
+        fps (int): Frames per second for videos and GIFs
+        max_queue (int): Maximum number of frames waiting to be written, ``add_frame`` blocks when reached
+        chunk_size (int): Number of frames per chunk of ``.npz`` files
+    '''
+
+    def __init__(self, path, fps=10, max_queue=256, chunk_size=64):
+
+        self.path = path
+        self.fps = fps
+        self.chunk_size = chunk_size
+
+        # Frames of the current .npz chunk:
+        self.frames = []
+        self.num_chunks = 0
+        self.zip_file = None
+        self.writer = None
+        self.error = None
+
+        if self.path.endswith('.npz'):
+            self.zip_file = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED)
+        else:
+            try:
+                import imageio
+            except ImportError:
+                raise Exception("Recording to '{}' needs 'imageio', install it or use a '.npz' file.".format(self.path))
+            self.writer = imageio.get_writer(self.path, fps=self.fps)
+
+        self.frame_queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self.write_frames, daemon=True)
+        self.thread.start()
+
+    def add_frame(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.frame_queue.put(np.asarray(frame, dtype=np.uint8))
+
+    def write_chunk(self):
+        if len(self.frames) == 0:
+            return
+        with self.zip_file.open('frames_{:05d}.npy'.format(self.num_chunks), 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.stack(self.frames))
+        self.frames = []
+        self.num_chunks += 1
+
+    def write_frames(self):
+        while True:
+            frame = self.frame_queue.get()
+            try:
+                if frame is None:
+                    if self.zip_file is not None:
+                        self.write_chunk()
+                    break
+                if self.writer is not None:
+                    self.writer.append_data(frame)
+                else:
+                    self.frames.append(frame)
+                    if len(self.frames) >= self.chunk_size:
+                        self.write_chunk()
+            except Exception as error:
+                self.error = error
+                if frame is None:
+                    break
+
+    def close(self):
+        '''
+        Waits until all frames are written and closes the file.
+        '''
+        self.frame_queue.put(None)
+        self.thread.join()
+
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            self.zip_file.close()
+
+        if self.error is not None:
+            raise self.error
+
+
+def load_frames(path):
+    '''
+    Returns all frames of a ``.npz`` recording of ``FrameRecorder`` as one array (num_frames, height, width, 3).
+    '''
+    with np.load(path) as archive:
+        keys = sorted(key for key in archive.files if key.startswith('frames'))
+        if len(keys) == 0:
+            return np.zeros((0, 0, 0, 3), dtype=np.uint8)
+        return np.concatenate([archive[key] for key in keys])
@@ -1,21 +1,29 @@
 import numpy as np
-from gym import spaces
 
 
 class BaseActDecoder:
 
-    def __init__(self, act_params, temp_db, simulator):
+    def __init__(self, act_params, temp_db, simulator, layout=None):
 
         self.temp_db = temp_db
         self.simulator = simulator
 
+        # Specs of older versions have no 'action_mask':
+        self.action_mask = False
         [setattr(self, k, v) for k, v in act_params.items()]
 
+        # Action layout of a spec (see layout()), the outputs were already checked:
+        if layout is not None:
+            [setattr(self, k, v) for k, v in layout.items()]
+            self.entry_keys = [tuple(elem) for elem in self.entry_keys]
+            self.compile_layout()
+            return
+
         all_outputs = ['coord', 'nodes','move', 'amount', 'v_amount', 'v_to_load', 'load_unload', 'v_load_unload', 'load', 'unload', 'v_load', 'v_unload', 'v_and_single_v', 'v_and_multi_v']
 
         binary_outputs = ['move','load_unload','v_load_unload','load_sep_unload','v_load_sep_unload']
 
-        value_outputs = ['amount','v_amount', 'load_sep_unload', 'v_load_sep_unload', 'v_to_load_index']
+        value_outputs = ['coord', 'nodes', 'amount','v_amount', 'load_sep_unload', 'v_load_sep_unload', 'v_to_load', 'v_to_load_index']
 
         coord_outputs = ['coord', 'nodes']
 
@@ -54,68 +62,89 @@ class BaseActDecoder:
         if 'v_and_single_v' in value_outputs  and 'v_and_multi_v' in value_outputs:
             raise Exception("'v_and_single_v' and 'v_and_multi_v' can't be both outputs")
 
+        # Maximum number of bins of discrete outputs (the act param, the arrays below replace it):
+        self.max_bins = self.discrete_bins
 
-        self.act_spaces = []
-        self.discrete_bins = np.array([])
-        self.discrete_max_val = np.array([])
-        self.contin_max_val = np.array([])
+        # Outputs in the order of the actions, each entry is one value (discrete entries use one bin per choice):
+        self.discrete_entries = []
+        self.contin_entries = []
+        self.entry_keys = []
 
-        
-        self.func_dict = {}
-        self.check_dict = {
-            'coord_bool': True,
-            'load_bool': True,
-            'unload_bool': True,
-            'v_load_bool': True,
-            'v_unload_bool': True,
-        }
-
-        self.value_dict = {
-            'coord': None,
-            'load': None,
-            'unload': None,
-            'v_load': None,
-            'v_unload': None,
-        }
+        # Coordinates are chosen as node index:
+        self.coord_from_node = False
 
         self.init_coord_act(val_output_set, binary_output_set)
         self.init_cargo_act(val_output_set, binary_output_set)
         self.init_v_transport_act(val_output_set, binary_output_set)
 
-        self.index_dict = {}
-        all_keys = list(self.discrete_set) + list(self.contin_set)
-        for i in range(len(all_keys)):
-            if all_keys[i] is not None:
-                if isinstance(all_keys[i], (list, tuple, np.ndarray)):
-                    for elem in all_keys[i]: self.index_dict[elem] = i
-                else:
-                    self.index_dict[all_keys[i]] = i
+        self.compile_layout()
 
 
+    def prep_action(self, name, num_choices, key):
+        '''
+        Adds the entries of an output to the action layout.
 
-    def prep_action(name, max_val, key=None, act_func=None):
-        
-        if name in self.discrete_set:
-            
-            if isinstance(max_val, (list, tuple, np.ndarray)):
-                for elem in max_val:
-                    self.discrete_bins = np.append(self.discrete_bins, min(elem, self.discrete_bins))
-                    self.discrete_max_val = np.append(self.discrete_max_val, elem)
-            else:
-                self.discrete_bins = np.append(self.discrete_bins, min(max_val, self.discrete_bins))
-                self.discrete_max_val = np.append(self.discrete_max_val, max_val)
-            self.discrete_keys.append(key)
+        Args:
+            name (string): Output name, decides if the output is discrete or contin
+            num_choices (int, list): Number of possible values of each entry (the decoded values are 0 to num_choices-1)
+            key (string, list): Keys of the decoded value (several keys can share the same value)
+        '''
+        entries = self.discrete_entries if name in self.discrete_set else self.contin_entries
+        positions = []
+        for elem in np.ravel(num_choices):
+            positions.append(len(entries))
+            entries.append(int(elem))
 
-        else:
-            if isinstance(max_val, (list, tuple, np.ndarray)):
-                for elem in max_val:
-                    self.contin_max_val = np.append(self.contin_max_val, elem)
-            else:
-                self.contin_max_val = np.append(self.contin_max_val, max_val)
-            self.contin_keys.append(key)
-        
-        if act_func is not None:
-            self.func_dict[key] = act_func
+        for elem in np.ravel(key):
+            self.entry_keys.append((name in self.discrete_set, str(elem), positions))
+
+
+    def layout(self):
+        '''
+        Returns the action layout (json serializable), which rebuilds the decoder without checking the outputs again.
+        '''
+        return {
+            'max_bins': int(self.max_bins),
+            'discrete_entries': list(self.discrete_entries),
+            'contin_entries': list(self.contin_entries),
+            'entry_keys': [[is_discrete, key, list(positions)] for is_discrete, key, positions in self.entry_keys],
+            'coord_from_node': self.coord_from_node,
+        }
+
+
+    def compile_layout(self):
+        '''
+        Precompiles the action layout into arrays, so all outputs are decoded in one vectorized pass:
+
+        - discrete_gather: (num_discrete, max_bins) indices of the bins of each discrete entry in the flat actions,
+          padded with the index of an appended -inf value
+        - discrete_scale, contin_max_val: scale the chosen bins and the contin values to the number of choices
+        - index_dict: value indices of each key (discrete values first, then contin values)
+        '''
+        discrete_choices = np.array(self.discrete_entries, dtype=int)
+
+        self.discrete_bins = np.maximum(np.minimum(discrete_choices, self.max_bins), 1)
+        self.discrete_max_val = discrete_choices - 1
+        self.contin_max_val = np.array(self.contin_entries, dtype=int) - 1
+
+        self.num_discrete = len(self.discrete_entries)
+        self.num_discrete_inputs = int(np.sum(self.discrete_bins))
+        self.num_inputs = self.num_discrete_inputs + len(self.contin_entries)
+        self.num_values = self.num_discrete + len(self.contin_entries)
+
+        max_bins = int(np.max(self.discrete_bins)) if self.num_discrete > 0 else 0
+        offsets = np.cumsum(self.discrete_bins) - self.discrete_bins
+        bin_range = np.arange(max_bins)
+        self.discrete_gather = np.where(
+            bin_range < self.discrete_bins[:, None], offsets[:, None] + bin_range, self.num_discrete_inputs
+        )
+        self.discrete_scale = self.discrete_max_val / np.maximum(self.discrete_bins - 1, 1)
+        self.value_max = np.concatenate([self.discrete_max_val, self.contin_max_val])
+
+        self.index_dict = {}
+        for is_discrete, key, positions in self.entry_keys:
+            offset = 0 if is_discrete else self.num_discrete
+            self.index_dict[key] = [offset + elem for elem in positions]
 
 
     def init_coord_act(self, val_output_set, binary_output_set):
@@ -130,27 +159,26 @@ class BaseActDecoder:
 
         # Binary addition:
         if 'move' in binary_output_set:
-            self.prep_action('move', 2, 'coord_bool', self.binary_check)
+            self.prep_action('move', 2, 'coord_bool')
 
+        coord_choices = [self.temp_db.grid[0] + 1, self.temp_db.grid[1] + 1]
 
         # both coordinates and nodes -> reward based on nearest node (option: move to node or move to coordinates?)
-        if 'coord' in val_output_set and 'node' in val_output_set:
-            self.prep_action('coord', [self.temp_db.grid[0], self.temp_db.grid[1]], 'compare_coord', None)
-            self.prep_action('nodes', self.temp_db.num_nodes, 'coord', self.to_node)
-            self.func_dict['compare_coord'] = self.compare_coord
-
+        if 'coord' in val_output_set and 'nodes' in val_output_set:
+            self.prep_action('coord', coord_choices, 'compare_coord')
+            self.prep_action('nodes', self.temp_db.num_nodes, 'coord')
+            self.coord_from_node = True
 
         # only coordinates:
         elif 'coord' in val_output_set:
-            self.prep_action('coord', [self.temp_db.grid[0], self.temp_db.grid[1]], 'coord', self.two_values)
+            self.prep_action('coord', coord_choices, 'coord')
 
         # only nodes:
-        elif 'node' in val_output_set:
-            self.prep_action('node', self.temp_db.num_nodes, 'coord', self.to_node)
+        elif 'nodes' in val_output_set:
+            self.prep_action('nodes', self.temp_db.num_nodes, 'coord')
+            self.coord_from_node = True
 
-        # automate:
-        else:
-            self.func_dict['coord'] = self.auto_value
+        # automate: no entries
 
     
     def init_cargo_act(self, val_output_set, binary_output_set):
@@ -170,28 +198,25 @@ class BaseActDecoder:
 
         # binary additions:
         if 'load_sep_unload' in binary_output_set:
-            self.prep_action('load_sep_unload', 2, 'load_bool', self.binary_check)
-            self.prep_action('load_sep_unload', 2, 'unload_bool', self.binary_check)
+            self.prep_action('load_sep_unload', 2, 'load_bool')
+            self.prep_action('load_sep_unload', 2, 'unload_bool')
 
         elif 'load_unload' in binary_output_set:
-            self.prep_action('load_sep_unload', 2, ['load_bool','unload_bool'], self.binary_check)
+            self.prep_action('load_unload', 2, ['load_bool','unload_bool'])
 
         # only 'amount'
         if 'amount' in val_output_set:
             max_val = max(self.temp_db.outputs_max['load'], self.temp_db.outputs_max['unload'])
-            self.prep_action('amount', max_val, ['load','unload'], self.one_value)
+            self.prep_action('amount', max_val + 1, ['load','unload'])
 
 
         # only 'load_sep_unload'
         elif 'load_sep_unload' in val_output_set:
-            self.prep_action('load_sep_unload', self.temp_db.outputs_max['load'], 'load', self.one_value)
-            self.prep_action('load_sep_unload', self.temp_db.outputs_max['unload'], 'unload', self.one_value)
+            self.prep_action('load_sep_unload', self.temp_db.outputs_max['load'] + 1, 'load')
+            self.prep_action('load_sep_unload', self.temp_db.outputs_max['unload'] + 1, 'unload')
 
 
-        # automate
-        else:
-            self.func_dict['load'] = self.auto_value
-            self.func_dict['unload'] = self.auto_value
+        # automate: no entries
         
 
             
@@ -202,112 +227,193 @@ class BaseActDecoder:
         - 'v_and_multi_v' chooses multiple vehicles (multi output contin, same outputs for discrete but not one hotted)
         '''
 
-        
+        # binary additions:
+        if 'v_load_sep_unload' in binary_output_set:
+            self.prep_action('v_load_sep_unload', 2, 'v_load_bool')
+            self.prep_action('v_load_sep_unload', 2, 'v_unload_bool')
+
+        elif 'v_load_unload' in binary_output_set:
+            self.prep_action('v_load_unload', 2, ['v_load_bool','v_unload_bool'])
+
+
+        if 'v_amount' in val_output_set:
+            self.prep_action('v_amount', self.temp_db.outputs_max['v_unload'] + 1, 'v_unload')
+
+        # specifying the vehicle to load
+        for name in ['v_to_load', 'v_to_load_index']:
+            if name in val_output_set:
+                self.prep_action(name, self.temp_db.outputs_max['v_load'], 'v_load')
+
+
+    def reset(self):
         '''
-        elif 'v_and_multi_v' in val_output_set:
-            v_load_cargo_funcs.append(self.v_multi_v)
-            v_unload_cargo_funcs.append(self.v_multi_v)
+        Caches the node table of the new instance, node actions choose depots first, then customers.
+        Nodes don't move, so node choices are resolved with a single lookup in node_coord_table.
         '''
+        self.node_table = np.array(self.temp_db.d_indices + self.temp_db.c_indices, dtype=int)
+        self.node_coord_table = self.temp_db.status_dict['n_coord'][self.node_table]
 
+        self.is_depot = np.zeros((len(self.temp_db.status_dict['n_coord'])), dtype=bool)
+        self.is_depot[self.temp_db.d_indices] = True
+        self.is_customer = np.zeros((len(self.temp_db.status_dict['n_coord'])), dtype=bool)
+        self.is_customer[self.temp_db.c_indices] = True
 
-                # binary additions:
-        if 'v_load_sep_unload' in binary_output_set:
-            self.prep_action('v_load_sep_unload', 2, 'v_load_bool', self.binary_check)
-            self.prep_action('v_load_sep_unload', 2, 'v_unload_bool', self.binary_check)
 
-        elif 'v_load_unload' in binary_output_set:
-            self.prep_action('v_load_sep_unload', 2, ['v_load_bool','v_unload_bool'], self.binary_check)
+    def node_indices(self, values):
+        '''
+        Node indices of node actions (single values or arrays), choices above the number of nodes are clipped.
+        '''
+        return self.node_table[np.minimum(values, len(self.node_table) - 1)]
 
 
-        if 'v_amount' in val_output_set:
-            self.prep_action('v_amount', self.temp_db.outputs_max['v_unload'], 'v_unload', self.one_value)
-        else:
-            self.func_dict['v_unload'] = self.auto_value
+    def flatten_actions(self, actions):
+        # Actions as list of outputs (for example one array of bins per discrete output) are concatenated:
+        if isinstance(actions, (list, tuple)) and any(np.ndim(elem) > 0 for elem in actions):
+            return np.concatenate([np.ravel(elem) for elem in actions]).astype(float)
+        return np.asarray(actions, dtype=float)
+
+
+    def decode_values(self, actions):
         '''
-        # only 'amount'
-        if 'v_amount' in val_output_set:
-            self.prep_action('v_amount', !!!!!!!, ['v_load','v_unload'], self.one_value)
+        Decodes flat actions (num_inputs) or a batch of actions (batch_size, num_inputs), for example of many vehicles
+        or envs, in one pass: argmax over the bins of all discrete outputs and scaling of all contin outputs.
 
-        
-        # only 'load_sep_unload'
-        elif 'v_load_sep_unload' in val_output_set:
-            self.prep_action('v_load_sep_unload', !!!!!!!, 'v_load', self.one_value)
-            self.prep_action('v_load_sep_unload', !!!!!!!, 'v_unload', self.one_value)
+        Returns:
+            np.ndarray: Integer values (num_values) or (batch_size, num_values), indexed by index_dict
         '''
+        actions = self.flatten_actions(actions)
+        batch = np.atleast_2d(actions)
 
-        # automate
-        
+        if batch.shape[-1] != self.num_inputs:
+            raise Exception('Actions had {} values, but the action layout has {} inputs.'.format(batch.shape[-1], self.num_inputs))
 
-        # specifying the vehicle to load
-        if 'v_to_load_index' in val_output_set:
-            self.prep_action('v_to_load_index', self.temp_db.outputs_max['v_load'], 'v_load', self.one_value)
-        else:
-            self.func_dict['v_load'] = self.auto_value
+        values = np.zeros((len(batch), self.num_values))
+        if self.num_discrete > 0:
+            logits = np.concatenate([batch[:, :self.num_discrete_inputs], np.full((len(batch), 1), -np.inf)], axis=1)
+            values[:, :self.num_discrete] = np.argmax(logits[:, self.discrete_gather], axis=-1) * self.discrete_scale
+        if self.num_values > self.num_discrete:
+            values[:, self.num_discrete:] = batch[:, self.num_discrete_inputs:] * self.contin_max_val
 
+        values = np.clip(np.round(values), 0, self.value_max).astype(int)
 
+        if actions.ndim == 1:
+            return values[0]
+        return values
 
-    def binary_check(self, key):
-        self.check_dict[key] = bool(self.actions[self.index_dict[key]])
 
+    def decode_batch(self, actions):
+        '''
+        Decodes a batch of actions (batch_size, num_inputs) and returns the values of each key (batch_size, num_entries).
+        '''
+        values = np.atleast_2d(self.decode_values(actions))
+        return {key: values[:, indices] for key, indices in self.index_dict.items()}
 
-    def one_value(self, key):
-        if self.check_dict[key+'_bool'] == True:
-            self.value_dict[key] = self.actions[self.index_dict[key]]
 
+    def check(self, values, key):
+        # Actions without binary output are always taken:
+        if key not in self.index_dict:
+            return True
+        return bool(values[self.index_dict[key][0]])
 
-    def two_values(self, key):
-        if self.check_dict[key+'_bool'] == True:
-            self.value_dict[key] = np.array([self.actions[self.index_dict[key]-1], self.actions[self.index_dict[key]]])
 
+    def value(self, values, key):
+        # None automates the action:
+        if key not in self.index_dict:
+            return None
+        return values[self.index_dict[key][0]]
 
-    def compare_coord(self, key):
-        chosen_coord = np.array([self.actions[self.index_dict[key]-1], self.actions[self.index_dict[key]]])
-        real_coord = self.value_dict['coord']
-        self.temp_db.action_signal['compare_coord'][self.temp_db.v_index] -= np.sum(np.abs(real_coord-chosen_coord))
 
+    def coord_value(self, values):
 
-    def to_node(self, key):
-        if self.check_dict[key+'_bool'] == True:
-            cur_node_coord = self.temp_db.status_dict['d_coord']+self.temp_db.status_dict['c_coord']
-            self.value_dict[key] = cur_node_coord[self.actions[self.index_dict[key]]]
+        if 'coord' not in self.index_dict:
+            return None
 
+        if not self.coord_from_node:
+            return values[self.index_dict['coord']]
 
-    def auto_value(self, key):
-        if self.check_dict[key+'_bool'] == True:
-            self.value_dict[key] = None
+        coord = self.node_coord_table[min(values[self.index_dict['coord'][0]], len(self.node_table) - 1)]
 
+        # Both coordinates and nodes: signal based on the distance of the chosen coordinates to the node
+        if 'compare_coord' in self.index_dict:
+            chosen_coord = values[self.index_dict['compare_coord']]
+            self.temp_db.signals_dict['compare_coord'][self.temp_db.cur_v_index] -= np.sum(np.abs(coord - chosen_coord))
 
-    def decode_discrete(self, actions):
-        for i in range(len(actions)):
-            actions[i] = np.argmax(actions[i]) / (self.discrete_bins[i]-1)
+        return coord
 
-        return np.round(actions*self.discrete_max_val).astype(int)
 
+    def action_masks(self):
+        '''
+        Boolean masks of the feasible choices of the current vehicle, computed from the status_dict:
 
-    def decode_contin(self, actions):
-        return np.round(actions*self.contin_max_val).astype(int)
+        - 'nodes': nodes in range of the vehicle
+        - 'customers': customers with remaining demand
+        - 'depots_in_range': depots in range of the vehicle
+        - 'unload': customers at the position of the vehicle with demand, if the vehicle has items
+        - 'load': depots at the position of the vehicle with stock, if the vehicle has free cargo
+        - 'v_to_load': free loadable vehicles at the position of the vehicle, if it can load vehicles
+        - 'v_to_unload': vehicles transported by the vehicle
 
+        Node masks are ordered like the node actions (depots first, then customers), vehicle masks by vehicle index.
+        '''
+        v_index = int(self.temp_db.cur_v_index)
+        status_dict = self.temp_db.status_dict
+        constants_dict = self.temp_db.constants_dict
 
-    def decode_actions(self, actions):
-        if self.temp_db.status_dict['v_free'][self.temp_db.cur_v_index] == 1:
+        is_depot = self.is_depot
+        is_customer = self.is_customer
 
-            if len(self.discrete_max_val) != 0: self.actions = decode_discrete(actions[:len(self.discrete_max_val)]).ravel()
-            if len(self.contin_max_val) != 0: self.actions = decode_contin(actions[-len(self.contin_max_val):]).ravel()
+        # Distances and range (nan is unlimited):
+        direction = status_dict['n_coord'] - status_dict['v_coord'][v_index]
+        if constants_dict['v_travel_type'][v_index] == 0:
+            n_distance = np.sum(np.abs(direction), axis=1)
+        else:
+            n_distance = np.linalg.norm(direction, axis=1)
+        v_range = status_dict['v_range'][v_index] if 'v_range' in status_dict else np.nan
+        in_range = n_distance <= v_range if not np.isnan(v_range) else np.ones((self.temp_db.num_nodes), dtype=bool)
 
-            [self.func_dict[key](key) for key in self.func_dict.keys()]
+        n_items = status_dict['n_items']
+        at_node = n_distance == 0
 
-            if self.check_dict['v_unload_bool']: self.simulator.unload_vehicle(self.value_dict['v_unload'])
-            if self.check_dict['v_load_bool']:   self.simulator.load_vehicle(self.value_dict['v_load'])
-            if self.check_dict['unload_bool']:   self.simulator.unload_items(self.value_dict['unload'])
-            if self.check_dict['load_bool']:     self.simulator.load_items(self.value_dict['load'])
-            if self.check_dict['coord_bool']:    self.simulator.set_destination(self.value_dict['coord'])
+        v_items = status_dict['v_items'][v_index]
+        max_v_items = constants_dict['max_v_items'][v_index]
+        free_cargo = np.isnan(max_v_items) or v_items < max_v_items
 
-            
-            #self.simulator.recharge_range(self.temp_db.v_index)
-            
-            #self.temp_db.signals_dict['v_free'][self.temp_db.cur_v_index] += 1
+        # Vehicles at the same position:
+        at_vehicle = np.sum(np.abs(status_dict['v_coord'] - status_dict['v_coord'][v_index]), axis=1) == 0
+        at_vehicle[v_index] = False
+
+        if 'loaded_v' in status_dict:
+            max_loaded_v = constants_dict['max_loaded_v'][v_index]
+            free_v_cap = np.isnan(max_loaded_v) or status_dict['loaded_v'][v_index] < max_loaded_v
+        else:
+            free_v_cap = False
+
+        v_to_unload = np.zeros((self.temp_db.num_vehicles), dtype=bool)
+        v_to_unload[self.temp_db.v_transporting_v[v_index]] = True
+
+        table = self.node_table
+        return {
+            'nodes': in_range[table],
+            'customers': (is_customer & (n_items > 0))[table],
+            'depots_in_range': (is_depot & in_range)[table],
+            'unload': (is_customer & at_node & (n_items > 0) & (v_items > 0))[table],
+            'load': (is_depot & at_node & (np.isnan(n_items) | (n_items > 0)) & free_cargo)[table],
+            'v_to_load': (
+                at_vehicle & (constants_dict['v_loadable'] == 1) & (status_dict['v_free'] == 1)
+                & bool(constants_dict['v_is_truck'][v_index]) & free_v_cap
+            ),
+            'v_to_unload': v_to_unload,
+        }
+
+    def decode_actions(self, actions):
+        if self.temp_db.status_dict['v_free'][self.temp_db.cur_v_index] == 1:
 
-        #else:
-            #self.temp_db.signals_dict['v_free'][self.temp_db.cur_v_index] -= 1
+            values = self.decode_values(actions) if self.num_inputs > 0 else None
 
+            # 'v_load' is the index of the vehicle to load, the other values are amounts:
+            if self.check(values, 'v_unload_bool'): self.simulator.unload_vehicle(amount=self.value(values, 'v_unload'))
+            if self.check(values, 'v_load_bool'):   self.simulator.load_vehicle(self.value(values, 'v_load'))
+            if self.check(values, 'unload_bool'):   self.simulator.unload_items(amount=self.value(values, 'unload'))
+            if self.check(values, 'load_bool'):     self.simulator.load_items(amount=self.value(values, 'load'))
+            if self.check(values, 'coord_bool'):    self.simulator.set_destination(self.coord_value(values))
 
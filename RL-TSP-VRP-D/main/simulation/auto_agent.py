@@ -11,6 +11,9 @@ class BaseAutoAgent:
 
         self.temp_db = temp_db
 
+    def reset(self):
+        # Called after the simulation was reset (for agents that plan ahead):
+        pass
 
     def find_destination(self):
 
@@ -5,10 +5,13 @@ import numpy as np
 # Used for obj creation:
 # ----------------------------------------------------------------------------------------------------------------
 
-def param_interpret(var):
+def param_interpret(var, rng=np.random):
+    # rng is the np.random.Generator of the env (temp_db.rng), uses the global np.random if not passed
     if isinstance(var, (list, tuple, np.ndarray)):
         if len(var) == 2:
-            return np.random.randint(var[0],var[1]+1)
+            if isinstance(rng, np.random.Generator):
+                return rng.integers(var[0],var[1]+1)
+            return rng.randint(var[0],var[1]+1)
     return var
 
 def max_param_val(var):
@@ -16,8 +19,17 @@ def max_param_val(var):
         return np.max(var)
     return var
 
-def random_coordinates(grid):
-    return (np.random.randint(0,grid[0]+1), np.random.randint(0,grid[1]+1))
+def random_coordinates(grid, rng=np.random):
+    if isinstance(rng, np.random.Generator):
+        return (rng.integers(0,grid[0]+1), rng.integers(0,grid[1]+1))
+    return (rng.randint(0,grid[0]+1), rng.randint(0,grid[1]+1))
+
+def spawn_seeds(seed, num):
+    '''
+    Creates independent child seeds (np.random.SeedSequence) for parallel envs, for example:
+    envs[i].seed(child_seeds[i]). The streams don't overlap and are reproducible for the same seed.
+    '''
+    return np.random.SeedSequence(seed).spawn(num)
 
 def return_indices_of_a(list_a, list_b):
     return [i for i, v in enumerate(list_a) if v in set(list_b)]
@@ -0,0 +1,458 @@
+'''
+Classical construction and improvement heuristics as baselines: Clarke-Wright savings, 2-opt and Or-opt
+restricted to neighbour lists, and a split of customers to depot-launched drones (or robots).
+The routes are followed in the simulation by the HeuristicAutoAgent.
+'''
+import math
+import time
+import numpy as np
+from collections import deque
+
+from main.simulation.auto_agent import BaseAutoAgent
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+# Distances:
+# ----------------------------------------------------------------------------------------------------------------
+
+def distances(coord_a, coord_b, p=1):
+    '''
+    Row-wise distances, p=1 for vehicles on streets and p=2 for arial vehicles (like the vehicle distances).
+    '''
+    return np.linalg.norm(np.asarray(coord_a) - np.asarray(coord_b), ord=p, axis=-1)
+
+
+def distance_func(points, p=1):
+    '''
+    Returns a scalar distance function between point indices, plain python is faster than numpy for single pairs.
+    '''
+    points = [tuple(elem) for elem in np.asarray(points, dtype=float)]
+    if p == 1:
+        return lambda i, j: abs(points[i][0] - points[j][0]) + abs(points[i][1] - points[j][1])
+    return lambda i, j: math.hypot(points[i][0] - points[j][0], points[i][1] - points[j][1])
+
+
+def neighbour_lists(coords, k=16, p=1):
+    '''
+    Indices of the k nearest other points of each point, shape (num_points, k).
+    Uses a KD-tree if scipy is installed, otherwise chunked brute force.
+    '''
+    coords = np.asarray(coords, dtype=float)
+    n = len(coords)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.zeros((n, 0), dtype=int)
+
+    if cKDTree is not None:
+        _, indices = cKDTree(coords).query(coords, k + 1, p=p)
+        # Points on the same coordinates can come before the point itself, so it's filtered by index
+        # (if it isn't among the results, the last neighbour is dropped instead):
+        is_other = indices != np.arange(n)[:, None]
+        order = np.argsort(~is_other, axis=1, kind='stable')
+        return np.take_along_axis(indices, order, axis=1)[:, :k]
+
+    neighbours = np.zeros((n, k), dtype=int)
+    for start in range(0, n, 1024):
+        end = min(start + 1024, n)
+        dist = distances(coords[start:end, None], coords[None], p)
+        dist[np.arange(end - start), np.arange(start, end)] = np.inf
+        nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(dist, nearest, axis=1), axis=1)
+        neighbours[start:end] = np.take_along_axis(nearest, order, axis=1)
+    return neighbours
+
+
+def route_length(route, depot, coords, p=1):
+    if len(route) == 0:
+        return 0.0
+    points = np.vstack([depot, coords[route], depot])
+    return float(np.sum(distances(points[:-1], points[1:], p)))
+
+
+# Construction:
+# ----------------------------------------------------------------------------------------------------------------
+
+def savings_routes(depot, coords, demands, capacity=np.inf, p=1, k=16):
+    '''
+    Clarke-Wright savings, only for pairs of neighbours. Routes are merged at their ends, the smaller route
+    is appended to the larger one, so merging all customers takes O(n log n).
+
+    Returns:
+        list: Routes as lists of customer indices (indices of coords), without the depot
+    '''
+    m = len(coords)
+    if m == 0:
+        return []
+
+    neighbours = neighbour_lists(coords, k, p)
+    pairs = np.stack([np.repeat(np.arange(m), neighbours.shape[1]), neighbours.ravel()], axis=1)
+    pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+
+    depot_dist = distances(coords, depot, p)
+    savings = depot_dist[pairs[:, 0]] + depot_dist[pairs[:, 1]] - distances(coords[pairs[:, 0]], coords[pairs[:, 1]], p)
+    order = np.argsort(-savings)
+    pairs = pairs[order[savings[order] > 0]]
+
+    route_of = np.arange(m)
+    routes = {i: deque([i]) for i in range(m)}
+    loads = {i: float(demands[i]) for i in range(m)}
+
+    for a, b in pairs.tolist():
+        r_a, r_b = route_of[a], route_of[b]
+        if r_a == r_b or loads[r_a] + loads[r_b] > capacity:
+            continue
+
+        A, B = routes[r_a], routes[r_b]
+        a_last, b_first = A[-1] == a, B[0] == b
+        if not (a_last or A[0] == a) or not (b_first or B[-1] == b):
+            continue
+
+        # Join with a next to b, keep the larger deque:
+        if a_last and b_first:
+            keep, lose = (r_a, r_b) if len(A) >= len(B) else (r_b, r_a)
+            A.extend(B) if keep == r_a else B.extendleft(reversed(A))
+        elif not a_last and not b_first:
+            keep, lose = (r_b, r_a) if len(B) >= len(A) else (r_a, r_b)
+            B.extend(A) if keep == r_b else A.extendleft(reversed(B))
+        elif not a_last and b_first:
+            keep, lose = (r_b, r_a) if len(B) >= len(A) else (r_a, r_b)
+            B.extendleft(A) if keep == r_b else A.extendleft(B)
+        else:
+            keep, lose = (r_a, r_b) if len(A) >= len(B) else (r_b, r_a)
+            A.extend(reversed(B)) if keep == r_a else B.extend(reversed(A))
+
+        for i in routes[lose]:
+            route_of[i] = keep
+        loads[keep] += loads.pop(lose)
+        del routes[lose]
+
+    return [list(route) for route in routes.values()]
+
+
+def join_routes(routes, depot, coords, p=1):
+    '''
+    Joins routes to one route (for vehicles without capacity limit), always continuing with the route
+    that has the nearest end.
+    '''
+    if len(routes) <= 1:
+        return [elem for route in routes for elem in route]
+
+    ends = np.array([[coords[route[0]], coords[route[-1]]] for route in routes])
+    remaining = np.ones(len(routes), dtype=bool)
+    position = np.asarray(depot, dtype=float)
+    joined = []
+
+    for _ in range(len(routes)):
+        dist = distances(ends, position[None, None], p)
+        dist[~remaining] = np.inf
+        r, end = np.unravel_index(np.argmin(dist), dist.shape)
+        route = routes[r] if end == 0 else routes[r][::-1]
+        joined.extend(route)
+        remaining[r] = False
+        position = coords[route[-1]]
+
+    return joined
+
+
+def split_route(route, num_parts, depot, coords, p=1):
+    '''
+    Splits one route into num_parts consecutive parts of about the same length.
+    '''
+    if num_parts <= 1 or len(route) <= 1:
+        return [route]
+
+    points = np.vstack([depot, coords[route]])
+    cum_length = np.cumsum(distances(points[:-1], points[1:], p))
+    bounds = np.searchsorted(cum_length, cum_length[-1] * np.arange(1, num_parts) / num_parts)
+    return [part.tolist() for part in np.split(np.asarray(route), bounds) if len(part) > 0]
+
+
+# Improvement:
+# ----------------------------------------------------------------------------------------------------------------
+
+def two_opt(route, depot, coords, p=1, k=16, deadline=None):
+    '''
+    2-opt on a closed route (depot at both ends), only testing edges to the k nearest neighbours of each point.
+    '''
+    n = len(route) + 1
+    if n < 4:
+        return route
+
+    points = np.vstack([depot, coords[route]])
+    dist = distance_func(points, p)
+    neighbours = neighbour_lists(points, k, p).tolist()
+
+    tour = np.arange(n)
+    pos = np.arange(n)
+
+    improved = True
+    while improved and (deadline is None or time.perf_counter() < deadline):
+        improved = False
+        for a in range(n):
+            for c in neighbours[a]:
+                i, j = pos[a], pos[c]
+                a_next, c_next = tour[(i + 1) % n], tour[(j + 1) % n]
+                # Moves with adjacent or identical edges don't change the route:
+                if c == a or c == a_next or a == c_next:
+                    continue
+
+                delta = dist(a, c) + dist(a_next, c_next) - dist(a, a_next) - dist(c, c_next)
+                if delta < -1e-9:
+                    # Reverse the part between the two removed edges:
+                    start, end = (i + 1, j) if i < j else (j + 1, i)
+                    tour[start:end + 1] = tour[start:end + 1][::-1]
+                    pos[tour[start:end + 1]] = np.arange(start, end + 1)
+                    improved = True
+                    break
+
+    # Rotate, so the route starts after the depot:
+    tour = np.roll(tour, -int(pos[0]))
+    return [route[t - 1] for t in tour[1:]]
+
+
+def or_opt(route, depot, coords, p=1, k=16, deadline=None):
+    '''
+    Or-opt on a closed route: moves segments of 1 to 3 customers (also reversed) to a position next to
+    one of the k nearest neighbours of the segment ends.
+    '''
+    n = len(route) + 1
+    if n < 4:
+        return route
+
+    points = np.vstack([depot, coords[route]])
+    dist = distance_func(points, p)
+    neighbours = neighbour_lists(points, k, p).tolist()
+
+    tour = list(range(n))
+
+    pos = list(range(n))
+
+    improved = True
+    while improved and (deadline is None or time.perf_counter() < deadline):
+        improved = False
+
+        for seg_len in (1, 2, 3):
+            for i in range(1, n - seg_len + 1):
+                if deadline is not None and time.perf_counter() > deadline:
+                    break
+                segment = tour[i:i + seg_len]
+                first, last = segment[0], segment[-1]
+                prev, succ = tour[i - 1], tour[(i + seg_len) % n]
+                remove_gain = dist(prev, first) + dist(last, succ) - dist(prev, succ)
+
+                for c in set(neighbours[first] + neighbours[last]):
+                    j = pos[c]
+                    c_next = tour[(j + 1) % n]
+                    if c in segment or c_next in segment:
+                        continue
+
+                    insert = dist(c, first) + dist(last, c_next) - dist(c, c_next)
+                    insert_rev = dist(c, last) + dist(first, c_next) - dist(c, c_next)
+                    if min(insert, insert_rev) < remove_gain - 1e-9:
+                        if insert_rev < insert:
+                            segment = segment[::-1]
+                        rest = tour[:i] + tour[i + seg_len:]
+                        j = rest.index(c)
+                        tour = rest[:j + 1] + segment + rest[j + 1:]
+                        for position, node in enumerate(tour):
+                            pos[node] = position
+                        improved = True
+                        break
+
+    start = tour.index(0)
+    tour = tour[start:] + tour[:start]
+    return [route[t - 1] for t in tour[1:]]
+
+
+# Drone split:
+# ----------------------------------------------------------------------------------------------------------------
+
+def split_depot_launched(depot, coords, demands, vehicles, budget, p=2):
+    '''
+    Assigns customers to vehicles, that serve one customer per trip from the depot (drones or robots).
+    Customers nearest to the depot are assigned first, as long as demand, range and the budget allow it.
+
+    Args:
+        vehicles (list): Dicts with 'capacity' and 'range' of each vehicle (np.inf if unlimited)
+        budget (float): Maximum travel distance of each vehicle, to balance the work with the trucks
+
+    Returns:
+        list: Customer indices for each vehicle
+    '''
+    trips = [[] for _ in vehicles]
+    if len(vehicles) == 0 or len(coords) == 0:
+        return trips
+
+    trip_dist = 2 * distances(coords, depot, p)
+    used_range = np.zeros(len(vehicles))
+
+    for c in np.argsort(trip_dist):
+        for v in np.argsort(used_range):
+            if (demands[c] <= vehicles[v]['capacity']
+                and used_range[v] + trip_dist[c] <= min(vehicles[v]['range'], budget)
+                ):
+                trips[v].append(int(c))
+                used_range[v] += trip_dist[c]
+                break
+
+    return trips
+
+
+# Planning on the temporary database:
+# ----------------------------------------------------------------------------------------------------------------
+
+def nan_to_inf(value):
+    return np.inf if value is None or np.isnan(value) else float(value)
+
+
+def plan_routes(temp_db, k=16, time_limit=1.0, use_drones=True):
+    '''
+    Plans routes for all vehicles of a reset temp_db. Customers are assigned to their nearest depot,
+    loadable non-truck vehicles (drones, robots) serve near customers directly from their depot
+    and the trucks serve the rest with savings routes improved by 2-opt and Or-opt.
+
+    Returns:
+        dict: Stops (node indices, starting and ending at the depot) for each vehicle index
+    '''
+    deadline = time.perf_counter() + time_limit
+
+    n_coord = temp_db.status_dict['n_coord']
+    n_items = np.nan_to_num(temp_db.status_dict['n_items'])
+    v_coord = temp_db.status_dict['v_coord']
+
+    d_indices = np.array(temp_db.d_indices, dtype=int)
+    c_indices = np.array([c for c in temp_db.c_indices if n_items[c] > 0], dtype=int)
+    v_indices = np.array(temp_db.v_indices, dtype=int)
+
+    is_truck = temp_db.constants_dict['v_is_truck'][v_indices].astype(bool)
+    is_arial = temp_db.constants_dict['v_travel_type'][v_indices].astype(bool)
+    no_limit = np.full((temp_db.num_vehicles), np.nan)
+    max_cargo = np.asarray(temp_db.constants_dict.get('max_v_items', no_limit), dtype=float)[v_indices]
+    max_range = np.asarray(temp_db.constants_dict.get('max_v_range', no_limit), dtype=float)[v_indices]
+
+    # Depot of each vehicle and customer (only depots with vehicles):
+    v_depot = d_indices[np.argmin(distances(v_coord[v_indices][:, None], n_coord[d_indices][None], 1), axis=1)]
+    used_depots = np.unique(v_depot)
+    c_depot = used_depots[np.argmin(distances(n_coord[c_indices][:, None], n_coord[used_depots][None], 1), axis=1)] if len(c_indices) > 0 else c_indices
+
+    plans = {int(v): [] for v in v_indices}
+
+    for d in used_depots:
+        customers = c_indices[c_depot == d]
+        trucks = [i for i in range(len(v_indices)) if v_depot[i] == d and is_truck[i]]
+        others = [i for i in range(len(v_indices)) if v_depot[i] == d and not is_truck[i]]
+        if len(trucks) == 0:
+            trucks, others = others, []
+        if len(customers) == 0 or len(trucks) == 0:
+            continue
+
+        depot = n_coord[d]
+        coords = n_coord[customers]
+        demands = n_items[customers]
+
+        p = 2 if all(is_arial[trucks]) else 1
+        capacity = min(nan_to_inf(max_cargo[i]) for i in trucks)
+
+        # Depot-launched trips of drones/robots, balanced with the estimated truck routes:
+        served = np.zeros(len(customers), dtype=bool)
+        if use_drones and len(others) > 0:
+            routes = savings_routes(depot, coords, demands, capacity, p, k)
+            budget = sum(route_length(route, depot, coords, p) for route in routes) / (len(trucks) + len(others))
+            vehicles = [{'capacity': nan_to_inf(max_cargo[i]), 'range': nan_to_inf(max_range[i])} for i in others]
+            trips = split_depot_launched(depot, coords, demands, vehicles, budget, 2 if all(is_arial[others]) else 1)
+            for i, trip in zip(others, trips):
+                plans[int(v_indices[i])] = [int(d)] + [stop for c in trip for stop in (int(customers[c]), int(d))]
+                served[trip] = True
+
+        # Truck routes:
+        rest = np.flatnonzero(~served)
+
+        routes = savings_routes(depot, coords[rest], demands[rest], capacity, p, k)
+        if capacity == np.inf:
+            routes = split_route(join_routes(routes, depot, coords[rest], p), len(trucks), depot, coords[rest], p)
+
+        routes = [two_opt(route, depot, coords[rest], p, k, deadline) for route in routes]
+        routes = [or_opt(route, depot, coords[rest], p, k, deadline) for route in routes]
+
+        # Longest routes first to the truck with the least work:
+        work = np.zeros(len(trucks))
+        stops = [[int(d)] for _ in trucks]
+        for route in sorted(routes, key=lambda route: -route_length(route, depot, coords[rest], p)):
+            t = int(np.argmin(work))
+            work[t] += route_length(route, depot, coords[rest], p)
+            stops[t] += [int(customers[rest[c]]) for c in route] + [int(d)]
+
+        for t, i in enumerate(trucks):
+            plans[int(v_indices[i])] = stops[t]
+
+    return plans
+
+
+# Heuristic Auto Agent:
+# ----------------------------------------------------------------------------------------------------------------
+
+class HeuristicAutoAgent(BaseAutoAgent):
+    '''
+    Follows routes planned with ``plan_routes`` at each reset, use with ``BuildEnvironment.compile(AutoAgent=HeuristicAutoAgent)``
+    and dummy actions (or actions without outputs for the automated parts). Vehicles are not loaded onto other vehicles.
+
+    Args:
+        temp_db (BaseTempDatabase): Database of the simulation
+        num_neighbours (int): Size of the neighbour lists of the heuristics
+        time_limit (float): Time limit in seconds for the improvement heuristics per reset
+        use_drones (bool): Plans depot-launched trips for drones and robots
+    '''
+    def __init__(self, temp_db, num_neighbours=16, time_limit=1.0, use_drones=True):
+
+        super().__init__(temp_db)
+
+        self.num_neighbours = num_neighbours
+        self.time_limit = time_limit
+        self.use_drones = use_drones
+
+    def reset(self):
+        self.plans = plan_routes(self.temp_db, self.num_neighbours, self.time_limit, self.use_drones)
+        self.next_stop = np.zeros((self.temp_db.num_vehicles), dtype=int)
+        self.depot_set = set(self.temp_db.d_indices)
+        self.customer_set = set(self.temp_db.c_indices)
+
+    def current_stop(self):
+        v_index = int(self.temp_db.cur_v_index)
+        plan = self.plans.get(v_index, [])
+        if self.next_stop[v_index] < len(plan):
+            return plan[self.next_stop[v_index]]
+        return None
+
+    def find_destination(self):
+        v_index = int(self.temp_db.cur_v_index)
+        n_index = self.current_stop()
+
+        # Arrived at the current stop (items were already unloaded/loaded in this step), continue with the next:
+        if n_index is not None and self.temp_db.same_coord(self.temp_db.status_dict['n_coord'][n_index]):
+            self.next_stop[v_index] += 1
+            n_index = self.current_stop()
+
+        self.temp_db.status_dict['v_to_n'][v_index] = n_index
+
+        if n_index is None:
+            return None
+        return self.temp_db.status_dict['n_coord'][n_index]
+
+    def find_v_to_load(self):
+        return None
+
+    def find_customer(self):
+        n_index = self.current_stop()
+        if n_index in self.customer_set:
+            return n_index
+        return None
+
+    def find_depot(self):
+        n_index = self.current_stop()
+        if n_index in self.depot_set:
+            return n_index
+        return None
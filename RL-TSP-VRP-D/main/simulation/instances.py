@@ -0,0 +1,187 @@
+'''
+Pre-generated instances, stored as one ``.npy`` file per field, that the node and vehicle creators can read
+instead of drawing random coordinates and items at each reset.
+'''
+import os
+import json
+import numpy as np
+
+
+# Layout of a dataset directory:
+# - meta.json:       num_instances, num_depots, num_customers, num_vehicles, grid, max_demand
+# - n_coord.npy:     (num_instances, num_nodes, 2) node coordinates, depots first then customers
+# - n_items.npy:     (num_instances, num_nodes) initial items (stock of depots, demand of customers), nan for default
+# - v_depot.npy:     (num_instances, num_vehicles) index of the start depot of each vehicle
+# - v_max_cargo.npy: (num_instances, num_vehicles) cargo capacity of each vehicle, nan for default (optional)
+
+DATASET_FIELDS = ['n_coord', 'n_items', 'v_depot', 'v_max_cargo']
+
+
+def write_dataset(path, n_coord, n_items, v_depot, num_depots, grid, v_max_cargo=None, extra_meta=None):
+    '''
+    Writes instances as dataset directory, all arrays have the number of instances as first dimension.
+    meta.json is written last and atomically (extended by extra_meta), so a directory with meta.json is complete.
+    '''
+    os.makedirs(path, exist_ok=True)
+
+    n_coord = np.asarray(n_coord, dtype=np.float64)
+    arrays = {
+        'n_coord': n_coord,
+        'n_items': np.asarray(n_items, dtype=np.float64),
+        'v_depot': np.asarray(v_depot, dtype=np.int64),
+    }
+    if v_max_cargo is not None:
+        arrays['v_max_cargo'] = np.asarray(v_max_cargo, dtype=np.float64)
+
+    for key, array in arrays.items():
+        np.save(os.path.join(path, key + '.npy'), array)
+
+    meta = {
+        'num_instances': int(n_coord.shape[0]),
+        'num_depots': int(num_depots),
+        'num_customers': int(n_coord.shape[1] - num_depots),
+        'num_vehicles': int(arrays['v_depot'].shape[1]),
+        'grid': [int(elem) for elem in grid],
+        'max_demand': float(np.nan_to_num(np.nanmax(arrays['n_items'][:, num_depots:]))) if n_coord.shape[1] > num_depots else 0.0,
+        'max_cargo': float(np.nanmax(arrays['v_max_cargo'])) if v_max_cargo is not None and not np.all(np.isnan(arrays['v_max_cargo'])) else None,
+    }
+    meta.update(extra_meta or {})
+
+    temp_path = os.path.join(path, 'meta.json.{}.tmp'.format(os.getpid()))
+    with open(temp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(temp_path, os.path.join(path, 'meta.json'))
+
+
+def generate_instances(
+        path,
+        num_instances,
+        num_depots=1,
+        num_customers=10,
+        num_vehicles=2,
+        grid=[10,10],
+        demand=[1,1],
+        depot_stock=None,
+        max_cargo=None,
+        seed=None,
+    ):
+    '''
+    Generates random instances with integer coordinates on the grid (like ``random_coordinates``)
+    and writes them with ``write_dataset``.
+
+    Args:
+        path (string): Directory of the dataset
+        num_instances (int): Number of instances
+        num_depots (int): Depots per instance
+        num_customers (int): Customers per instance
+        num_vehicles (int): Vehicles per instance, each starts at a random depot
+        grid (list): Size of the grid
+        demand (list): Minimum and maximum demand of the customers
+        depot_stock (int): Stock of the depots, None to use the depot parameter of the env
+        max_cargo (list): Minimum and maximum cargo capacity of the vehicles, None to use the vehicle parameter
+        seed (int): Seed of the random generator
+    '''
+    rng = np.random.default_rng(seed)
+    num_nodes = num_depots + num_customers
+
+    n_coord = np.stack([
+        rng.integers(0, grid[0] + 1, size=(num_instances, num_nodes)),
+        rng.integers(0, grid[1] + 1, size=(num_instances, num_nodes)),
+    ], axis=-1)
+
+    n_items = np.full((num_instances, num_nodes), np.nan)
+    n_items[:, num_depots:] = rng.integers(demand[0], demand[1] + 1, size=(num_instances, num_customers))
+    if depot_stock is not None:
+        n_items[:, :num_depots] = depot_stock
+
+    v_depot = rng.integers(0, num_depots, size=(num_instances, num_vehicles))
+
+    v_max_cargo = None
+    if max_cargo is not None:
+        v_max_cargo = rng.integers(max_cargo[0], max_cargo[1] + 1, size=(num_instances, num_vehicles))
+
+    write_dataset(path, n_coord, n_items, v_depot, num_depots, grid, v_max_cargo)
+
+
+class InstanceDataset:
+    '''
+    Reads a dataset directory with memory-mapped arrays, so only the rows of the used instances are loaded.
+
+    Args:
+        path (string): Directory of the dataset
+        order (string): 'sequential' cycles through the instances (fixed validation sets), 'random' draws them
+        mmap (bool): Memory-maps the arrays instead of loading them
+    '''
+    def __init__(self, path, order='sequential', mmap=True):
+
+        if order not in ['sequential', 'random']:
+            raise Exception("order was set to '{}', but has to be 'sequential' or 'random'".format(order))
+
+        self.path = path
+        self.order = order
+
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        # The grid of the env has integer size:
+        self.meta['grid'] = [int(np.ceil(elem)) for elem in self.meta['grid']]
+
+        self.arrays = {}
+        for key in DATASET_FIELDS:
+            file = os.path.join(path, key + '.npy')
+            if os.path.exists(file):
+                self.arrays[key] = np.load(file, mmap_mode='r' if mmap else None)
+
+        self.num_instances = self.meta['num_instances']
+        self.num_depots = self.meta['num_depots']
+        self.num_customers = self.meta['num_customers']
+        self.num_vehicles = self.meta['num_vehicles']
+
+        # Largest cargo capacity over all instances (None if the vehicle parameter are used):
+        self.max_cargo = self.meta.get('max_cargo')
+        if 'max_cargo' not in self.meta and 'v_max_cargo' in self.arrays and not np.all(np.isnan(self.arrays['v_max_cargo'])):
+            self.max_cargo = float(np.nanmax(self.arrays['v_max_cargo']))
+
+        self.next_index = 0
+        # Instance chosen for the next reset (see select), overrides the order once:
+        self.selected_index = None
+
+    def __len__(self):
+        return self.num_instances
+
+    def __getitem__(self, k):
+        '''
+        Returns the arrays of instance k as read-only views.
+        '''
+        return {key: array[k] for key, array in self.arrays.items()}
+
+    def next_instance(self, rng):
+        '''
+        Returns the index of the instance for the next reset.
+        '''
+        if self.selected_index is not None:
+            k = self.selected_index
+            self.selected_index = None
+            self.next_index = (k + 1) % self.num_instances
+            return k
+
+        if self.order == 'random':
+            return int(rng.integers(0, self.num_instances))
+
+        k = self.next_index
+        self.next_index = (self.next_index + 1) % self.num_instances
+        return k
+
+    def select(self, k):
+        '''
+        Uses instance k at the next reset (sequential order continues with k+1).
+        '''
+        if not 0 <= k < self.num_instances:
+            raise Exception('instance was {}, but the dataset has {} instances'.format(k, self.num_instances))
+        self.selected_index = int(k)
+
+    def rewind(self):
+        '''
+        Starts the sequential order again with the first instance.
+        '''
+        self.next_index = 0
+        self.selected_index = None
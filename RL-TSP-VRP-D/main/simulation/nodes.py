@@ -6,6 +6,7 @@ import numpy as np
 
 from main.simulation.restrictions import RestrValueObject
 from main.simulation.common_sim_func import param_interpret, random_coordinates, max_param_val
+from main.simulation.temp_database import insert_at_array
 
 '''
 NODE PARAMETER
@@ -19,20 +20,12 @@ init_items: (str, NoneType, int, list, tuple, np.ndarray) = 'max',
 item_rate: (NoneType, int, list, tuple, np.ndarray) = None,
 item_recharge: (NoneType, int, list, tuple, np.ndarray) = 0,
 init_items_at_step: (NoneType, int, list, tuple, np.ndarray) = 0,
+item_arrival_rate: (NoneType, int, float, list, tuple, np.ndarray) = 0,
 # visualization:
 symbol: (str, NoneType) = 'rectangle', # 'triangle-up', 'triangle-down', 'rectangle'
 color: (str, NoneType, list, tuple, np.ndarray) = 'orange',
 '''
 
-# Vehicle Class Functions:
-# ----------------------------------------------------------------------------------------------------------------
-
-#def item_recharge(self, time):
-
-
-#def init_items_at_step(self, time):
-
-
 # Base Node Class:
 # ----------------------------------------------------------------------------------------------------------------
 
@@ -54,18 +47,13 @@ class BaseNodeClass:
         # Create items as restricted value:range
         self.items = RestrValueObject('n_items', n_index, 'node', temp_db, n_params['max_items'], 0, n_params['init_items'], n_params['item_rate'])
 
-        # Init time dependent functions (functions that take the passed time as input):
-        self.time_dependent_funcs = []
-        # Add item recharge as time dependent function if needed:
-        if n_params['item_recharge'] is not None and n_params['item_recharge'] != 0:
-            self.time_dependent_funcs.append(item_recharge)
-        # Add init items at step as time dependent function if needed:
-        if n_params['init_items_at_step'] is not None and n_params['init_items_at_step'] != 0:
-            self.time_dependent_funcs.append(init_items_at_step)
-
-    def step(self, time):
-
-        [func(time) for func in self.time_dependent_funcs]
+        # Time dependent parameter, applied to all nodes at once by BaseNodeCreator.update_items:
+        # items added per time unit:
+        insert_at_array(temp_db.constants_dict, 'n_item_recharge', param_interpret(n_params['item_recharge'], temp_db.rng), n_index, temp_db.num_nodes)
+        # time at which the init items are released (the node has no items before):
+        insert_at_array(temp_db.constants_dict, 'n_release_time', param_interpret(n_params['init_items_at_step'], temp_db.rng), n_index, temp_db.num_nodes)
+        # expected number of items per time unit, that arrive randomly (poisson process):
+        insert_at_array(temp_db.constants_dict, 'n_arrival_rate', param_interpret(n_params['item_arrival_rate'], temp_db.rng), n_index, temp_db.num_nodes)
 
 
 # Base Node Creator:
@@ -73,15 +61,23 @@ class BaseNodeClass:
 
 class BaseNodeCreator:
 
-    def __init__(self, n_params_list, temp_db, NodeClass=BaseNodeClass):
+    def __init__(self, n_params_list, temp_db, NodeClass=BaseNodeClass, dataset=None):
         
         self.temp_db = temp_db
         self.n_params_list = n_params_list
 
+        # Reads coordinates and items from an InstanceDataset instead of drawing them:
+        self.dataset = dataset
+
         self.temp_db.num_nodes = sum([np.max(n_params['num']) for n_params in n_params_list])
         self.temp_db.num_depots = sum([np.max(n_params['num']) for n_params in n_params_list if n_params['n_name'] == 'depot'])
         self.temp_db.num_customers = sum([np.max(n_params['num']) for n_params in n_params_list if n_params['n_name'] == 'customer'])
 
+        # Items of the dataset replace the parameter, so the normalization has to cover all instances:
+        if self.dataset is not None:
+            for name in ['n_items', 'max_n_items']:
+                self.temp_db.add_min_max_bound(name, [0, self.dataset.meta['max_demand']])
+
         self.NodeClass = NodeClass
 
     def create(self):
@@ -89,13 +85,75 @@ class BaseNodeCreator:
         n_index = 0
         n_type = 0
 
+        instance = None
+        if self.dataset is not None:
+            self.temp_db.instance_index = self.dataset.next_instance(self.temp_db.rng)
+            instance = self.dataset[self.temp_db.instance_index]
+            # Nodes of the dataset are ordered depots first, then customers:
+            next_dataset_index = {'depot': 0, 'customer': self.dataset.num_depots}
+
         for n_params in self.n_params_list:
-            for i in range(param_interpret(n_params['num'])):
-                node = self.NodeClass(self.temp_db, n_index, n_type, n_params)
-                self.temp_db.add_node(node, n_index, n_type)
+            for i in range(param_interpret(n_params['num'], self.temp_db.rng)):
+
+                coord = None
+                node_params = n_params
+                if instance is not None:
+                    key = 'depot' if n_params['n_name'] == 'depot' else 'customer'
+                    j = next_dataset_index[key]
+                    next_dataset_index[key] += 1
+                    coord = instance['n_coord'][j]
+                    if not np.isnan(instance['n_items'][j]):
+                        node_params = dict(n_params, init_items=float(instance['n_items'][j]))
+
+                node = self.NodeClass(self.temp_db, n_index, n_type, node_params)
+                self.temp_db.add_node(node, n_index, n_type, coord)
                 n_index +=1
             self.temp_db.node_visuals.append([n_params['symbol'], n_params['color']])
             n_type += 1
 
         self.temp_db.min_max_dict['n_type'] = np.array([0, len(self.n_params_list) - 1])
 
+        self.init_item_dynamics()
+
+    def init_item_dynamics(self):
+        '''
+        Prepares the arrays of the time dependent item changes of all nodes.
+        Nodes with a release time start without items.
+        '''
+        self.item_recharge = np.nan_to_num(self.temp_db.constants_dict['n_item_recharge'])
+        self.arrival_rate = np.nan_to_num(self.temp_db.constants_dict['n_arrival_rate'])
+        self.release_time = np.nan_to_num(self.temp_db.constants_dict['n_release_time'])
+
+        self.temp_db.pending_release = self.release_time > 0
+        self.temp_db.status_dict['n_items'][self.temp_db.pending_release] = 0
+        self.temp_db.mark_dirty('node', self.temp_db.pending_release)
+
+        self.has_recharge = np.any(self.item_recharge != 0)
+        self.has_arrivals = np.any(self.arrival_rate > 0)
+
+    def update_items(self, time_frame):
+        '''
+        Applies recharge, scheduled releases and random arrivals of items to all nodes for the passed time frame.
+        The items are clipped at the maximum items of each node (nodes without maximum aren't clipped).
+        '''
+        pending = self.temp_db.pending_release
+        if not (self.has_recharge or self.has_arrivals or pending.any()):
+            return
+
+        items = self.temp_db.status_dict['n_items']
+        added = np.zeros_like(items)
+
+        if self.has_recharge:
+            added += self.item_recharge * time_frame
+
+        if self.has_arrivals:
+            added += self.temp_db.rng.poisson(self.arrival_rate * time_frame)
+
+        if pending.any():
+            released = pending & (self.release_time <= self.temp_db.total_time)
+            added[released] += np.nan_to_num(self.temp_db.constants_dict['init_n_items'][released])
+            pending[released] = False
+
+        self.temp_db.mark_dirty('node', added != 0)
+        np.fmin(items + added, self.temp_db.constants_dict['max_n_items'], out=items)
+
@@ -156,19 +156,20 @@ class RestrValueObject:
         #'n_items', n_index, 'node', temp_db, n_params['max_items'], 0, n_params['init_items']
         self.name = name
         self.obj_index = obj_index
+        self.index_type = index_type
         self.temp_db = temp_db
 
-        self.max_restr  = param_interpret(max_restr)
-        self.min_restr  = param_interpret(min_restr)
+        self.max_restr  = param_interpret(max_restr, temp_db.rng)
+        self.min_restr  = param_interpret(min_restr, temp_db.rng)
 
         if init_value == np.nan or init_value == 'max':
             self.init_value = self.max_restr
         elif init_value == 'min':
             self.init_value = self.min_restr
         else:
-            self.init_value = param_interpret(init_value)
+            self.init_value = param_interpret(init_value, temp_db.rng)
         
-        self.rate = param_interpret(rate)
+        self.rate = param_interpret(rate, temp_db.rng)
 
         if max_restr == None and min_restr == None:
             self.restriction = DummyRestriction()        
@@ -207,18 +208,22 @@ class RestrValueObject:
             self.temp_db.status_dict[self.name][self.obj_index] = int(
                 self.temp_db.status_dict[self.name][self.obj_index]
         )
+            self.temp_db.mark_dirty(self.index_type, self.obj_index)
 
     def reset(self):
         self.temp_db.status_dict[self.name][self.obj_index] = self.init_value
+        self.temp_db.mark_dirty(self.index_type, self.obj_index)
 
     def reset_signal(self):
         self.temp_db.signals_dict['signal_'+self.name][self.obj_index] = 0
 
     def set_to_max(self):
         self.temp_db.status_dict[self.name][self.obj_index] = self.max_restr
+        self.temp_db.mark_dirty(self.index_type, self.obj_index)
 
     def set_to_min(self):
         self.temp_db.status_dict[self.name][self.obj_index] = self.min_restr
+        self.temp_db.mark_dirty(self.index_type, self.obj_index)
 
     def update(self, new_value, restr_signal):
         if is_not_None(self.temp_db.status_dict['in_time_' + self.name][self.obj_index]):
@@ -233,6 +238,7 @@ class RestrValueObject:
 
         if is_not_None(self.temp_db.status_dict[self.name][self.obj_index]):
             self.temp_db.status_dict[self.name][self.obj_index] = new_value
+            self.temp_db.mark_dirty(self.index_type, self.obj_index)
 
         self.update_signal(restr_signal)
 
@@ -9,21 +9,37 @@ from main.simulation.restrictions import is_not_None
 
 class BaseSimulator:
 
-    def __init__(self, temp_db, vehicle_creator, node_creator, auto_agent):
+    def __init__(self, temp_db, vehicle_creator, node_creator, auto_agent, trajectory_recorder=None, profiler=None):
 
         self.temp_db = temp_db
         self.vehicle_creator = vehicle_creator
         self.node_creator = node_creator
         self.auto_agent = auto_agent
-
-    def reset_simulation(self):
+        self.trajectory_recorder = trajectory_recorder
+        self.profiler = profiler
+        # Vehicles time each of their actions with the profiler of the temp_db:
+        self.temp_db.profiler = profiler
+
+    def reset_simulation(self, instance=None):
+        '''
+        Resets the simulation, instance chooses the dataset instance (the dataset order is used if None).
+        '''
+        if instance is not None:
+            dataset = getattr(self.node_creator, 'dataset', None)
+            if dataset is None:
+                raise Exception('instance was {}, but the env uses no dataset'.format(instance))
+            dataset.select(instance)
 
         self.temp_db.init_db()
         self.node_creator.create()
         self.vehicle_creator.create()
         self.temp_db.reset_db()
+        self.auto_agent.reset()
         self.reset_round()
 
+        if self.trajectory_recorder is not None:
+            self.trajectory_recorder.reset()
+
     def reset_round(self):
         self.v_count = 0
         self.v_indices = np.squeeze(np.argwhere(np.isnan(self.temp_db.time_till_fin)))#np.where( == np.nan)
@@ -42,6 +58,7 @@ class BaseSimulator:
 
         if coordinates is not None:
             self.temp_db.status_dict['v_dest'][self.temp_db.cur_v_index] = np.array(coordinates)
+            self.temp_db.mark_dirty('vehicle', self.temp_db.cur_v_index)
             self.temp_db.actions_list[self.temp_db.cur_v_index].append(['move', None, None])
             #print('new destination:', coordinates, 'for', self.temp_db.cur_v_index)
 
@@ -89,17 +106,25 @@ class BaseSimulator:
         for i in range(self.temp_db.num_vehicles):
             for v_j in self.temp_db.v_transporting_v[i]:
                 self.temp_db.status_dict['v_stuck'][v_j] = 0
+                self.temp_db.mark_dirty('vehicle', v_j)
                 self.temp_db.restr_dict['v_range'][v_j].set_to_max()
 
     def finish_step(self):
 
-        self.temp_db.status_dict['n_waiting'].fill(0)
+        n_waiting = np.zeros_like(self.temp_db.status_dict['n_waiting'])
 
         for i in self.temp_db.status_dict['v_to_n']:
             if is_not_None(i):
-                self.temp_db.status_dict['n_waiting'][int(i)] = 1
+                n_waiting[int(i)] = 1
+
+        # Only nodes that changed are marked:
+        self.temp_db.mark_dirty('node', n_waiting != self.temp_db.status_dict['n_waiting'])
+        self.temp_db.status_dict['n_waiting'][:] = n_waiting
 
         if self.temp_db.terminal_state():
+            if self.trajectory_recorder is not None:
+                self.trajectory_recorder.record_frame()
+                self.trajectory_recorder.save_episode()
             return True
 
         self.v_count += 1
@@ -113,9 +138,13 @@ class BaseSimulator:
         
         return False
 
+    def take_actions(self, calc_time=False):
+
+        [v.take_action(calc_time=calc_time) for v in self.temp_db.base_groups['vehicles']]
+
     def actions_during_timeframe(self):
 
-        [v.take_action(calc_time=True) for v in self.temp_db.base_groups['vehicles']]
+        self.take_actions(calc_time=True)
         for key in self.temp_db.restr_dict.keys(): [restr.in_time() for restr in self.temp_db.restr_dict[key] if restr is not None]
 
         min_masked_array = np.nanmin(self.temp_db.time_till_fin)
@@ -126,7 +155,13 @@ class BaseSimulator:
 
         self.temp_db.total_time += self.temp_db.cur_time_frame
 
+        # Time dependent items of all nodes (recharge, releases and arrivals):
+        self.node_creator.update_items(self.temp_db.cur_time_frame)
+
         for key in self.temp_db.restr_dict.keys(): [restr.in_time() for restr in self.temp_db.restr_dict[key] if restr is not None]
-        [v.take_action() for v in self.temp_db.base_groups['vehicles']]
+        self.take_actions()
+
+        if self.trajectory_recorder is not None:
+            self.trajectory_recorder.record_frame()
 
         self.reset_round()
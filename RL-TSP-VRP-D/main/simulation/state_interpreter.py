@@ -15,13 +15,53 @@ def flatten_list(list_of_lists):
     return [val for sublist in list_of_lists for val in sublist]
 
 
+# Index type of the dirty rows of each entity:
+ENTITY_INDEX_TYPES = {'vehicles': 'vehicle', 'customers': 'node', 'depots': 'node'}
+
+# Features of the entity observations as (dict of the temp_db, key, normalization), where the normalization is
+# 'coord' (scaled by the grid), a key of the min_max_dict or None (binary values). Missing keys are left out.
+ENTITY_FEATURES = {
+    'vehicles': [
+        ('status_dict', 'v_coord', 'coord'),
+        ('status_dict', 'v_dest', 'coord'),
+        ('status_dict', 'v_items', 'v_items'),
+        ('status_dict', 'v_cargo', 'v_cargo'),
+        ('status_dict', 'v_range', 'v_range'),
+        ('status_dict', 'battery', 'battery'),
+        ('status_dict', 'loaded_v', 'loaded_v'),
+        ('status_dict', 'v_free', None),
+        ('status_dict', 'v_stuck', None),
+        ('constants_dict', 'v_is_truck', None),
+        ('constants_dict', 'v_loadable', None),
+        ('constants_dict', 'v_travel_type', None),
+    ],
+    'customers': [
+        ('status_dict', 'n_coord', 'coord'),
+        ('status_dict', 'n_items', 'n_items'),
+        ('status_dict', 'n_waiting', None),
+    ],
+    'depots': [
+        ('status_dict', 'n_coord', 'coord'),
+        ('status_dict', 'n_items', 'n_items'),
+        ('status_dict', 'n_waiting', None),
+    ],
+}
+
+
 class BaseObsEncoder:
 
     def __init__(self, obs_params, temp_db, visualizor):
 
-        # Init parameter:
+        # Init parameter (specs of older versions have no 'entity_inputs'):
+        self.entity_inputs = False
         [setattr(self, k, None_to_empty_list(v)) for k, v in obs_params.items()]
 
+        # Arrays of the entity observations (allocated at the first observation):
+        self.entity_obs = None
+
+        # Scale and offset of each value key, built once from the min_max_dict:
+        self.norm_dict = {}
+
         # Init objects:
         self.visualizor = visualizor
         self.temp_db    = temp_db
@@ -101,16 +141,17 @@ class BaseObsEncoder:
         return np.concatenate((array_x, array_y), axis=1)
 
 
+    def value_scale_offset(self, key):
+        if key not in self.norm_dict:
+            self.norm_dict[key] = self.temp_db.scale_offset(key)
+        return self.norm_dict[key]
+
+
     def value_to_contin(self, key):
-        ''' Normalizes list of Values'''
-        max_value = self.temp_db.max_values_dict[key]
-        min_value = self.temp_db.min_values_dict[key]
-        value_list = self.temp_db.status_dict[key]
-        
-        if max_value is None:
-            return np.one((len(value_list)))
-        
-        return (np.array(value_list) - min_value) / (max_value - min_value)
+        ''' Normalizes list of Values (values without limit are 1)'''
+        scale, offset = self.value_scale_offset(key)
+        values = np.asarray(self.temp_db.status_dict[key], dtype=np.float32) * scale + offset
+        return np.nan_to_num(values, nan=1, copy=False)
 
 
     def coord_to_discrete(self, key):
@@ -138,17 +179,11 @@ class BaseObsEncoder:
 
     def value_to_discrete(self, key):
         ''' Converts list of Values to discrete'''
-        value_list = self.temp_db.status_dict[key]
+        value_list = self.value_to_contin(key)
         
-        array_value = np.zeros((len(value_list), self.discrete_dims))
+        array_value = np.zeros((len(value_list), self.discrete_bins))
 
-        max_value = self.temp_db.max_values_dict[key]
-        min_value = self.temp_db.min_values_dict[key]
-        
-        if max_value is None:
-            values = np.one((len(value_list))) * (self.discrete_dims - 1)
-        else:
-            values = (np.array(value_list) - min_value) // (max_value - min_value) * (self.discrete_dims - 1)
+        values = np.clip((value_list * (self.discrete_bins - 1)).astype(int), 0, self.discrete_bins - 1)
 
         array_value[np.arange(len(value_list)), values] = 1
 
@@ -193,8 +228,159 @@ class BaseObsEncoder:
         return np.ravel(to_combine)
 
 
+    def init_entities(self):
+        '''
+        Prepares the column layout and normalization of the entity observations and allocates the arrays:
+        [num_vehicles, F_v], [num_customers, F_c] and [num_depots, F_d] as float32, plus boolean masks of the
+        used rows (the numbers of objects can be smaller than the maximum, if given as range).
+        The last vehicle feature marks the current vehicle.
+        '''
+        sizes = {
+            'vehicles': self.temp_db.num_vehicles,
+            'customers': self.temp_db.num_customers,
+            'depots': self.temp_db.num_depots,
+        }
+
+        indices = {
+            'vehicles': self.temp_db.v_indices,
+            'customers': self.temp_db.c_indices,
+            'depots': self.temp_db.d_indices,
+        }
+
+        self.entity_layout = {}
+        self.entity_scale = {}
+        self.entity_offset = {}
+        self.entity_high = {}
+        self.entity_obs = {}
+
+        for entity, features in ENTITY_FEATURES.items():
+            columns = []
+            norms = []
+            high = []
+
+            for dict_name, key, norm in features:
+                if key not in getattr(self.temp_db, dict_name):
+                    continue
+
+                if norm == 'coord':
+                    columns.append((dict_name, key, slice(len(norms), len(norms) + 2)))
+                    norms += [self.value_scale_offset('x_coord'), self.value_scale_offset('y_coord')]
+                    high += [1, 1]
+                else:
+                    columns.append((dict_name, key, slice(len(norms), len(norms) + 1)))
+                    norms.append(self.value_scale_offset(norm) if norm is not None else (1, 0))
+                    high.append(1 if norm is None else self.value_high(norm, indices[entity]))
+
+            # Current vehicle:
+            if entity == 'vehicles':
+                norms.append((1, 0))
+                high.append(1)
+
+            # Normalization as value * scale + offset, aligned to the columns:
+            self.entity_layout[entity] = columns
+            self.entity_scale[entity] = np.array([elem[0] for elem in norms], dtype=np.float32)
+            self.entity_offset[entity] = np.array([elem[1] for elem in norms], dtype=np.float32)
+            self.entity_high[entity] = np.array(high, dtype=np.float32)
+            self.entity_obs[entity] = np.zeros((sizes[entity], len(norms)), dtype=np.float32)
+            self.entity_obs[entity + '_mask'] = np.zeros((sizes[entity]), dtype=bool)
+
+
+    def value_high(self, key, indices):
+        '''
+        Upper bound of the normalized values of key: 1 if all objects have a maximum in the min_max_dict,
+        otherwise unbounded (like the cargo of trucks without cargo limit). Values without limit, that stay
+        None (like the range of trucks), are encoded as 1.
+        '''
+        max_values = self.temp_db.constants_dict.get('max_' + key)
+        init_values = self.temp_db.constants_dict.get('init_' + key)
+        if key not in self.temp_db.min_max_dict or max_values is None or init_values is None:
+            return np.inf
+        no_limit = np.isnan(np.asarray(max_values, dtype=float)[indices])
+        if np.any(no_limit & ~np.isnan(np.asarray(init_values, dtype=float)[indices])):
+            return np.inf
+        return 1
+
+
+    def reset(self):
+        '''
+        Prepares the entity rows of the new instance, called by the env after the simulation was reset.
+        All rows are dirty after a reset, so the next observation encodes everything.
+        '''
+        if not self.entity_inputs:
+            return
+
+        if self.entity_obs is None:
+            self.init_entities()
+
+        indices = {
+            'vehicles': self.temp_db.v_indices,
+            'customers': self.temp_db.c_indices,
+            'depots': self.temp_db.d_indices,
+        }
+
+        # Row of each vehicle/node index in the arrays of an entity (-1 for other entities):
+        self.entity_row = {}
+        for entity, entity_indices in indices.items():
+            index_type = ENTITY_INDEX_TYPES[entity]
+            self.entity_row[entity] = np.full((len(self.temp_db.dirty[index_type])), -1, dtype=int)
+            self.entity_row[entity][entity_indices] = np.arange(len(entity_indices))
+
+            self.entity_obs[entity].fill(0)
+            self.entity_obs[entity + '_mask'][:len(entity_indices)] = True
+            self.entity_obs[entity + '_mask'][len(entity_indices):] = False
+
+        self.cur_v_row = 0
+
+
+    def observe_entities(self):
+        '''
+        Updates the entity observations in place, only the rows of vehicles and nodes marked as dirty in the
+        temp_db are encoded again. The same arrays are returned at each step, copy them to keep an observation.
+        '''
+        if self.entity_obs is None:
+            self.reset()
+
+        changed = {index_type: np.flatnonzero(dirty) for index_type, dirty in self.temp_db.dirty.items()}
+
+        for entity, columns in self.entity_layout.items():
+            indices = changed[ENTITY_INDEX_TYPES[entity]]
+            rows = self.entity_row[entity][indices]
+            indices = indices[rows >= 0]
+            rows = rows[rows >= 0]
+
+            if len(rows) == 0:
+                continue
+
+            obs = self.entity_obs[entity]
+            values = obs[rows]
+
+            for dict_name, key, cols in columns:
+                values[:, cols] = getattr(self.temp_db, dict_name)[key][indices].reshape(len(rows), -1)
+
+            values *= self.entity_scale[entity]
+            values += self.entity_offset[entity]
+            # Values without limit are 1 (like value_to_contin):
+            obs[rows] = np.nan_to_num(values, nan=1, copy=False)
+
+        for index_type, indices in changed.items():
+            self.temp_db.dirty[index_type][indices] = False
+
+        # Current vehicle:
+        self.entity_obs['vehicles'][self.cur_v_row, -1] = 0
+        self.cur_v_row = self.entity_row['vehicles'][int(self.temp_db.cur_v_index)]
+        self.entity_obs['vehicles'][self.cur_v_row, -1] = 1
+
+        for key in self.image_input:
+            self.entity_obs['image'] = 1 - (self.visualizor.convert_to_img_array().transpose([1, 0, 2]) / 255)
+
+        return self.entity_obs
+
+
     def observe_state(self):
 
+        if self.entity_inputs:
+            return self.observe_entities()
+
         for key in self.contin_coord : self.contin_dict[key] = self.coord_to_contin(key)
         for key in self.contin_binary: self.contin_dict[key] = np.array(self.temp_db.status_dict[key])
         for key in self.contin_value : self.contin_dict[key] = self.value_to_contin(key)
@@ -225,6 +411,13 @@ class BaseObsEncoder:
     def obs_space(self):
 
         all_inputs = self.observe_state()
+        if isinstance(all_inputs, dict):
+            # Columns of values without maximum are unbounded (see value_high):
+            high = lambda key, elem: np.broadcast_to(self.entity_high[key], np.shape(elem)) if key in self.entity_high else 1
+            return spaces.Dict({
+                key: spaces.MultiBinary(len(elem)) if key.endswith('_mask') else spaces.Box(low=0, high=high(key, elem), shape=np.shape(elem), dtype=np.float32)
+                for key, elem in all_inputs.items()
+            })
         if isinstance(all_inputs, np.ndarray):
             return spaces.Box(low=0, high=1, shape=np.shape(all_inputs), dtype=np.uint8)
         if isinstance(all_inputs, list):
@@ -1,6 +1,5 @@
 '''
 '''
-import random
 import numpy as np
 
 '''
@@ -9,8 +8,8 @@ def lookup_db(db_dict, name_list):
     return [obj_list.append(db_dict[i]) for name in name_list]
 '''
 
-def random_coordinates(grid):
-    return np.array([np.random.randint(0,grid[0]+1), np.random.randint(0,grid[1]+1)])
+def random_coordinates(grid, rng):
+    return np.array([rng.integers(0,grid[0]+1), rng.integers(0,grid[1]+1)])
 
 
 def insert_at_coord(dict_var, key, value, list_index, num_objs):
@@ -46,15 +45,27 @@ def append_to_array(dict_var, key, value):
 
 class BaseTempDatabase:
 
-    def __init__(self, name, grid, signal_list, debug_mode=False):
+    def __init__(self, name, grid, signal_list, debug_mode=False, seed=None):
 
         self.name = name
+
+        # Random generator of this env, used for all random parameter and coordinates:
+        self.seed(seed)
         
         # Grid by x and y size
         self.grid = grid
 
+        # Minimum and maximum of each value, collected at the first reset and kept for the compiled env:
+        self.min_max_dict = None
+        self.min_max_final = False
+        # Values the min_max_dict has to cover besides the parameter of the first reset (e.g. dataset maxima, set at compile):
+        self.min_max_bounds = {}
+
         self.signal_list = signal_list
 
+        # Step profiler (set by the simulator, None if not profiled):
+        self.profiler = None
+
         self.debug_mode = debug_mode
 
         self.key_groups_dict = {
@@ -97,27 +108,57 @@ class BaseTempDatabase:
         self.vehicle_visuals = []
         self.node_visuals = []
 
-        self.min_max_dict = {
-            'x_coord': np.array([0, self.grid[0]]),
-            'y_coord': np.array([0, self.grid[1]]),
-            'loadable': np.array([0,1]),
-            'is_truck': np.array([0,1]),
-            'range_type': np.array([0,1]),
-            'travel_type': np.array([0,1]),
-            'cargo_type': np.array([0,2]),
-        }
+        if not self.min_max_final:
+            self.min_max_dict = {
+                'x_coord': np.array([0, self.grid[0]]),
+                'y_coord': np.array([0, self.grid[1]]),
+                'loadable': np.array([0,1]),
+                'is_truck': np.array([0,1]),
+                'range_type': np.array([0,1]),
+                'travel_type': np.array([0,1]),
+                'cargo_type': np.array([0,2]),
+            }
 
         self.total_time = 0
 
+        # Nodes which items are not released yet (set by the node creator):
+        self.pending_release = None
+
+        # Index of the dataset instance of this episode (if the creators use a dataset):
+        self.instance_index = None
+
+        # Rows of vehicles and nodes that changed since the last observation (set by restriction updates and moves):
+        self.dirty = {
+            'vehicle': np.ones((self.num_vehicles), dtype=bool),
+            'node': np.ones((self.num_nodes), dtype=bool),
+        }
+
+    def seed(self, seed=None):
+        '''
+        Resets the random generator, seed can be an int, a np.random.SeedSequence (see spawn_seeds) or None.
+        '''
+        self.rng = np.random.default_rng(seed)
+
     def prep_max_min(self, name, max_restr, min_restr, rate):
 
-        append_to_array(self.min_max_dict, name, [max_restr, min_restr])
+        if self.min_max_final:
+            return
+
+        # Parameter can be ranges (lists), so the values are flattened:
+        append_to_array(self.min_max_dict, name, np.hstack([max_restr, min_restr]))
         append_to_array(self.min_max_dict, 'max_'+name, max_restr)
         append_to_array(self.min_max_dict, 'min_'+name, min_restr)
         append_to_array(self.min_max_dict, 'rate_'+name, rate)
 
         #print(self.min_max_dict)
 
+    def add_min_max_bound(self, name, values):
+        '''
+        Extends the min_max_dict of name by values, that aren't part of the parameter of the first reset
+        (like the maximum cargo over all instances of a dataset). Has to be called before the first reset.
+        '''
+        append_to_array(self.min_max_bounds, name, values)
+
     def add_restriction(self, restr_obj, name, list_index, index_type):
 
         if index_type == 'vehicle':
@@ -141,7 +182,7 @@ class BaseTempDatabase:
         # Signals at Signals Dict:
         insert_at_array(self.signals_dict, 'signal_'+name, 0, list_index, num_objs)
 
-    def add_node(self, node, n_index, n_type):
+    def add_node(self, node, n_index, n_type, coord=None):
 
         # Object at Base Group:
         insert_at_list(self.base_groups, 'nodes', node, n_index, self.num_nodes)
@@ -150,7 +191,9 @@ class BaseTempDatabase:
         insert_at_list(self.base_groups, 'nodes', node, n_index, self.num_nodes)
         
         # Variables at Status Dict:
-        insert_at_coord(self.status_dict, 'n_coord', random_coordinates(self.grid), n_index, self.num_nodes)
+        if coord is None:
+            coord = random_coordinates(self.grid, self.rng)
+        insert_at_coord(self.status_dict, 'n_coord', coord, n_index, self.num_nodes)
 
         # Constants at Constants Dict:
         insert_at_array(self.constants_dict, 'n_type', n_type, n_index, self.num_nodes)
@@ -160,14 +203,16 @@ class BaseTempDatabase:
         elif node.n_name == 'customer':
             self.c_indices.append(n_index)
 
-    def add_vehicle(self, vehicle, v_index, v_type):
+    def add_vehicle(self, vehicle, v_index, v_type, coord=None):
 
         # Object at Base Group:
         insert_at_list(self.base_groups, 'vehicles', vehicle, v_index, self.num_vehicles)
 
         # Variables at Status Dict:
         insert_at_array(self.status_dict, 'v_free', 1, v_index, self.num_vehicles)
-        insert_at_coord(self.status_dict, 'v_coord', random.sample(list(self.depots(self.status_dict['n_coord'])[0]), 1)[0], v_index, self.num_vehicles)
+        if coord is None:
+            coord = self.rng.choice(self.depots(self.status_dict['n_coord'])[0])
+        insert_at_coord(self.status_dict, 'v_coord', coord, v_index, self.num_vehicles)
         
         # Constants at Constants Dict:
         insert_at_array(self.constants_dict, 'v_range_type', ['simple', 'battery'].index(vehicle.range_type), v_index, self.num_vehicles)
@@ -182,9 +227,15 @@ class BaseTempDatabase:
 
     def reset_db(self):    
 
-        for key in self.min_max_dict.keys():
-            self.min_max_dict[key] = np.nan_to_num(self.min_max_dict[key].astype(float))
-            self.min_max_dict[key] = np.array([np.min(self.min_max_dict[key]), np.max(self.min_max_dict[key])])
+        # Parameter ranges are collected (not the drawn values) and values that differ per reset (dataset instances)
+        # are covered by the min_max_bounds, so the min_max_dict is only reduced once:
+        if not self.min_max_final:
+            for key, values in self.min_max_bounds.items():
+                append_to_array(self.min_max_dict, key, values)
+            for key in self.min_max_dict.keys():
+                self.min_max_dict[key] = np.nan_to_num(self.min_max_dict[key].astype(float))
+                self.min_max_dict[key] = np.array([np.min(self.min_max_dict[key]), np.max(self.min_max_dict[key])])
+            self.min_max_final = True
 
         for key in self.key_groups_dict['action_signals']: self.signals_dict[key] = np.zeros((self.num_vehicles))
 
@@ -204,6 +255,21 @@ class BaseTempDatabase:
         self.time_till_fin = np.zeros((self.num_vehicles))
         self.time_till_fin.fill(None)
 
+        [elem.fill(True) for elem in self.dirty.values()]
+
+    def scale_offset(self, key):
+        '''
+        Returns scale and offset (float32) to normalize values of key with value * scale + offset,
+        based on the min_max_dict (scale 1 and offset 0 for unknown keys).
+        '''
+        low, high = self.min_max_dict.get(key, np.array([0, 1]))
+        span = (high - low) if high != low else 1
+        return np.float32(1 / span), np.float32(-low / span)
+
+    def mark_dirty(self, index_type, index):
+        # index_type is 'vehicle' or 'node', index can be an int, index array or boolean mask:
+        self.dirty[index_type][index] = True
+
     def init_step(self):
 
         [self.signals_dict[key].fill(0) for key in self.signals_dict.keys()]
@@ -263,6 +329,10 @@ class BaseTempDatabase:
 
     def terminal_state(self):
 
+        # Items that will still be released:
+        if self.pending_release is not None and np.any(self.pending_release):
+            return False
+
         if np.sum(self.customers(self.status_dict['n_items'])[0]) == 0:
 
             d_coord = self.depots(self.status_dict['n_coord'])[0]
@@ -0,0 +1,211 @@
+'''
+Recording of episodes as compact per-episode logs and replaying them with the visualizer without simulating.
+'''
+import os
+import time
+import numpy as np
+
+
+# Keys of the status dict, that are recorded every time frame (everything the visualizer draws):
+TRAJECTORY_KEYS = [
+    'v_coord', 'v_dest', 'v_range', 'in_time_v_range', 'v_items', 'in_time_v_items',
+    'v_cargo', 'in_time_v_cargo', 'loaded_v', 'in_time_loaded_v', 'v_free', 'v_stuck', 'v_to_n',
+    'n_coord', 'n_waiting', 'n_items', 'in_time_n_items',
+]
+
+ACTION_NAMES = ['move', 'load_v', 'unload_v', 'load_i', 'unload_i']
+
+
+def none_to_nan(value):
+    if value is None:
+        return np.nan
+    return value
+
+
+def nan_to_none(value):
+    if np.isnan(value):
+        return None
+    return value
+
+
+# Base Trajectory Recorder:
+# ----------------------------------------------------------------------------------------------------------------
+
+class BaseTrajectoryRecorder:
+    '''
+    Records the state of the simulation after every time frame and writes one ``.npz`` file per episode.
+    All values are stored columnar: one array per status key with shape (num_frames, ...).
+    The queued actions of all vehicles are stored flattened with the frame and vehicle index of each action.
+
+    Args:
+        temp_db (BaseTempDatabase): Database of the simulation
+        log_dir (string): Directory for the episode files
+        save_every (int): Only every n-th episode is recorded
+        keys (list): Keys of the status dict to record
+    '''
+    def __init__(self, temp_db, log_dir, save_every=1, keys=TRAJECTORY_KEYS):
+
+        self.temp_db = temp_db
+        self.log_dir = log_dir
+        self.save_every = save_every
+        self.keys = keys
+
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        self.count_episodes = -1
+        self.recording = False
+        self.frames = None
+
+    def reset(self):
+        '''
+        Saves the last episode (if not done yet) and starts a new one. Called after the simulation was reset.
+        '''
+        self.save_episode()
+
+        self.count_episodes += 1
+        self.recording = self.count_episodes % self.save_every == 0
+        if not self.recording:
+            return
+
+        self.frames = {key: [] for key in self.keys}
+        self.frames['cur_v_index'] = []
+        self.frames['cur_time_frame'] = []
+        self.frames['total_time'] = []
+        self.frames['time_till_fin'] = []
+        self.frames['cargo_loss'] = []
+        self.actions = {'action_frame': [], 'action_vehicle': [], 'action_code': [], 'action_target': [], 'action_amount': []}
+
+        self.statics = {
+            'grid': np.array(self.temp_db.grid),
+            'n_type': np.copy(self.temp_db.constants_dict['n_type']),
+            'v_type': np.copy(self.temp_db.constants_dict['v_type']),
+            'd_indices': np.array(self.temp_db.d_indices, dtype=int),
+            'c_indices': np.array(self.temp_db.c_indices, dtype=int),
+            'v_indices': np.array(self.temp_db.v_indices, dtype=int),
+            'node_visuals': np.array(self.temp_db.node_visuals, dtype=str),
+            'vehicle_visuals': np.array(self.temp_db.vehicle_visuals, dtype=str),
+        }
+
+        self.record_frame()
+
+    def record_frame(self):
+        if not self.recording:
+            return
+
+        frame_index = len(self.frames['total_time'])
+
+        for key in self.keys:
+            self.frames[key].append(np.copy(self.temp_db.status_dict[key]))
+
+        self.frames['cur_v_index'].append(int(self.temp_db.cur_v_index))
+        self.frames['cur_time_frame'].append(self.temp_db.cur_time_frame)
+        self.frames['total_time'].append(self.temp_db.total_time)
+        self.frames['time_till_fin'].append(np.copy(self.temp_db.time_till_fin))
+        self.frames['cargo_loss'].append(np.copy(self.temp_db.signals_dict['cargo_loss']))
+
+        for v_index, actions in enumerate(self.temp_db.actions_list):
+            for action in actions:
+                self.actions['action_frame'].append(frame_index)
+                self.actions['action_vehicle'].append(v_index)
+                self.actions['action_code'].append(ACTION_NAMES.index(action[0]))
+                self.actions['action_target'].append(none_to_nan(action[1]))
+                self.actions['action_amount'].append(none_to_nan(action[2]))
+
+    def save_episode(self):
+        # Episodes without any step (only the initial frame) are skipped:
+        if not self.recording or self.frames is None or len(self.frames['total_time']) <= 1:
+            return
+
+        columns = {key: np.stack(values) for key, values in self.frames.items()}
+        columns.update({key: np.array(values, dtype=float) for key, values in self.actions.items()})
+        columns.update(self.statics)
+
+        path = os.path.join(self.log_dir, '{}_episode_{:06d}.npz'.format(self.temp_db.name, self.count_episodes))
+        np.savez_compressed(path, **columns)
+
+        self.frames = None
+
+
+# Trajectory Viewer:
+# ----------------------------------------------------------------------------------------------------------------
+
+class TrajectoryViewer:
+    '''
+    Replays recorded episodes through a visualizer. The database of the visualizer is overwritten with the recorded
+    values for each frame, so use a visualizer of an environment built with the same vehicles and nodes as the
+    recorded one (for example ``BuildEnvironment.create_visualizor()`` after ``visuals(headless=True)``),
+    but don't step that environment while replaying.
+
+    Args:
+        temp_db (BaseTempDatabase): Database used by the visualizer
+        visualizor (BaseVisualizer): Visualizer to draw the frames
+    '''
+    def __init__(self, temp_db, visualizor):
+
+        self.temp_db = temp_db
+        self.visualizor = visualizor
+
+    def load(self, path):
+        log = dict(np.load(path))
+
+        self.temp_db.grid = log['grid'].tolist()
+        self.temp_db.constants_dict['n_type'] = log['n_type']
+        self.temp_db.constants_dict['v_type'] = log['v_type']
+        self.temp_db.d_indices = log['d_indices'].tolist()
+        self.temp_db.c_indices = log['c_indices'].tolist()
+        self.temp_db.v_indices = log['v_indices'].tolist()
+        self.temp_db.node_visuals = log['node_visuals'].tolist()
+        self.temp_db.vehicle_visuals = log['vehicle_visuals'].tolist()
+
+        # Start index of the actions of each frame:
+        num_frames = len(log['total_time'])
+        log['action_offsets'] = np.searchsorted(log['action_frame'], np.arange(num_frames + 1))
+
+        return log
+
+    def set_frame(self, log, t):
+        for key in TRAJECTORY_KEYS:
+            if key in log:
+                self.temp_db.status_dict[key] = log[key][t]
+
+        self.temp_db.cur_v_index = int(log['cur_v_index'][t])
+        self.temp_db.cur_time_frame = log['cur_time_frame'][t]
+        self.temp_db.total_time = log['total_time'][t]
+        self.temp_db.time_till_fin = log['time_till_fin'][t]
+        self.temp_db.signals_dict['cargo_loss'] = log['cargo_loss'][t]
+
+        self.temp_db.actions_list = [[] for i in range(len(log['v_type']))]
+        for j in range(log['action_offsets'][t], log['action_offsets'][t + 1]):
+            self.temp_db.actions_list[int(log['action_vehicle'][j])].append([
+                ACTION_NAMES[int(log['action_code'][j])],
+                nan_to_none(log['action_target'][j]),
+                nan_to_none(log['action_amount'][j]),
+            ])
+
+    def replay(self, path, speed=1.0, frame_time=0.5, episode=0, mode='human'):
+        '''
+        Draws all frames of a recorded episode.
+
+        Args:
+            path (string): Recorded episode file
+            speed (float): Replay speed relative to ``frame_time``, None replays as fast as possible
+            frame_time (float): Seconds per frame at speed 1
+            episode (int): Episode number shown by the visualizer
+            mode (string): 'human' to show the frames, 'rgb_array' to return them as list of arrays
+        '''
+        log = self.load(path)
+        self.visualizor.reset_static_surfaces()
+
+        frames = []
+        for t in range(len(log['total_time'])):
+            start = time.perf_counter()
+
+            self.set_frame(log, t)
+            frame = self.visualizor.visualize_step(episode, t, mode)
+            if mode == 'rgb_array':
+                frames.append(frame)
+
+            if speed is not None:
+                time.sleep(max(0, frame_time / speed - (time.perf_counter() - start)))
+
+        return frames
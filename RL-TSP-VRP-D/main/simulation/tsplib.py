@@ -0,0 +1,167 @@
+'''
+Import of TSPLIB (TSP) and CVRPLIB (CVRP) instance files. Parsed instances are cached as dataset directory
+(see ``main.simulation.instances``), so repeated loads of large files only read the binary arrays.
+'''
+import os
+import numpy as np
+
+from main.simulation.instances import write_dataset
+
+
+# Edge weight types on plane coordinates, that match the distances of the env (euclidean for arial and
+# manhattan for street vehicles). MAX_2D, ATT (pseudo-euclidean) and GEO (latitude/longitude) are rejected,
+# the tour lengths of the env wouldn't be comparable to the TSPLIB lengths:
+COORD_WEIGHT_TYPES = ['EUC_2D', 'CEIL_2D', 'MAN_2D']
+
+
+def read_section(lines, i, num_values, dimension):
+    '''
+    Reads ``dimension`` rows of a section starting at line i, returns the values (without node ids) and the next line.
+    '''
+    rows = np.array([line.split() for line in lines[i:i + dimension]], dtype=np.float64)
+    return rows[:, 1:1 + num_values], i + dimension
+
+
+def parse_tsplib(path):
+    '''
+    Parses a TSPLIB/CVRPLIB file. Returns a dict with 'name', 'type', 'dimension', 'capacity' (None for TSP),
+    'coords' (dimension, 2), 'demands' (dimension) and 'depots' (list of 0-based node indices).
+    '''
+    with open(path, 'r') as f:
+        lines = [line.strip() for line in f if line.strip() != '']
+
+    header = {}
+    coords = None
+    demands = None
+    depots = []
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        if line.startswith('NODE_COORD_SECTION'):
+            coords, i = read_section(lines, i + 1, 2, int(header['DIMENSION']))
+        elif line.startswith('DEMAND_SECTION'):
+            demands, i = read_section(lines, i + 1, 1, int(header['DIMENSION']))
+            demands = demands[:, 0]
+        elif line.startswith('DEPOT_SECTION'):
+            i += 1
+            while i < len(lines) and lines[i] != '-1' and lines[i] != 'EOF':
+                depots.append(int(lines[i].split()[0]) - 1)
+                i += 1
+            i += 1
+        elif line.startswith('EOF'):
+            break
+        elif ':' in line:
+            key, value = line.split(':', 1)
+            header[key.strip()] = value.strip()
+            i += 1
+        elif line.endswith('_SECTION'):
+            raise Exception("'{}' in '{}' is not supported, only instances with node coordinates can be imported.".format(line, path))
+        else:
+            i += 1
+
+    if coords is None:
+        raise Exception("'{}' has no NODE_COORD_SECTION, only instances with node coordinates can be imported.".format(path))
+
+    weight_type = header.get('EDGE_WEIGHT_TYPE', 'EUC_2D')
+    if weight_type not in COORD_WEIGHT_TYPES:
+        raise Exception("EDGE_WEIGHT_TYPE was '{}', but has to be one of: {}".format(weight_type, COORD_WEIGHT_TYPES))
+
+    dimension = int(header['DIMENSION'])
+    if demands is None:
+        demands = np.ones((dimension))
+    if len(depots) == 0:
+        depots = [0]
+
+    return {
+        'name': header.get('NAME', os.path.splitext(os.path.basename(path))[0]),
+        'type': header.get('TYPE', 'TSP'),
+        'dimension': dimension,
+        'capacity': float(header['CAPACITY']) if 'CAPACITY' in header else None,
+        'coords': coords,
+        'demands': demands,
+        'depots': depots,
+    }
+
+
+# Version of the cached dataset format, older caches are not reused:
+CACHE_VERSION = 3
+
+# Grid size of instances with fractional coordinates, if no max_grid is given:
+FRACTIONAL_GRID = 100
+
+
+def cache_path_of(path, cache_dir, max_grid=None):
+    # The cache is renewed, when the file or the grid mapping changes:
+    stat = os.stat(path)
+    name = '{}_{}_{}_v{}'.format(os.path.basename(path), stat.st_size, int(stat.st_mtime), CACHE_VERSION)
+    if max_grid is not None:
+        name += '_g{}'.format(int(max_grid))
+    return os.path.join(cache_dir, name)
+
+
+def snap_to_grid(coords, max_grid=None):
+    '''
+    Maps coordinates onto the integer grid of the env and returns the coordinates, the grid and the scale.
+    The coordinates are shifted to start at 0 and scaled before rounding: integer coordinates keep their scale,
+    unless the larger side of the bounding box exceeds ``max_grid``, fractional coordinates are scaled to a
+    larger side of ``max_grid`` (``FRACTIONAL_GRID`` if None), so near points don't collapse.
+    '''
+    coords = coords - np.min(coords, axis=0)
+
+    scale = 1.0
+    extent = float(np.max(coords))
+    if extent > 0:
+        if not np.all(coords == np.rint(coords)):
+            scale = (max_grid or FRACTIONAL_GRID) / extent
+        elif max_grid is not None and extent > max_grid:
+            scale = max_grid / extent
+
+    coords = np.rint(coords * scale).astype(np.int64)
+    grid = [int(elem) for elem in np.max(coords, axis=0)]
+    return coords, grid, scale
+
+
+def import_tsplib(path, cache_dir=None, max_vehicles=64, max_grid=None):
+    '''
+    Converts a TSPLIB/CVRPLIB file to a dataset directory with one instance and returns its path.
+    The nodes are reordered (depots first), coordinates are snapped to the integer grid (see ``snap_to_grid``) and the
+    grid is the bounding box of the coordinates. The capacity of CVRP instances is used as cargo capacity of all vehicles.
+
+    Args:
+        path (string): TSPLIB/CVRPLIB file
+        cache_dir (string): Directory of the cached datasets, next to the file if None
+        max_vehicles (int): Maximum number of vehicles of the envs using the instance, all start at the first depot
+        max_grid (int): Maximum grid size, larger instances are scaled down (see ``snap_to_grid``)
+    '''
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), '.tsplib_cache')
+    dataset_path = cache_path_of(path, cache_dir, max_grid)
+
+    if os.path.exists(os.path.join(dataset_path, 'meta.json')):
+        return dataset_path
+
+    instance = parse_tsplib(path)
+
+    depots = instance['depots']
+    customers = [i for i in range(instance['dimension']) if i not in set(depots)]
+    order = depots + customers
+
+    coords, grid, scale = snap_to_grid(instance['coords'][order], max_grid)
+
+    items = instance['demands'][order]
+    # Depots use the depot parameter of the env:
+    items[:len(depots)] = np.nan
+
+    v_max_cargo = None
+    if instance['capacity'] is not None:
+        v_max_cargo = np.full((1, max_vehicles), instance['capacity'])
+
+    # Keep name, type and the scale of the coordinates (tour length / scale is the TSPLIB length) with the meta data:
+    write_dataset(
+        dataset_path, coords[None], items[None], np.zeros((1, max_vehicles), dtype=np.int64), len(depots), grid, v_max_cargo,
+        extra_meta={'name': instance['name'], 'type': instance['type'], 'capacity': instance['capacity'], 'scale': scale},
+    )
+
+    return dataset_path
@@ -4,7 +4,7 @@
 import numpy as np
 
 from main.simulation.restrictions import RestrValueObject, is_None, is_not_None, none_add, none_subtract
-from main.simulation.common_sim_func import param_interpret, random_coordinates
+from main.simulation.common_sim_func import param_interpret, random_coordinates, max_param_val
 
 
 ''' VEHICLE PARAMETER 
@@ -159,7 +159,7 @@ class BaseVehicleClass:
         self.travel_type = v_params['travel_type']
         self.cargo_type = v_params['cargo_type']
         self.v_loadable = v_params['loadable']
-        self.v_weight = param_interpret(v_params['weight'])
+        self.v_weight = param_interpret(v_params['weight'], self.temp_db.rng)
 
         # Create items as restricted value:
         if v_params['range_type'] == 'simple':
@@ -210,6 +210,14 @@ class BaseVehicleClass:
 
 
     def take_action(self, calc_time=False):
+
+        if self.temp_db.profiler is not None:
+            stage = 'action/' + self.temp_db.actions_list[self.v_index][0][0] if len(self.temp_db.actions_list[self.v_index]) > 0 else 'action/idle'
+            self.temp_db.profiler.time_action(stage, self.run_action, calc_time)
+        else:
+            self.run_action(calc_time)
+
+    def run_action(self, calc_time=False):
         
         if len(self.temp_db.actions_list[self.v_index]) > 0:
             
@@ -237,6 +245,7 @@ class BaseVehicleClass:
 
         if np.round(np.array([distance]), 3) == 0:
             self.temp_db.status_dict['v_coord'][self.v_index] = self.temp_db.status_dict['v_dest'][self.v_index]
+            self.temp_db.mark_dirty('vehicle', self.v_index)
             self.temp_db.actions_list[self.v_index].pop(0)
             self.take_action(calc_time=True)
             return
@@ -259,6 +268,8 @@ class BaseVehicleClass:
                 for i in self.temp_db.v_transporting_v[self.v_index]:
                     self.temp_db.status_dict['v_coord'][i] = self.temp_db.status_dict['v_coord'][self.v_index]
 
+                self.temp_db.mark_dirty('vehicle', [self.v_index] + self.temp_db.v_transporting_v[self.v_index])
+
             if np.round(real_distance - distance, 3) == 0:
                 self.temp_db.actions_list[self.v_index].pop(0)
                 self.take_action(calc_time=True)
@@ -269,6 +280,7 @@ class BaseVehicleClass:
                             distance - real_distance)
                 if real_distance == 0:
                     self.temp_db.status_dict['v_stuck'][self.v_index] = 1
+                    self.temp_db.mark_dirty('vehicle', self.v_index)
 
             else:
                 self.temp_db.time_till_fin[self.v_index] = np.nanmax(
@@ -344,6 +356,7 @@ class BaseVehicleClass:
                 self.temp_db.v_transporting_v[self.v_index].append(v_j)
                 self.temp_db.status_dict['v_free'][v_j] = 0
                 self.temp_db.status_dict['v_to_n'][v_j] = None
+                self.temp_db.mark_dirty('vehicle', v_j)
 
                 
                 self.temp_db.actions_list[self.v_index].pop(0)
@@ -414,6 +427,7 @@ class BaseVehicleClass:
                 
                 self.temp_db.v_transporting_v[self.v_index].pop(self.temp_db.v_transporting_v[self.v_index].index(v_j))
                 self.temp_db.status_dict['v_free'][v_j] = 1
+                self.temp_db.mark_dirty('vehicle', v_j)
                 
                 self.temp_db.actions_list[self.v_index].pop(0)
                 self.take_action(calc_time=True)
@@ -457,6 +471,7 @@ class BaseVehicleClass:
 
         if item_amount == 0:
             self.temp_db.status_dict['n_waiting'][n_j] = 0
+            self.temp_db.mark_dirty('node', n_j)
             
             self.temp_db.actions_list[self.v_index].pop(0)
             self.take_action(calc_time=True)
@@ -481,6 +496,7 @@ class BaseVehicleClass:
                 items_j.round_cur_value()
 
                 self.temp_db.status_dict['n_waiting'][n_j] = 0
+                self.temp_db.mark_dirty('node', n_j)
                 
                 self.temp_db.actions_list[self.v_index].pop(0)
                 self.take_action(calc_time=True)
@@ -565,13 +581,33 @@ class BaseVehicleClass:
 
 class BaseVehicleCreator:
 
-    def __init__(self, v_params_list, temp_db, VehicleClass=BaseVehicleClass):
+    def __init__(self, v_params_list, temp_db, VehicleClass=BaseVehicleClass, dataset=None):
 
         self.temp_db = temp_db
         self.v_params_list = v_params_list
 
+        # Reads start depots and cargo capacities from an InstanceDataset (instance chosen by the node creator):
+        self.dataset = dataset
+
         self.temp_db.num_vehicles = sum([np.max(v_params['num']) for v_params in v_params_list])
 
+        # Maximum values of the action outputs (amounts without cargo limit use 1):
+        max_cargo = [max_param_val(v_params['max_cargo']) for v_params in v_params_list if v_params['max_cargo'] is not None]
+        max_v_cap = [max_param_val(v_params['max_v_cap']) for v_params in v_params_list if v_params['max_v_cap'] is not None]
+
+        # Capacities of the dataset replace the parameter, so the normalization has to cover all instances:
+        if self.dataset is not None and self.dataset.max_cargo is not None:
+            max_cargo.append(self.dataset.max_cargo)
+            for name in ['v_items', 'v_cargo', 'max_v_items', 'max_v_cargo']:
+                self.temp_db.add_min_max_bound(name, [0, self.dataset.max_cargo])
+
+        self.temp_db.outputs_max = {
+            'load': int(np.ceil(max(max_cargo, default=1))),
+            'unload': int(np.ceil(max(max_cargo, default=1))),
+            'v_load': int(self.temp_db.num_vehicles),
+            'v_unload': int(max(max_v_cap, default=0)),
+        }
+
         self.VehicleClass = VehicleClass
 
     def create(self):
@@ -579,10 +615,23 @@ class BaseVehicleCreator:
         v_index = 0
         v_type = 0
 
+        instance = None
+        if self.dataset is not None:
+            instance = self.dataset[self.temp_db.instance_index]
+
         for v_params in self.v_params_list:
-            for i in range(param_interpret(v_params['num'])):
-                vehicle = self.VehicleClass(self.temp_db, v_index, v_type, v_params)
-                self.temp_db.add_vehicle(vehicle, v_index, v_type)
+            for i in range(param_interpret(v_params['num'], self.temp_db.rng)):
+
+                coord = None
+                vehicle_params = v_params
+                if instance is not None:
+                    d_index = self.temp_db.d_indices[int(instance['v_depot'][v_index])]
+                    coord = np.copy(self.temp_db.status_dict['n_coord'][d_index])
+                    if 'v_max_cargo' in instance and not np.isnan(instance['v_max_cargo'][v_index]):
+                        vehicle_params = dict(v_params, max_cargo=float(instance['v_max_cargo'][v_index]))
+
+                vehicle = self.VehicleClass(self.temp_db, v_index, v_type, vehicle_params)
+                self.temp_db.add_vehicle(vehicle, v_index, v_type, coord)
                 v_index +=1
             self.temp_db.vehicle_visuals.append([v_params['symbol'], v_params['color']])
             v_type += 1
@@ -1,26 +1,32 @@
 """
 
 """
+import os
 import sys
 import numpy as np
 import pygame
 from pygame import Surface
 
 
-
 class BaseVisualizer:
 
     def __init__(self, name, visual_params, temp_db):
 
-        # Initialize pygame
-        pygame.init()
-
         # Define parameter:
         self.name      = name
         self.temp_db   = temp_db
         self.grid      = temp_db.grid
+        self.headless  = False
         [setattr(self, k, v) for k, v in visual_params.items()]
 
+        # Without a display SDL needs the dummy video driver,
+        # this has to be set before pygame is initialized:
+        if self.headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+        # Initialize pygame
+        pygame.init()
+
         # Define some colors
         self.color_dict = {
             'white': (255, 255, 255),
@@ -59,6 +65,12 @@ class BaseVisualizer:
         # if the agent uses images as observations (states)
         self.grid_surface = Surface(self.grid_surface_dim, pygame.SRCALPHA)
 
+        # static grid surface:
+        # markers of the nodes don't move during an episode, so they are drawn once after each reset
+        # and copied to the grid surface every step
+        self.static_grid_surface = Surface(self.grid_surface_dim, pygame.SRCALPHA)
+        self.static_valid = False
+
         # init info grid surface:
         # this surface will put the grid coordinates to a marker
         # will also add more information, for example the cargo, stock, demand, if this is defined by the parameters
@@ -84,39 +96,41 @@ class BaseVisualizer:
             ], pygame.SRCALPHA
         )
 
-        # init window
+        # init window (or an off-screen surface of the same size if headless)
         window_width  = self.grid_surface_dim[0] + 2 * self.grid_padding + self.axis_size + 510
         window_height = self.grid_surface_dim[0] + 2 * self.grid_padding + self.info_surface_height + self.axis_size
-        self.screen   = pygame.display.set_mode([window_width, window_height])
+        if self.headless:
+            self.screen = Surface([window_width, window_height])
+        else:
+            self.screen = pygame.display.set_mode([window_width, window_height])
 
         # init fonts:
         self.big_font    = pygame.font.SysFont('Arial', 12*2, bold=True)
         self.medium_font = pygame.font.SysFont('Arial', 10*2, bold=False)
         self.small_font  = pygame.font.SysFont('Arial', 6*2,  bold=False)
 
+        # axis labels only depend on the grid size, render them once:
+        self.init_axis_surface()
+
         # Set title of screen
-        pygame.display.set_caption(self.name)
+        if not self.headless:
+            pygame.display.set_caption(self.name)
 
         # Block all events
         #pygame.event.set_blocked(None)
 
 
-    def reset_surfaces(self):
+    def init_axis_surface(self):
         '''
-        Erases old drawings by filling all surfaces with a fully transparent color.
-        This will be called every step by visualize_step().
+        Renders the axis tick labels to a cached surface, that is copied to the info grid surface every step.
         '''
-        self.grid_surface.fill(self.color_dict['full_transp'])
-        self.grid_info_surface.fill(self.color_dict['full_transp'])
-        self.travel_surface.fill(self.color_dict['full_transp'])
-        self.info_surface.fill(self.color_dict['full_transp'])
-        self.status_surface.fill(self.color_dict['full_transp'])
-        self.screen.fill(self.color_dict['white'])
+        self.axis_surface = Surface(self.grid_info_surface.get_size(), pygame.SRCALPHA)
+        self.axis_surface.fill(self.color_dict['full_transp'])
 
         for i in range(self.grid[0]+1):
             x_coord = self.small_font.render(str(i), True, self.color_dict['black'])
             width = int(round(x_coord.get_width()/2))
-            self.grid_info_surface.blit(x_coord, (
+            self.axis_surface.blit(x_coord, (
                 -width+self.axis_size + int(round(self.marker_size/2)) + int(round(self.marker_size*2)) + i * self.x_mulipl,
                 int(round(self.axis_size/2))+(self.grid[1]+1)*self.x_mulipl
                 )
@@ -125,15 +139,47 @@ class BaseVisualizer:
         for i in range(self.grid[1]+1):
             y_coord = self.small_font.render(str(self.grid[0]-i), True, self.color_dict['black'])
             height = int(round(y_coord.get_width()/2))
-            self.grid_info_surface.blit(y_coord, (
+            self.axis_surface.blit(y_coord, (
                 int(round(self.axis_size/2)),
                 height-int(round(self.marker_size/2)) + int(round(self.marker_size*2)) + i*self.y_mulipl,
                 )
             )
 
+    def reset_static_surfaces(self):
+        '''
+        Marks the static grid surface as outdated, needs to be called after the environment was reset.
+        '''
+        self.static_valid = False
+
+    def draw_static_surfaces(self):
+        '''
+        Draws the node markers to the static grid surface.
+        '''
+        self.static_grid_surface.fill(self.color_dict['full_transp'])
+        self.draw_marker_iter('node', surface=self.static_grid_surface, draw_info=False)
+        self.static_valid = True
+
+    def reset_surfaces(self):
+        '''
+        Erases old drawings by filling all surfaces with a fully transparent color
+        and copies the cached static drawings (node markers, axis labels) back.
+        This will be called every step by visualize_step().
+        '''
+        if not self.static_valid:
+            self.draw_static_surfaces()
+
+        # copying the cached surfaces is cheaper than filling and alpha blitting them:
+        self.grid_surface = self.static_grid_surface.copy()
+        self.grid_info_surface = self.axis_surface.copy()
+
+        self.travel_surface.fill(self.color_dict['full_transp'])
+        self.info_surface.fill(self.color_dict['full_transp'])
+        self.status_surface.fill(self.color_dict['full_transp'])
+        self.screen.fill(self.color_dict['white'])
+
 
 
-    def draw_circle_marker(self, coordinates, add_info=None, color='purple'):
+    def draw_circle_marker(self, coordinates, add_info=None, color='purple', surface=None, draw_info=True):
         '''
         Draws a marker to the grid surface with a circle shape to specific location based on grid coordinates.
         Will also call draw_marker_info(), so additinal information can be drawn to the info grid surface.
@@ -151,13 +197,13 @@ class BaseVisualizer:
         y = surface_coordinates[1]
 
         # draw_circle
-        pygame.draw.circle(self.grid_surface, self.color_dict[color], (x, y), int(round(self.marker_size / 2)))
+        pygame.draw.circle(self.grid_surface if surface is None else surface, self.color_dict[color], (x, y), int(round(self.marker_size / 2)))
 
         # info:
         #self.draw_marker_info(surface_coordinates, coordinates, add_info)
 
 
-    def draw_rect_marker(self, coordinates, add_info=None, color='orange'):
+    def draw_rect_marker(self, coordinates, add_info=None, color='orange', surface=None, draw_info=True):
         '''
         Draws a marker to the grid surface with a rectangle shape to specific location based on grid coordinates.
         Will also call draw_marker_info(), so additinal information can be drawn to the info grid surface.
@@ -176,13 +222,14 @@ class BaseVisualizer:
         y = surface_coordinates[1] - (self.marker_size/2)
 
         # draw rectangle_
-        pygame.draw.rect(self.grid_surface, self.color_dict[color], (x, y, self.marker_size, self.marker_size))
+        pygame.draw.rect(self.grid_surface if surface is None else surface, self.color_dict[color], (x, y, self.marker_size, self.marker_size))
 
         # info:
-        self.draw_marker_info(surface_coordinates, coordinates, add_info)
+        if draw_info:
+            self.draw_marker_info(surface_coordinates, coordinates, add_info)
 
 
-    def draw_triangle_down_marker(self, coordinates, add_info=None, color='light-blue'):
+    def draw_triangle_down_marker(self, coordinates, add_info=None, color='light-blue', surface=None, draw_info=True):
         '''
         Draws a marker to the grid surface with a traingle shape to specific location based on grid coordinates.
         Will also call draw_marker_info(), so additinal information can be drawn to the info grid surface.
@@ -205,12 +252,12 @@ class BaseVisualizer:
         y_x = surface_coordinates[0]
 
         # draw traingle:
-        pygame.draw.polygon(self.grid_surface, self.color_dict[color], ([x_1, x_y], [y_x, y], [x_2, x_y]))
+        pygame.draw.polygon(self.grid_surface if surface is None else surface, self.color_dict[color], ([x_1, x_y], [y_x, y], [x_2, x_y]))
 
         # info:
         #self.draw_marker_info(surface_coordinates, coordinates, add_info)
 
-    def draw_triangle_up_marker(self, coordinates, add_info=None, color='blue'):
+    def draw_triangle_up_marker(self, coordinates, add_info=None, color='blue', surface=None, draw_info=True):
         '''
         Draws a marker to the grid surface with a traingle shape to specific location based on grid coordinates.
         Will also call draw_marker_info(), so additinal information can be drawn to the info grid surface.
@@ -233,7 +280,7 @@ class BaseVisualizer:
         y_x = surface_coordinates[0]
 
         # draw traingle:
-        pygame.draw.polygon(self.grid_surface, self.color_dict[color], ([x_1, x_y], [y_x, y], [x_2, x_y]))
+        pygame.draw.polygon(self.grid_surface if surface is None else surface, self.color_dict[color], ([x_1, x_y], [y_x, y], [x_2, x_y]))
 
         # info:
         #self.draw_marker_info(surface_coordinates, coordinates, add_info)
@@ -332,7 +379,23 @@ class BaseVisualizer:
         i = self.text_draw(i, 'total time ' + str(self.temp_db.total_time))
         i = self.text_draw(i, 'cargo loss ' + str(self.temp_db.signals_dict['cargo_loss']))
 
-    def draw_marker_iter(self, marker_type):
+    def draw_node_info(self):
+        '''
+        Draws the information of the nodes to the info grid surface every step,
+        while their markers are taken from the static grid surface.
+        '''
+        symbols = [elem[0] for elem in self.temp_db.node_visuals]
+        coord = self.temp_db.status_dict['n_coord']
+        items = self.temp_db.status_dict['n_items']
+
+        for i in self.temp_db.c_indices+self.temp_db.d_indices:
+            if symbols[int(self.temp_db.constants_dict['n_type'][i])] == 'rectangle':
+                surface_coordinates = [
+                    coord[i][0]*self.x_mulipl + int(round(self.marker_size*2)),
+                    (self.grid[1] - coord[i][1])*self.y_mulipl + int(round(self.marker_size*2))]
+                self.draw_marker_info(surface_coordinates, coord[i], items[i])
+
+    def draw_marker_iter(self, marker_type, surface=None, draw_info=True):
 
         if marker_type == 'vehicle':
             iter_indices = self.temp_db.v_indices
@@ -356,27 +419,31 @@ class BaseVisualizer:
             type_index = int(types[i])
 
             if symbols[type_index] == 'circle':
-                self.draw_circle_marker(coord[i], items[i], color=colors[type_index])
+                self.draw_circle_marker(coord[i], items[i], color=colors[type_index], surface=surface, draw_info=draw_info)
 
             elif symbols[type_index] == 'triangle-up':
-                self.draw_triangle_up_marker(coord[i], items[i], color=colors[type_index])
+                self.draw_triangle_up_marker(coord[i], items[i], color=colors[type_index], surface=surface, draw_info=draw_info)
 
             elif symbols[type_index] == 'triangle-down':
-                self.draw_triangle_down_marker(coord[i], items[i], color=colors[type_index])
+                self.draw_triangle_down_marker(coord[i], items[i], color=colors[type_index], surface=surface, draw_info=draw_info)
 
             elif symbols[type_index] == 'rectangle':
-                self.draw_rect_marker(coord[i], items[i], color=colors[type_index])
+                self.draw_rect_marker(coord[i], items[i], color=colors[type_index], surface=surface, draw_info=draw_info)
 
             else:
                 raise Exception(
                     "'symbol' was {}, but needs to be 'circle', 'triangle-up', 'triangle-down', 'rectangle'"
                 )
 
-    def visualize_step(self, episode, step):
-
+    def visualize_step(self, episode, step, mode='human'):
+        '''
+        Draws the current state. With mode='human' the frame is shown in the window,
+        with mode='rgb_array' the frame is returned as array of shape (height, width, 3)
+        without touching the window or the event queue, so it never blocks.
+        '''
         self.reset_surfaces()
 
-        self.draw_marker_iter('node')
+        self.draw_node_info()
         self.draw_marker_iter('vehicle')
 
         [self.draw_distance_traveled(episode, step, coordinates_list) for coordinates_list in self.temp_db.past_coord_not_transportable_v]
@@ -395,6 +462,12 @@ class BaseVisualizer:
         
         self.screen.blit(self.status_surface,(self.grid_padding+self.axis_size+self.grid_surface_dim[0], self.grid_padding))
 
+        if mode == 'rgb_array':
+            return self.convert_screen_to_array()
+
+        if self.headless:
+            return
+
         pygame.display.flip()
 
         if self.temp_db.debug_mode == True:
@@ -424,5 +497,8 @@ class BaseVisualizer:
     def convert_to_img_array(self):
         return pygame.surfarray.array3d(self.grid_surface)
 
+    def convert_screen_to_array(self):
+        return pygame.surfarray.array3d(self.screen).transpose([1, 0, 2])
+
     def close(self):
         pygame.quit()
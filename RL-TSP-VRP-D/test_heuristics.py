@@ -0,0 +1,37 @@
+import time
+import numpy as np
+
+from main.simulation.heuristics import neighbour_lists, two_opt, or_opt, route_length
+
+
+def duplicate_coords(num_points=400, seed=0):
+    # Integer grid like the env, so many points share their coordinates:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 10, size=(num_points, 2)).astype(float)
+
+
+def test_neighbour_lists_exclude_self():
+    coords = duplicate_coords()
+    neighbours = neighbour_lists(coords, k=8)
+    assert neighbours.shape == (len(coords), 8)
+    assert not np.any(neighbours == np.arange(len(coords))[:, None])
+
+
+def test_two_opt_terminates_on_duplicates():
+    coords = duplicate_coords()
+    depot = np.array([5.0, 5.0])
+    route = list(range(len(coords)))
+
+    start = time.perf_counter()
+    improved = two_opt(route, depot, coords, deadline=None)
+    assert time.perf_counter() - start < 30
+    assert sorted(improved) == route
+    assert route_length(improved, depot, coords) <= route_length(route, depot, coords)
+
+    improved = or_opt(improved, depot, coords, deadline=None)
+    assert sorted(improved) == route
+
+
+if __name__ == '__main__':
+    test_neighbour_lists_exclude_self()
+    test_two_opt_terminates_on_duplicates()